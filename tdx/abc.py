@@ -1,9 +1,15 @@
-from abc import ABC
+import aiohttp
+from abc import ABC, abstractmethod
 from typing import Dict, Union
 from discord.emoji import Emoji
 from redbot.core import Config
 from redbot.core.bot import Red
-from trainerdex.client import Client
+
+from .autorole import AutoRoleJob
+from .cache import LeaderboardCache, SettingsCache, TrainerCache
+from .client import CircuitBreaker, Client, TokenBucket
+from .ocr import OCRCache, OCRPool, OCRQueue, OCRResult
+from .prefilter import Prefilter
 
 
 class MixinMeta(ABC):
@@ -17,4 +23,18 @@ class MixinMeta(ABC):
         self.bot: Red
         self.config: Config
         self.client: Client
+        self.session: aiohttp.ClientSession
+        self.api_limiter: TokenBucket
+        self.api_breaker: CircuitBreaker
+        self.settings: SettingsCache
+        self.autorole_jobs: Dict[int, AutoRoleJob]
+        self.leaderboard_cache: LeaderboardCache
+        self.trainer_cache: TrainerCache
+        self.ocr_pool: OCRPool
+        self.ocr_queue: OCRQueue
+        self.ocr_cache: OCRCache
+        self.prefilter: Prefilter
         self.emoji: Dict[str, Union[str, Emoji]]
+
+    @abstractmethod
+    async def recognise(self, image: bytes) -> OCRResult: ...
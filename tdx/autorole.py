@@ -0,0 +1,430 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from discord.errors import Forbidden, HTTPException
+from discord.guild import Guild
+from discord.member import Member
+from discord.role import Role
+from pathlib import Path
+from trainerdex.exceptions import NotFound
+from trainerdex.socialconnection import SocialConnection
+from trainerdex.trainer import Trainer
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Final,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Union,
+)
+
+from .cache import LeaderboardSnapshot, TrainerCache
+from .client import CircuitOpen, Client
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+CONCURRENCY: Final[int] = 8
+CHECKPOINT_INTERVAL: Final[float] = 10.0
+# Discord IDs looked up per social connection request
+BATCH_SIZE: Final[int] = 50
+
+
+def members_to_check(
+    guild: Guild, add_roles: Iterable[Role], del_roles: Iterable[Role]
+) -> List[Member]:
+    """Members missing any of ``add_roles`` or holding any of ``del_roles``, ordered by ID"""
+    members: Set[Member] = {member for member in guild.members if not member.bot}
+    candidates: Set[Member] = set()
+    for role in add_roles:
+        candidates |= members - set(role.members)
+    for role in del_roles:
+        candidates |= members & set(role.members)
+    return sorted(candidates, key=lambda member: member.id)
+
+
+@dataclass
+class PlannedChange:
+    """What auto-role would do to one member"""
+
+    member: Member
+    trainer: Optional[Trainer]
+    add: List[Role] = field(default_factory=list)
+    remove: List[Role] = field(default_factory=list)
+    nick: Optional[str] = None
+
+    @property
+    def status(self) -> str:
+        if self.trainer is None:
+            return "not_found"
+        if not self.trainer.is_verified:
+            return "unverified"
+        if self.add or self.remove or self.nick is not None:
+            return "edit"
+        return "unchanged"
+
+    @property
+    def changes(self) -> Dict[str, Any]:
+        """Keyword arguments for :meth:`discord.Member.edit`"""
+        changes: Dict[str, Any] = {}
+        if self.add or self.remove:
+            changes["roles"] = sorted(
+                (set(self.member.roles[1:]) | set(self.add)) - set(self.remove)
+            )
+        if self.nick is not None:
+            changes["nick"] = self.nick
+        return changes
+
+
+def plan_member(
+    member: Member,
+    trainer: Optional[Trainer],
+    add_roles: Iterable[Role],
+    del_roles: Iterable[Role],
+    team_roles: List[Optional[Role]],
+    set_nickname: bool,
+) -> PlannedChange:
+    """Work out the roles and nickname ``member`` should have, leaving out ``@everyone``"""
+    if trainer is None or not trainer.is_verified:
+        return PlannedChange(member, trainer)
+    current: Set[Role] = set(member.roles[1:])
+    roles: Set[Role] = current | set(add_roles)
+    if trainer.faction > 0 and team_roles[trainer.faction] is not None:
+        roles.add(team_roles[trainer.faction])
+    roles -= set(del_roles)
+    return PlannedChange(
+        member,
+        trainer,
+        add=sorted(roles - current),
+        remove=sorted(current - roles),
+        nick=trainer.nickname if set_nickname and member.nick != trainer.nickname else None,
+    )
+
+
+async def resolve_trainers(
+    client: Client,
+    members: Iterable[Member],
+    cache: Optional[TrainerCache] = None,
+    leaderboard: Optional[LeaderboardSnapshot] = None,
+    concurrency: int = CONCURRENCY,
+) -> Dict[int, Trainer]:
+    """Look up the trainers for ``members`` in bulk, keyed by Discord ID.
+
+    Cached trainers are used where there are any. The rest are found with one social connection
+    lookup per :data:`BATCH_SIZE` members. Those on ``leaderboard`` are read from its entries,
+    which only list verified trainers and carry their nickname and team. The others are fetched one
+    by one, with no more than ``concurrency`` requests at a time. Their updates aren't fetched, and
+    a trainer who can't be found is left out.
+
+    Raises
+    ------
+    CircuitOpen
+        TrainerDex isn't responding, so the lookup was given up.
+    """
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+    trainers: Dict[int, Trainer] = {}
+    uncached: List[Member] = []
+    for member in members:
+        cached: Optional[Trainer] = cache.get_by_discord(member.id) if cache else None
+        if cached:
+            trainers[member.id] = cached
+        else:
+            uncached.append(member)
+
+    async def connect(batch: List[Member]) -> List[SocialConnection]:
+        async with semaphore:
+            return await client.get_social_connections(
+                "discord", [str(member.id) for member in batch]
+            )
+
+    async def fetch(trainer_id: int) -> Optional[Trainer]:
+        async with semaphore:
+            try:
+                data: Dict = await client.http.get_trainer(trainer_id)
+            except NotFound:
+                return None
+        return Trainer(conn=client.http, data=data)
+
+    connections: List[Union[List[SocialConnection], BaseException]] = await asyncio.gather(
+        *(connect(uncached[i : i + BATCH_SIZE]) for i in range(0, len(uncached), BATCH_SIZE)),
+        return_exceptions=True,
+    )
+    _raise_first(connections)
+    trainer_ids: Dict[int, int] = {
+        int(connection.uid): connection._trainer_id
+        for batch in connections
+        for connection in batch
+    }
+
+    by_id: Dict[int, Trainer] = {}
+    to_fetch: Set[int] = set()
+    for trainer_id in set(trainer_ids.values()):
+        row: Optional[int] = leaderboard.row_of(trainer_id) if leaderboard else None
+        entry: Optional[Dict] = leaderboard.entries[row] if row is not None else None
+        if entry is not None and entry.get("user_id") is not None:
+            by_id[trainer_id] = _trainer_from_entry(client, entry)
+        else:
+            to_fetch.add(trainer_id)
+
+    fetched: List[Union[Optional[Trainer], BaseException]] = await asyncio.gather(
+        *(fetch(trainer_id) for trainer_id in to_fetch),
+        return_exceptions=True,
+    )
+    _raise_first(fetched)
+    by_id.update((trainer.old_id, trainer) for trainer in fetched if trainer is not None)
+
+    for discord_id, trainer_id in trainer_ids.items():
+        if trainer_id in by_id:
+            trainers[discord_id] = by_id[trainer_id]
+    return trainers
+
+
+def _trainer_from_entry(client: Client, entry: Dict[str, Any]) -> Trainer:
+    """A trainer with the fields a leaderboard entry has, enough for :func:`plan_member`"""
+    return Trainer(
+        conn=client.http,
+        data={
+            "id": entry["id"],
+            "owner": entry["user_id"],
+            "username": entry.get("username"),
+            "faction": (entry.get("faction") or {}).get("id", 0),
+            "verified": True,
+        },
+    )
+
+
+def _raise_first(results: Iterable[Any]) -> None:
+    """Raise the first error in ``results``, preferring :class:`CircuitOpen`"""
+    errors: List[BaseException] = [
+        result for result in results if isinstance(result, BaseException)
+    ]
+    for error in errors:
+        if isinstance(error, CircuitOpen):
+            raise error
+    if errors:
+        raise errors[0]
+
+
+def plan_to_csv(plan: Iterable[PlannedChange]) -> str:
+    output: io.StringIO = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(
+        ["member_id", "member", "trainer", "status", "add_roles", "remove_roles", "nick"]
+    )
+    for change in plan:
+        writer.writerow(
+            [
+                change.member.id,
+                str(change.member),
+                change.trainer.nickname if change.trainer else "",
+                change.status,
+                ";".join(role.name for role in change.add),
+                ";".join(role.name for role in change.remove),
+                change.nick or "",
+            ]
+        )
+    return output.getvalue()
+
+
+@dataclass
+class Checkpoint:
+    """What an auto-role job has done so far, saved so it can pick up where it left off"""
+
+    guild_id: int
+    checked: List[int] = field(default_factory=list)
+    approved: int = 0
+    edited: int = 0
+    not_found: int = 0
+    unverified: int = 0
+    failed: int = 0
+
+    @classmethod
+    def read(cls, path: Path, guild_id: int) -> "Checkpoint":
+        try:
+            with path.open(encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError):
+            logger.warning("Couldn't read auto-role checkpoint %s", path.name, exc_info=True)
+        return cls(guild_id=guild_id)
+
+    @staticmethod
+    def write(path: Path, data: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp: Path = path.with_suffix(".tmp")
+        with temp.open("w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp, path)
+
+
+class AutoRoleJob:
+    """Brings members' roles and nicknames in line with their TrainerDex profiles.
+
+    Up to ``concurrency`` workers each take :data:`BATCH_SIZE` members at a time, look up their
+    trainers together with ``resolve``, and change each member with a single
+    :meth:`discord.Member.edit`. Members already checked are recorded in a checkpoint at
+    ``path`` every :data:`CHECKPOINT_INTERVAL` seconds, and skipped when a job for the same guild
+    is started again, once :meth:`load` has read it. The checkpoint is removed once every member
+    has been checked.
+    """
+
+    def __init__(
+        self,
+        guild: Guild,
+        members: List[Member],
+        resolve: Callable[[List[Member]], Awaitable[Dict[int, Trainer]]],
+        add_roles: List[Role],
+        del_roles: List[Role],
+        team_roles: List[Optional[Role]],
+        set_nickname: bool,
+        reason: str,
+        path: Path,
+        on_progress: Optional[Callable[["AutoRoleJob"], Awaitable[Any]]] = None,
+        concurrency: int = CONCURRENCY,
+    ) -> None:
+        self.guild: Guild = guild
+        self.resolve: Callable[[List[Member]], Awaitable[Dict[int, Trainer]]] = resolve
+        self.add_roles: List[Role] = add_roles
+        self.del_roles: List[Role] = del_roles
+        self.team_roles: List[Optional[Role]] = team_roles
+        self.set_nickname: bool = set_nickname
+        self.reason: str = reason
+        self.path: Path = path
+        self.on_progress: Optional[Callable[["AutoRoleJob"], Awaitable[Any]]] = on_progress
+        self.concurrency: int = concurrency
+
+        self.checkpoint: Checkpoint = Checkpoint(guild_id=guild.id)
+        self.resumed: int = 0
+        self.members: List[Member] = members
+        self.processed: int = 0
+        self.started_at: float = time.monotonic()
+        self.finished: bool = False
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def total(self) -> int:
+        """Members to check, including those checked before the job was resumed"""
+        return self.resumed + len(self.members)
+
+    @property
+    def done(self) -> int:
+        return self.resumed + self.processed
+
+    @property
+    def rate(self) -> float:
+        """Members checked per second since the job started"""
+        elapsed: float = time.monotonic() - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until every member has been checked, at the current rate"""
+        if self.finished:
+            return 0.0
+        if not self.rate:
+            return None
+        return (len(self.members) - self.processed) / self.rate
+
+    async def load(self) -> None:
+        """Carry on from the checkpoint left by an earlier job for the same guild, if there is one"""
+        self.checkpoint = await asyncio.get_running_loop().run_in_executor(
+            None, Checkpoint.read, self.path, self.guild.id
+        )
+        self.resumed = len(self.checkpoint.checked)
+        checked: Set[int] = set(self.checkpoint.checked)
+        self.members = [member for member in self.members if member.id not in checked]
+
+    def start(self) -> asyncio.Task:
+        self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    async def save(self) -> None:
+        data: str = json.dumps(asdict(self.checkpoint))
+        await asyncio.get_running_loop().run_in_executor(None, Checkpoint.write, self.path, data)
+
+    async def _save_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            await self.save()
+
+    async def run(self) -> None:
+        queue: "asyncio.Queue[Member]" = asyncio.Queue()
+        for member in self.members:
+            queue.put_nowait(member)
+
+        saver: asyncio.Task = asyncio.ensure_future(self._save_periodically())
+        workers: List[asyncio.Task] = [
+            asyncio.ensure_future(self._work(queue))
+            for _ in range(min(self.concurrency, max(len(self.members), 1)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+            self.finished = True
+        finally:
+            saver.cancel()
+            for worker in workers:
+                worker.cancel()
+            if self.finished:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: self.path.unlink() if self.path.exists() else None
+                )
+            else:
+                await self.save()
+            if self.on_progress is not None:
+                await self.on_progress(self)
+
+    async def _work(self, queue: "asyncio.Queue[Member]") -> None:
+        while True:
+            batch: List[Member] = []
+            while len(batch) < BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            if not batch:
+                return
+            try:
+                trainers: Dict[int, Trainer] = await self.resolve(batch)
+            except CircuitOpen as e:
+                # Wait for the API to come back rather than marking everyone as not found
+                for member in batch:
+                    queue.put_nowait(member)
+                await asyncio.sleep(e.retry_after)
+                continue
+            for member in batch:
+                await self.reconcile(member, trainers.get(member.id))
+                self.processed += 1
+                if self.on_progress is not None:
+                    await self.on_progress(self)
+
+    async def reconcile(self, member: Member, trainer: Optional[Trainer]) -> None:
+        change: PlannedChange = plan_member(
+            member,
+            trainer,
+            self.add_roles,
+            self.del_roles,
+            self.team_roles,
+            self.set_nickname,
+        )
+        if change.status == "not_found":
+            self.checkpoint.not_found += 1
+        elif change.status == "unverified":
+            self.checkpoint.unverified += 1
+        else:
+            if change.status == "edit":
+                try:
+                    await member.edit(reason=self.reason, **change.changes)
+                except (Forbidden, HTTPException) as e:
+                    # Left out of the checkpoint, so it's tried again next time
+                    logger.warning("Couldn't update %s: %r", member.id, e)
+                    self.checkpoint.failed += 1
+                    return
+                self.checkpoint.edited += 1
+            self.checkpoint.approved += 1
+        self.checkpoint.checked.append(member.id)
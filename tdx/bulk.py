@@ -0,0 +1,129 @@
+import csv
+import io
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from discord.member import Member
+from redbot.core import commands
+from trainerdex.faction import Faction
+from typing import Dict, Final, Iterable, List, Optional, Tuple
+
+from . import converters
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+FIELDS: Final[Tuple[str, ...]] = ("member", "nickname", "team", "total_xp")
+MAX_ROWS: Final[int] = 1000
+MAX_FILE_SIZE: Final[int] = 1024 * 1024
+CONCURRENCY: Final[int] = 5
+
+
+class BulkFileError(ValueError):
+    """Raised when a bulk approval file can't be read at all"""
+
+    pass
+
+
+@dataclass
+class BulkRow:
+    """One member to approve, and what happened when they were"""
+
+    line: int
+    values: Dict[str, str]
+    member: Optional[Member] = None
+    nickname: Optional[str] = None
+    team: Optional[Faction] = None
+    total_xp: Optional[int] = None
+    errors: List[str] = field(default_factory=list)
+    status: str = "pending"
+    trainer: str = ""
+    total_xp_posted: bool = False
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+def read_rows(text: str) -> List[BulkRow]:
+    """Parse a CSV with a header naming at least the columns in :data:`FIELDS`
+
+    Raises
+    ------
+    BulkFileError
+        The file is missing a column, has no rows, or has more than :data:`MAX_ROWS`.
+    """
+    reader: csv.DictReader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None:
+        raise BulkFileError("the file is empty")
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing: List[str] = [name for name in FIELDS if name not in reader.fieldnames]
+    if missing:
+        raise BulkFileError("missing columns: {}".format(", ".join(missing)))
+
+    rows: List[BulkRow] = [
+        BulkRow(
+            line=reader.line_num,
+            values={name: (values.get(name) or "").strip() for name in FIELDS},
+        )
+        for values in reader
+        if any((value or "").strip() for value in values.values() if isinstance(value, str))
+    ]
+    if not rows:
+        raise BulkFileError("the file has no rows")
+    if len(rows) > MAX_ROWS:
+        raise BulkFileError(f"the file has more than {MAX_ROWS} rows")
+    return rows
+
+
+async def validate_rows(ctx: commands.Context, rows: Iterable[BulkRow]) -> None:
+    """Convert each row's values with the same converters as `approve`, noting any errors"""
+    rows = list(rows)
+    for row in rows:
+        for name, converter, attribute in (
+            ("member", commands.MemberConverter, "member"),
+            ("nickname", converters.NicknameConverter, "nickname"),
+            ("team", converters.TeamConverter, "team"),
+            ("total_xp", converters.TotalXPConverter, "total_xp"),
+        ):
+            value: str = row.values[name]
+            if name == "total_xp":
+                # Spreadsheets like to add thousands separators
+                value = value.replace(",", "").replace(" ", "")
+            try:
+                setattr(row, attribute, await converter().convert(ctx, value))
+            except commands.BadArgument as e:
+                row.errors.append(f"{name}: {e}")
+
+    members: Counter = Counter(row.member.id for row in rows if row.member)
+    nicknames: Counter = Counter(row.nickname.lower() for row in rows if row.nickname)
+    for row in rows:
+        if row.member and members[row.member.id] > 1:
+            row.errors.append("member: listed more than once")
+        if row.member and row.member.bot:
+            row.errors.append("member: is a bot")
+        if row.nickname and nicknames[row.nickname.lower()] > 1:
+            row.errors.append("nickname: listed more than once")
+    for row in rows:
+        if row.errors:
+            row.status = "invalid"
+
+
+def rows_to_csv(rows: Iterable[BulkRow]) -> str:
+    output: io.StringIO = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(
+        ["line", *FIELDS, "member_id", "status", "trainer", "total_xp_posted", "errors"]
+    )
+    for row in rows:
+        writer.writerow(
+            [
+                row.line,
+                *(row.values[name] for name in FIELDS),
+                row.member.id if row.member else "",
+                row.status,
+                row.trainer,
+                "yes" if row.total_xp_posted else "no",
+                "; ".join(row.errors),
+            ]
+        )
+    return output.getvalue()
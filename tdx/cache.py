@@ -0,0 +1,437 @@
+import asyncio
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from discord.abc import GuildChannel
+from discord.guild import Guild
+from redbot.core import Config
+from trainerdex.leaderboard import BaseLeaderboard, LeaderboardEntry
+from trainerdex.trainer import Trainer
+
+from .client import CircuitOpen, Client
+from .columns import LeaderboardColumns
+from .streaming import LeaderboardDownload
+from .datatypes import ChannelConfig, GlobalConfig, GuildConfig
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Maps the stat names used when posting an update to the names used by the leaderboards
+LEADERBOARD_STATS: Dict[str, str] = {
+    "travel_km": "badge_travel_km",
+    "capture_total": "badge_capture_total",
+    "pokestops_visited": "badge_pokestops_visited",
+    "total_xp": "total_xp",
+    "gymbadges_gold": "gymbadges_gold",
+}
+
+
+class TTLCache(Generic[K, V]):
+    """A least-recently-used mapping whose entries expire after ``ttl`` seconds.
+
+    Each value has a weight, given by ``weigher``, and the least recently used entries are evicted
+    whenever the total weight goes over ``max_size``. Expired entries are kept until they're
+    replaced or evicted, so :meth:`get_stale` can still serve them while their source is down.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_size: int,
+        weigher: Callable[[V], int] = lambda value: 1,
+    ) -> None:
+        self.ttl: float = ttl
+        self.max_size: int = max_size
+        self.weigher: Callable[[V], int] = weigher
+        self._data: "OrderedDict[K, Tuple[float, int, V]]" = OrderedDict()
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.stale_hits: int = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data and not self._expired(self._data[key][0])
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at > self.ttl
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        try:
+            stored_at, weight, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if self._expired(stored_at):
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_stale(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Like :meth:`get`, but also returns expired entries"""
+        try:
+            stored_at, weight, value = self._data[key]
+        except KeyError:
+            return default
+        self.stale_hits += 1
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self.pop(key)
+        weight: int = self.weigher(value)
+        self._data[key] = (time.monotonic(), weight, value)
+        self.size += weight
+        self.shrink()
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        try:
+            stored_at, weight, value = self._data.pop(key)
+        except KeyError:
+            return default
+        self.size -= weight
+        return value
+
+    def shrink(self) -> None:
+        """Evict least recently used entries until the cache fits inside ``max_size``"""
+        while self._data and self.size > self.max_size:
+            key, (stored_at, weight, value) = self._data.popitem(last=False)
+            self.size -= weight
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.size = 0
+
+    def items(self, include_expired: bool = False) -> Iterator[Tuple[K, V]]:
+        """Iterate over the live entries without touching their recency or the hit counters.
+
+        Expired entries, which :meth:`get_stale` can still return, are included if
+        ``include_expired`` is set.
+        """
+        for key, (stored_at, weight, value) in list(self._data.items()):
+            if include_expired or not self._expired(stored_at):
+                yield key, value
+
+    @property
+    def hit_rate(self) -> float:
+        total: int = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LeaderboardSnapshot:
+    """A downloaded leaderboard, indexed by trainer ID and split into :attr:`columns` when it is
+    created.
+
+    The snapshot itself is never filtered, so it can be shared between callers. Filter the columns
+    with a mask, or use :meth:`to_leaderboard` to get a copy that is safe to filter or iterate.
+    ``previous`` holds the columns of the snapshot this one replaced, if there was one.
+    """
+
+    def __init__(
+        self, leaderboard: BaseLeaderboard, previous: Optional[LeaderboardColumns] = None
+    ) -> None:
+        self.leaderboard: BaseLeaderboard = leaderboard
+        self.previous: Optional[LeaderboardColumns] = previous
+        self.entries: List[Dict] = leaderboard._entries
+        self._index: Dict[int, Tuple[int, int]] = {
+            entry.get("id"): (entry.get("position"), i) for i, entry in enumerate(self.entries)
+        }
+        self.columns: LeaderboardColumns = LeaderboardColumns.from_entries(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.leaderboard)
+
+    def __contains__(self, trainer_id: int) -> bool:
+        return trainer_id in self._index
+
+    def row_of(self, trainer_id: int) -> Optional[int]:
+        """The index of the trainer's entry in :attr:`entries` and :attr:`columns`"""
+        try:
+            return self._index[trainer_id][1]
+        except KeyError:
+            return None
+
+    def position_of(self, trainer_id: int) -> Optional[int]:
+        try:
+            return self._index[trainer_id][0]
+        except KeyError:
+            return None
+
+    def find_trainer(self, trainer_id: int) -> Optional[LeaderboardEntry]:
+        try:
+            position, i = self._index[trainer_id]
+        except KeyError:
+            return None
+        return LeaderboardEntry(conn=self.leaderboard.http, data=self.entries[i])
+
+    def to_leaderboard(self) -> BaseLeaderboard:
+        duplicate: BaseLeaderboard = copy.copy(self.leaderboard)
+        duplicate.i = 0
+        duplicate._entries = list(self.entries)
+        return duplicate
+
+
+class LeaderboardCache:
+    """Shared snapshots of downloaded leaderboards, keyed by ``(stat, guild_id)``.
+
+    Global leaderboards are stored with a ``guild_id`` of ``None``. While the API's circuit breaker
+    is open, expired snapshots are served rather than failing. The columns of a snapshot that is
+    replaced or invalidated are handed on to the next snapshot for the same key, so it can be
+    compared against.
+    """
+
+    def __init__(self, ttl: float, max_entries: int) -> None:
+        self.snapshots: TTLCache[Tuple[str, Optional[int]], LeaderboardSnapshot] = TTLCache(
+            ttl=ttl,
+            max_size=max_entries,
+            weigher=lambda snapshot: max(len(snapshot.entries), 1),
+        )
+        self.previous: Dict[Tuple[str, Optional[int]], LeaderboardColumns] = {}
+        self.downloads: Dict[Tuple[str, Optional[int]], LeaderboardDownload] = {}
+
+    async def get(
+        self, client: Client, stat: str, guild: Optional[Union[Guild, int]] = None
+    ) -> LeaderboardSnapshot:
+        guild_id: Optional[int] = guild if isinstance(guild, int) or guild is None else guild.id
+        key: Tuple[str, Optional[int]] = (stat, guild_id)
+
+        snapshot: Optional[LeaderboardSnapshot] = self.snapshots.get(key)
+        download: Optional[LeaderboardDownload] = self.downloads.get(key)
+        if snapshot is None and download is not None:
+            # Stored by _downloaded if it succeeds
+            await asyncio.shield(download.task)
+            snapshot = self.snapshots.get(key)
+        if snapshot is None:
+            try:
+                leaderboard: BaseLeaderboard = await client.get_leaderboard(
+                    stat=stat, guild=guild_id
+                )
+            except CircuitOpen:
+                snapshot = self.snapshots.get_stale(key)
+                if snapshot is None:
+                    raise
+                logger.debug("Serving stale leaderboard %s", key)
+            else:
+                snapshot = self._store(key, leaderboard)
+        return snapshot
+
+    def stream(
+        self, client: Client, stat: str, guild: Optional[Union[Guild, int]] = None
+    ) -> Union[LeaderboardSnapshot, LeaderboardDownload]:
+        """The cached snapshot, or else a download which can be read while it's in progress.
+
+        Callers asking for the same leaderboard while it downloads share the download. Once it
+        finishes it's stored as a snapshot, unless an update has been posted in the meantime.
+        """
+        guild_id: Optional[int] = guild if isinstance(guild, int) or guild is None else guild.id
+        key: Tuple[str, Optional[int]] = (stat, guild_id)
+
+        snapshot: Optional[LeaderboardSnapshot] = self.snapshots.get(key)
+        if snapshot is not None:
+            return snapshot
+        download: Optional[LeaderboardDownload] = self.downloads.get(key)
+        if download is None:
+            download = self.downloads[key] = LeaderboardDownload(client, stat, guild_id)
+            download.task.add_done_callback(lambda task: self._downloaded(key, download))
+        return download
+
+    def _downloaded(self, key: Tuple[str, Optional[int]], download: LeaderboardDownload) -> None:
+        if self.downloads.get(key) is download:
+            del self.downloads[key]
+        if download.task.cancelled() or download.error is not None or download.stale:
+            return
+        self._store(key, download.to_leaderboard())
+
+    def _store(
+        self, key: Tuple[str, Optional[int]], leaderboard: BaseLeaderboard
+    ) -> LeaderboardSnapshot:
+        replaced: Optional[LeaderboardSnapshot] = self.snapshots.pop(key)
+        previous: Optional[LeaderboardColumns] = self.previous.pop(key, None)
+        snapshot: LeaderboardSnapshot = LeaderboardSnapshot(
+            leaderboard, previous=replaced.columns if replaced else previous
+        )
+        self.snapshots.set(key, snapshot)
+        return snapshot
+
+    def invalidate(
+        self,
+        trainer_id: int,
+        stats: Mapping[str, Union[int, float, None]],
+        guild: Optional[Union[Guild, int]] = None,
+    ) -> None:
+        """Drop the snapshots which an update to a trainer's ``stats`` would change.
+
+        That is every snapshot for the stats posted which either already has the trainer on it,
+        belongs to the guild the update was posted from, or is a global leaderboard the new value
+        is high enough to get onto. Downloads in progress for the stats posted aren't stored.
+        """
+        guild_id: Optional[int] = guild if isinstance(guild, int) or guild is None else guild.id
+        posted: Dict[str, Union[int, float, None]] = {
+            LEADERBOARD_STATS.get(stat, stat): value for stat, value in stats.items()
+        }
+
+        for key, download in self.downloads.items():
+            if key[0] in posted:
+                download.stale = True
+
+        for key, snapshot in self.snapshots.items():
+            stat, snapshot_guild_id = key
+            if stat not in posted:
+                continue
+
+            if snapshot_guild_id is not None and snapshot_guild_id == guild_id:
+                self._retire(key, snapshot)
+            elif trainer_id in snapshot:
+                self._retire(key, snapshot)
+            elif snapshot_guild_id is None and posted[stat] is not None:
+                values = snapshot.columns.values
+                if not len(values) or float(posted[stat]) >= values.min():
+                    self._retire(key, snapshot)
+
+    def _retire(self, key: Tuple[str, Optional[int]], snapshot: LeaderboardSnapshot) -> None:
+        self.previous[key] = snapshot.columns
+        self.snapshots.pop(key)
+
+
+class TrainerCache:
+    """Resolved trainers, with their updates, keyed by Discord user ID and by lowercased nickname.
+
+    Anything which edits or posts to a trainer must call :meth:`invalidate` afterwards.
+    The ``stale`` lookups also return expired trainers, for when the API is unavailable.
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.trainers: TTLCache[Tuple[str, Union[int, str]], Trainer] = TTLCache(
+            ttl=ttl, max_size=max_size
+        )
+
+    def get_by_discord(self, user_id: int, stale: bool = False) -> Optional[Trainer]:
+        key: Tuple[str, int] = ("discord", user_id)
+        return self.trainers.get_stale(key) if stale else self.trainers.get(key)
+
+    def get_by_nickname(self, nickname: str, stale: bool = False) -> Optional[Trainer]:
+        key: Tuple[str, str] = ("nickname", nickname.lower())
+        return self.trainers.get_stale(key) if stale else self.trainers.get(key)
+
+    def add(self, trainer: Trainer, discord_id: Optional[int] = None) -> None:
+        self.trainers.set(("nickname", trainer.nickname.lower()), trainer)
+        if discord_id is not None:
+            self.trainers.set(("discord", discord_id), trainer)
+
+    def invalidate(self, trainer: Trainer) -> None:
+        # Expired entries too, as they're served during an outage
+        for key, cached in self.trainers.items(include_expired=True):
+            if cached.old_id == trainer.old_id:
+                self.trainers.pop(key)
+
+
+class SettingsCache:
+    """An in-memory copy of the cog's Config, held as the dataclasses in :mod:`.datatypes`
+
+    Reads are synchronous. Writes go through :meth:`set_global`, :meth:`set_guild` and
+    :meth:`set_channel`, which save to Config first and then update the copy. Several keys
+    passed at once are saved in a single write.
+
+    The dataclasses returned are shared, so they must not be modified.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        global_defaults: GlobalConfig,
+        guild_defaults: GuildConfig,
+        channel_defaults: ChannelConfig,
+    ) -> None:
+        self.config: Config = config
+        self._guild_defaults: Dict[str, Any] = guild_defaults.__dict__
+        self._channel_defaults: Dict[str, Any] = channel_defaults.__dict__
+        self.global_config: GlobalConfig = copy.deepcopy(global_defaults)
+        self._guilds: Dict[int, GuildConfig] = {}
+        self._channels: Dict[int, ChannelConfig] = {}
+        # Channels with profile_ocr set, for the message dispatcher
+        self.ocr_channels: Set[int] = set()
+
+    def _guild_config(self, data: Mapping[str, Any]) -> GuildConfig:
+        return GuildConfig(**{**copy.deepcopy(self._guild_defaults), **data})
+
+    def _channel_config(self, data: Mapping[str, Any]) -> ChannelConfig:
+        return ChannelConfig(**{**copy.deepcopy(self._channel_defaults), **data})
+
+    async def load(self) -> None:
+        self.global_config = GlobalConfig(**(await self.config.all()))
+        self._guilds = {
+            guild_id: self._guild_config(data)
+            for guild_id, data in (await self.config.all_guilds()).items()
+        }
+        self._channels = {
+            channel_id: self._channel_config(data)
+            for channel_id, data in (await self.config.all_channels()).items()
+        }
+        self.ocr_channels = {
+            channel_id
+            for channel_id, channel_config in self._channels.items()
+            if channel_config.profile_ocr
+        }
+
+    def guild(self, guild: Guild) -> GuildConfig:
+        guild_config: Optional[GuildConfig] = self._guilds.get(guild.id)
+        if guild_config is None:
+            guild_config = self._guilds[guild.id] = self._guild_config({})
+        return guild_config
+
+    def channel(self, channel: GuildChannel) -> ChannelConfig:
+        channel_config: Optional[ChannelConfig] = self._channels.get(channel.id)
+        if channel_config is None:
+            channel_config = self._channels[channel.id] = self._channel_config({})
+        return channel_config
+
+    @staticmethod
+    async def _save(group: Any, values: Dict[str, Any]) -> None:
+        if len(values) == 1:
+            key, value = next(iter(values.items()))
+            await group.set_raw(key, value=value)
+        else:
+            async with group.all() as data:
+                data.update(values)
+
+    async def set_global(self, **values: Any) -> None:
+        await self._save(self.config, values)
+        self.global_config.__dict__.update(copy.deepcopy(values))
+
+    async def set_guild(self, guild: Guild, **values: Any) -> None:
+        await self._save(self.config.guild(guild), values)
+        self.guild(guild).__dict__.update(copy.deepcopy(values))
+
+    async def set_channel(self, channel: GuildChannel, **values: Any) -> None:
+        await self._save(self.config.channel(channel), values)
+        self.channel(channel).__dict__.update(copy.deepcopy(values))
+        if self.channel(channel).profile_ocr:
+            self.ocr_channels.add(channel.id)
+        else:
+            self.ocr_channels.discard(channel.id)
@@ -0,0 +1,396 @@
+import aiohttp
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Final, FrozenSet, Hashable, List, Optional, Union
+
+from trainerdex import __version__ as trainerdex_version
+from trainerdex.client import Client as BaseClient
+from trainerdex.exceptions import Forbidden, HTTPException, NotFound
+from trainerdex.http import HTTPClient as BaseHTTPClient, Route, json_or_text
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Connections kept open to any one host, such as the TrainerDex API or Discord's CDN
+CONNECTIONS_PER_HOST: Final[int] = 10
+MAX_CONNECTIONS: Final[int] = 50
+DNS_CACHE_TTL: Final[int] = 300
+KEEPALIVE_TIMEOUT: Final[float] = 60.0
+TIMEOUT: Final[aiohttp.ClientTimeout] = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
+
+MAX_RETRIES: Final[int] = 3
+BACKOFF_BASE: Final[float] = 0.5
+BACKOFF_CAP: Final[float] = 8.0
+# A POST or PATCH that failed with any other status, or timed out, may have been applied,
+# so those are only retried for GETs
+RETRY_STATUSES: Final[FrozenSet[int]] = frozenset({429, 500, 502, 503})
+RETRY_STATUSES_GET: Final[FrozenSet[int]] = RETRY_STATUSES | {504}
+
+BREAKER_THRESHOLD: Final[int] = 5
+BREAKER_RESET: Final[float] = 30.0
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Create the connection pool shared by the TrainerDex client and attachment downloads"""
+    connector: aiohttp.TCPConnector = aiohttp.TCPConnector(
+        limit=MAX_CONNECTIONS,
+        limit_per_host=CONNECTIONS_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=TIMEOUT)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling the TrainerDex API while it's failing"""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"TrainerDex API unavailable, retry in {retry_after:.0f}s")
+        self.retry_after: float = retry_after
+
+
+class TokenBucket:
+    """Lets through ``rate`` calls a second on average, in bursts of up to ``burst``.
+
+    Callers wait their turn in the order they arrive. A ``rate`` of 0 turns the limit off.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate: float = rate
+        self.burst: int = burst
+        self.tokens: float = float(burst)
+        self.updated: float = time.monotonic()
+        self.waiting: int = 0
+        self.delayed: int = 0
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now: float = time.monotonic()
+        self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        self.waiting += 1
+        try:
+            async with self._lock:
+                self._refill()
+                if self.tokens < 1:
+                    self.delayed += 1
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                    self._refill()
+                self.tokens -= 1
+        finally:
+            self.waiting -= 1
+
+
+class CircuitBreaker:
+    """Stops calls to a failing service for a while.
+
+    After ``threshold`` failures in a row the breaker opens and :meth:`check` raises
+    :class:`CircuitOpen`. Once ``reset_timeout`` seconds have passed it lets a single call through;
+    if that succeeds the breaker closes again, otherwise it stays open for another ``reset_timeout``.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        self.threshold: int = threshold
+        self.reset_timeout: float = reset_timeout
+        self.failures: int = 0
+        self.opened_at: Optional[float] = None
+        self.probing: bool = False
+        self.trips: int = 0
+        self.rejected: int = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    @property
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+    def check(self) -> None:
+        state: str = self.state
+        if state == "open" or (state == "half-open" and self.probing):
+            self.rejected += 1
+            raise CircuitOpen(self.retry_after or self.reset_timeout)
+        if state == "half-open":
+            self.probing = True
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("TrainerDex API recovered, closing circuit breaker")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+            logger.warning(
+                "TrainerDex API failed %s times in a row, opening circuit breaker for %ss",
+                self.failures,
+                self.reset_timeout,
+            )
+            self.opened_at = time.monotonic()
+            self.trips += 1
+        self.probing = False
+
+
+class _Retry(Exception):
+    def __init__(self, delay: Optional[float] = None) -> None:
+        self.delay: Optional[float] = delay
+
+
+class HTTPClient(BaseHTTPClient):
+    """Sends requests to the TrainerDex API through a shared session, politely.
+
+    - Concurrent GETs for the same resource share one request. Requests are only coalesced while
+      they're in flight; once one completes, the next caller sends a new request.
+    - Every request waits for ``limiter``, and 429s, 5xxs and dropped connections are retried with
+      jittered exponential backoff.
+    - Repeated failures open ``breaker``, and while it's open requests fail fast with
+      :class:`CircuitOpen` instead of waiting on the API.
+
+    Unlike the base class, the session is passed in rather than created, so it can be shared and
+    closed by its owner.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        token: str = None,
+        loop: asyncio.AbstractEventLoop = None,
+        limiter: Optional[TokenBucket] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.loop: asyncio.AbstractEventLoop = asyncio.get_event_loop() if loop is None else loop
+        self.session: aiohttp.ClientSession = session
+        self.token: str = token
+        self.user_agent: str = (
+            "TrainerDex.py (https://github.com/TrainerDex/TrainerDex.py {0}) "
+            "Python/{1[0]}.{1[1]} "
+            "aiohttp/{2}"
+        ).format(trainerdex_version, sys.version_info, aiohttp.__version__)
+        self.limiter: TokenBucket = limiter or TokenBucket(rate=0, burst=1)
+        self.breaker: CircuitBreaker = breaker or CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET)
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.requests: int = 0
+        self.coalesced: int = 0
+        self.retries: int = 0
+
+    @staticmethod
+    def _key(route: Route, params: Dict[str, Any]) -> Hashable:
+        return route.url, tuple(sorted((k, str(v)) for k, v in params.items()))
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self.in_flight.get(key) is future:
+            del self.in_flight[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not future.cancelled():
+            future.exception()
+
+    async def request(self, route: Route, **kwargs) -> Union[Dict, List, str]:
+        if route.method != "GET":
+            return await self._request(route, **kwargs)
+
+        key: Hashable = self._key(route, kwargs.get("params") or {})
+        future: asyncio.Future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._request(route, **kwargs))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        else:
+            self.coalesced += 1
+            logger.debug("Joining in-flight request: %s %s", route.method, route.url)
+        # A caller giving up shouldn't cancel the request for everyone else waiting on it
+        return await asyncio.shield(future)
+
+    async def _send(self, route: Route, **kwargs) -> Union[Dict, List, str]:
+        retry_statuses: FrozenSet[int] = (
+            RETRY_STATUSES_GET if route.method == "GET" else RETRY_STATUSES
+        )
+        try:
+            async with self.session.request(route.method, route.url, **kwargs) as r:
+                logger.info(
+                    "%s %s with %s has returned %s",
+                    route.method,
+                    route.url,
+                    kwargs.get("data"),
+                    r.status,
+                )
+                data: Union[Dict, List, str] = await json_or_text(r)
+
+                if 300 > r.status >= 200:
+                    logger.debug("%s %s has received %s", route.method, route.url, data)
+                    return data
+
+                self._raise_for_status(r, data, retry_statuses)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if route.method != "GET":
+                raise
+            raise _Retry() from e
+
+    @staticmethod
+    def _raise_for_status(
+        r: aiohttp.ClientResponse, data: Union[Dict, List, str], retry_statuses: FrozenSet[int]
+    ) -> None:
+        if r.status in retry_statuses:
+            retry_after: Optional[str] = r.headers.get("Retry-After")
+            raise _Retry(
+                min(float(retry_after), BACKOFF_CAP)
+                if retry_after and retry_after.isdigit()
+                else None
+            ) from HTTPException(r, data)
+        if r.status in {401, 403, 423}:
+            raise Forbidden(r, data)
+        elif r.status == 404:
+            raise NotFound(r, data)
+        else:
+            raise HTTPException(r, data)
+
+    def _headers(self) -> Dict[str, str]:
+        headers: Dict[str, str] = {"User-Agent": self.user_agent}
+        if self.token is not None:
+            headers["Authorization"] = "Token " + self.token
+        return headers
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+    async def _request(self, route: Route, **kwargs) -> Union[Dict, List, str]:
+        self.breaker.check()
+
+        headers: Dict[str, str] = self._headers()
+        if "json" in kwargs:
+            headers["Content-Type"] = "application/json"
+            kwargs["data"] = json.dumps(kwargs.pop("json"), ensure_ascii=True)
+        kwargs["headers"] = headers
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire()
+            self.requests += 1
+            try:
+                data: Union[Dict, List, str] = await self._send(route, **kwargs)
+            except _Retry as e:
+                if attempt == MAX_RETRIES:
+                    self.breaker.record_failure()
+                    raise e.__cause__
+                delay: float = self._backoff(attempt) if e.delay is None else e.delay
+                logger.debug(
+                    "Retrying %s %s in %.2fs after %r", route.method, route.url, delay, e.__cause__
+                )
+                self.retries += 1
+                await asyncio.sleep(delay)
+            except (Forbidden, NotFound, HTTPException):
+                # The API answered, so it's up
+                self.breaker.record_success()
+                raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                # Only raised for requests that aren't safe to retry
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                self.breaker.probing = False
+                raise
+            else:
+                self.breaker.record_success()
+                return data
+
+    async def stream(self, route: Route) -> AsyncIterator[bytes]:
+        """Send a GET, yielding the response body in chunks as they arrive.
+
+        It waits for the limiter and counts towards the breaker like any other request, but it isn't
+        coalesced, and it's only retried if it fails before any of the body has been yielded.
+        """
+        self.breaker.check()
+
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire()
+            self.requests += 1
+            started: bool = False
+            try:
+                async with self.session.request(
+                    route.method, route.url, headers=self._headers()
+                ) as r:
+                    logger.info("%s %s has returned %s", route.method, route.url, r.status)
+                    if not 300 > r.status >= 200:
+                        self._raise_for_status(r, await json_or_text(r), RETRY_STATUSES_GET)
+                    async for chunk in r.content.iter_any():
+                        started = True
+                        yield chunk
+            except (
+                _Retry,
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ) as e:
+                cause: BaseException = e.__cause__ if isinstance(e, _Retry) else e
+                if started or attempt == MAX_RETRIES:
+                    self.breaker.record_failure()
+                    raise cause
+                delay: float = (
+                    e.delay
+                    if isinstance(e, _Retry) and e.delay is not None
+                    else self._backoff(attempt)
+                )
+                logger.debug(
+                    "Retrying %s %s in %.2fs after %r", route.method, route.url, delay, cause
+                )
+                self.retries += 1
+                await asyncio.sleep(delay)
+            except (Forbidden, NotFound, HTTPException):
+                self.breaker.record_success()
+                raise
+            except BaseException:
+                # Including the caller closing the stream early
+                self.breaker.probing = False
+                raise
+            else:
+                self.breaker.record_success()
+                return
+
+    @property
+    def coalesce_rate(self) -> float:
+        total: int = self.requests + self.coalesced
+        return self.coalesced / total if total else 0.0
+
+
+class Client(BaseClient):
+    """A :class:`trainerdex.client.Client` that sends its requests through ``session``, using the
+    shared ``limiter`` and ``breaker``
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        token: str = None,
+        loop: asyncio.AbstractEventLoop = None,
+        limiter: Optional[TokenBucket] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.loop: asyncio.AbstractEventLoop = asyncio.get_event_loop() if loop is None else loop
+        self.http: HTTPClient = HTTPClient(
+            session, token=token, loop=self.loop, limiter=limiter, breaker=breaker
+        )
+
+    def stream_leaderboard(
+        self, stat: str = "total_xp", guild: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """The body of a leaderboard response, in chunks as it downloads"""
+        if guild:
+            endpoint: str = "/leaderboard/discord/{}/{}/".format(guild, stat)
+        else:
+            endpoint: str = "/leaderboard/v1.1/{}/".format(stat)
+        return self.http.stream(Route("GET", endpoint))
@@ -0,0 +1,279 @@
+import datetime
+import heapq
+import logging
+import numpy as np
+from dataclasses import dataclass
+from dateutil.parser import isoparse
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Stored for entries whose level or date is missing or can't be read
+NO_LEVEL: Final[int] = -1
+NO_DATE: Final[np.datetime64] = np.datetime64("NaT")
+
+FACTIONS: Final[int] = 4
+# Levels per bar of the level histogram
+LEVEL_BAND: Final[int] = 5
+PERCENTILES: Final[Tuple[int, ...]] = (10, 25, 50, 75, 90, 99)
+
+
+def _level(value: Any) -> int:
+    """The lowest level in a level or level range, such as ``40`` or ``"41-50"``"""
+    try:
+        return int(str(value).split("-")[0])
+    except ValueError:
+        return NO_LEVEL
+
+
+def _date(value: Optional[str]) -> np.datetime64:
+    if not value:
+        return NO_DATE
+    try:
+        parsed: datetime.datetime = isoparse(value)
+    except ValueError:
+        return NO_DATE
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return np.datetime64(parsed, "s")
+
+
+class LeaderboardColumns:
+    """A leaderboard's entries as one NumPy array per field, in leaderboard order.
+
+    Built once per download, then filtered with boolean masks and paged with slices, which return
+    new views without copying the source or going through the entries in Python.
+    """
+
+    __slots__ = ("ids", "positions", "factions", "levels", "values", "last_updated", "usernames")
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        positions: np.ndarray,
+        factions: np.ndarray,
+        levels: np.ndarray,
+        values: np.ndarray,
+        last_updated: np.ndarray,
+        usernames: np.ndarray,
+    ) -> None:
+        self.ids: np.ndarray = ids
+        self.positions: np.ndarray = positions
+        self.factions: np.ndarray = factions
+        self.levels: np.ndarray = levels
+        self.values: np.ndarray = values
+        self.last_updated: np.ndarray = last_updated
+        self.usernames: np.ndarray = usernames
+
+    @classmethod
+    def from_entries(cls, entries: List[Mapping[str, Any]]) -> "LeaderboardColumns":
+        return cls(
+            ids=np.fromiter((entry.get("id") or 0 for entry in entries), np.int64, len(entries)),
+            positions=np.fromiter(
+                (entry.get("position") or 0 for entry in entries), np.int64, len(entries)
+            ),
+            factions=np.fromiter(
+                ((entry.get("faction") or {}).get("id", 0) for entry in entries),
+                np.int8,
+                len(entries),
+            ),
+            levels=np.fromiter(
+                (_level(entry.get("level")) for entry in entries), np.int16, len(entries)
+            ),
+            values=np.fromiter(
+                (float(entry.get("value") or 0) for entry in entries), np.float64, len(entries)
+            ),
+            last_updated=np.array(
+                [_date(entry.get("last_updated")) for entry in entries], dtype="datetime64[s]"
+            ),
+            usernames=np.array([entry.get("username") or "" for entry in entries], dtype=object),
+        )
+
+    @classmethod
+    def concatenate(cls, parts: Iterable["LeaderboardColumns"]) -> "LeaderboardColumns":
+        parts = list(parts)
+        return cls(
+            *(np.concatenate([getattr(part, name) for part in parts]) for name in cls.__slots__)
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, key: Union[slice, np.ndarray]) -> "LeaderboardColumns":
+        """Select rows with a slice, a boolean mask or an array of indices"""
+        return LeaderboardColumns(*(getattr(self, name)[key] for name in self.__slots__))
+
+    def find(self, trainer_id: int, value: float) -> Optional[int]:
+        """The row of ``trainer_id``, whose value is ``value``.
+
+        Rows are in leaderboard order, highest value first, so the rows with ``value`` are found by
+        binary search and only their IDs are compared.
+        """
+        # Reversing a view is free, and puts the values in the ascending order searchsorted wants
+        ascending: np.ndarray = self.values[::-1]
+        start: int = len(self) - int(np.searchsorted(ascending, value, side="right"))
+        stop: int = len(self) - int(np.searchsorted(ascending, value, side="left"))
+        matches: np.ndarray = np.flatnonzero(self.ids[start:stop] == trainer_id)
+        if len(matches):
+            return start + int(matches[0])
+
+        # The API's ordering was off, so fall back to looking through every row
+        matches = np.flatnonzero(self.ids == trainer_id)
+        return int(matches[0]) if len(matches) else None
+
+    def mask(
+        self,
+        factions: Optional[Collection[int]] = None,
+        levels: Optional[Tuple[int, int]] = None,
+    ) -> np.ndarray:
+        """Which rows are in one of ``factions`` and between the ``levels`` given, inclusive.
+
+        Leaving either out doesn't filter on it.
+        """
+        mask: np.ndarray = np.ones(len(self), dtype=bool)
+        if factions is not None:
+            mask &= np.isin(self.factions, np.fromiter(factions, np.int8))
+        if levels is not None:
+            mask &= (self.levels >= levels[0]) & (self.levels <= levels[1])
+        return mask
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """Each row as a dict of Python values, for display"""
+        for i in range(len(self)):
+            last_updated: np.datetime64 = self.last_updated[i]
+            value: float = self.values[i].item()
+            yield {
+                "id": int(self.ids[i]),
+                "position": int(self.positions[i]),
+                "faction": int(self.factions[i]),
+                "level": int(self.levels[i]) if self.levels[i] != NO_LEVEL else None,
+                "value": int(value) if value.is_integer() else value,
+                "last_updated": None if np.isnat(last_updated) else last_updated.item(),
+                "username": self.usernames[i],
+            }
+
+
+def merge_rows(leaderboards: Iterable[LeaderboardColumns]) -> Iterator[Dict[str, Any]]:
+    """Merge leaderboards, each highest value first, into one ranked by value.
+
+    The rows come from a heap holding one row of each leaderboard, so rows are only merged as
+    they're read. A trainer on more than one leaderboard is kept where they first come up, and
+    ``position`` is their rank on the merged leaderboard.
+    """
+    seen: Set[int] = set()
+    position: int = 0
+    for row in heapq.merge(
+        *(columns.rows() for columns in leaderboards), key=lambda row: row["value"], reverse=True
+    ):
+        if row["id"] in seen:
+            continue
+        seen.add(row["id"])
+        position += 1
+        row["position"] = position
+        yield row
+
+
+@dataclass
+class LeaderboardSummary:
+    """Aggregates of a leaderboard's columns, from :func:`summarise`"""
+
+    count: int
+    total: float
+    mean: float
+    # Indexed by faction ID
+    team_counts: List[int]
+    team_totals: List[float]
+    # (lowest level, highest level, trainers) for each band of LEVEL_BAND levels
+    level_bands: List[Tuple[int, int, int]]
+    percentiles: Dict[int, float]
+    # Faction ID to (trainer ID, username, gain since the previous snapshot)
+    top_movers: Dict[int, Tuple[int, str, float]]
+    compared: bool
+
+    @property
+    def median(self) -> Optional[float]:
+        return self.percentiles.get(50)
+
+
+def _number(value: np.number) -> Union[int, float]:
+    value = value.item()
+    return int(value) if float(value).is_integer() else value
+
+
+def summarise(
+    columns: LeaderboardColumns, previous: Optional[LeaderboardColumns] = None
+) -> LeaderboardSummary:
+    """Work out the team split, level histogram, percentiles and top mover of each team.
+
+    Movers are the trainers whose value went up the most since ``previous``, matched by trainer
+    ID. Without ``previous`` there are none.
+    """
+    factions: np.ndarray = columns.factions.astype(np.intp)
+    team_counts: np.ndarray = np.bincount(factions, minlength=FACTIONS)
+    team_totals: np.ndarray = np.bincount(factions, weights=columns.values, minlength=FACTIONS)
+
+    known: np.ndarray = columns.levels[columns.levels > 0].astype(np.intp)
+    level_bands: List[Tuple[int, int, int]] = []
+    if len(known):
+        bands: np.ndarray = np.bincount((known - 1) // LEVEL_BAND)
+        first: int = int(np.flatnonzero(bands)[0])
+        level_bands = [
+            (i * LEVEL_BAND + 1, (i + 1) * LEVEL_BAND, int(bands[i]))
+            for i in range(first, len(bands))
+        ]
+
+    percentiles: Dict[int, float] = {}
+    if len(columns):
+        percentiles = dict(
+            zip(
+                PERCENTILES,
+                (_number(x) for x in np.percentile(columns.values, PERCENTILES)),
+            )
+        )
+
+    top_movers: Dict[int, Tuple[int, str, float]] = {}
+    if previous is not None and len(previous) and len(columns):
+        order: np.ndarray = np.argsort(previous.ids, kind="stable")
+        previous_ids: np.ndarray = previous.ids[order]
+        found_at: np.ndarray = np.minimum(
+            np.searchsorted(previous_ids, columns.ids), len(previous_ids) - 1
+        )
+        found: np.ndarray = previous_ids[found_at] == columns.ids
+        gains: np.ndarray = np.zeros(len(columns))
+        gains[found] = columns.values[found] - previous.values[order][found_at[found]]
+        for faction in range(FACTIONS):
+            candidates: np.ndarray = np.flatnonzero(
+                found & (columns.factions == faction) & (gains > 0)
+            )
+            if len(candidates):
+                i: int = candidates[np.argmax(gains[candidates])]
+                top_movers[faction] = (
+                    int(columns.ids[i]),
+                    columns.usernames[i],
+                    _number(gains[i]),
+                )
+
+    return LeaderboardSummary(
+        count=len(columns),
+        total=_number(columns.values.sum()),
+        mean=_number(columns.values.mean()) if len(columns) else 0,
+        team_counts=team_counts.tolist(),
+        team_totals=[_number(x) for x in team_totals],
+        level_bands=level_bands,
+        percentiles=percentiles,
+        top_movers=top_movers,
+        compared=previous is not None,
+    )
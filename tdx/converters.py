@@ -5,12 +5,14 @@ from discord.abc import User
 from discord.ext.commands.converter import UserConverter
 from redbot.core import commands
 from redbot.core.i18n import Translator
-from trainerdex.client import Client
 from trainerdex.faction import Faction
 from trainerdex.socialconnection import SocialConnection
 from trainerdex.trainer import Trainer
 from trainerdex.update import Level, get_level
-from typing import Any, Dict, List, Literal, Union
+from typing import Any, Dict, List, Literal, Optional, Union
+
+from .cache import TrainerCache
+from .client import CircuitOpen, Client
 
 logger: logging.Logger = logging.getLogger(__name__)
 _: Translator = Translator("TrainerDex", __file__)
@@ -74,15 +76,22 @@ class TrainerConverter(commands.Converter):
     The lookup strategy is as follows (in order):
     1. Lookup by nickname.
     2. Lookup by Discord User
+
+    If a :class:`TrainerCache` is passed, it is checked before each lookup and filled after.
+    While the API's circuit breaker is open, expired trainers from the cache are used instead.
+    Lookups go through ``cli``, or the cog's own client if it isn't passed.
     """
 
     async def convert(
         self,
         ctx: commands.Context,
         argument: Union[str, User],
-        cli: Client = Client(),
+        cli: Optional[Client] = None,
+        cache: Optional[TrainerCache] = None,
     ) -> Trainer:
         logger.debug("TrainerConverter: argument: %s", argument)
+        if cli is None:
+            cli = ctx.bot.get_cog("TrainerDex").client
 
         mention: Union[User, None] = None
         if isinstance(argument, str):
@@ -92,9 +101,20 @@ class TrainerConverter(commands.Converter):
                 argument,
             )
             if is_valid_nickname:
+                cached: Optional[Trainer] = cache.get_by_nickname(argument) if cache else None
+                if cached:
+                    return cached
                 with contextlib.suppress(IndexError):
-                    trainer: Trainer = await cli.search_trainer(argument)
-                    await trainer.fetch_updates()
+                    try:
+                        trainer: Trainer = await cli.search_trainer(argument)
+                        await trainer.fetch_updates()
+                    except CircuitOpen:
+                        cached = cache.get_by_nickname(argument, stale=True) if cache else None
+                        if cached:
+                            return cached
+                        raise
+                    if cache:
+                        cache.add(trainer)
                     return trainer
 
             is_mention: Union[User, SafeConvertObject] = await safe_convert(
@@ -108,13 +128,25 @@ class TrainerConverter(commands.Converter):
             mention = argument
 
         if mention:
-            socialconnections: List[SocialConnection] = await cli.get_social_connections(
-                "discord",
-                str(mention.id),
-            )
+            cached: Optional[Trainer] = cache.get_by_discord(mention.id) if cache else None
+            if cached:
+                return cached
+            try:
+                socialconnections: List[SocialConnection] = await cli.get_social_connections(
+                    "discord",
+                    str(mention.id),
+                )
+                if socialconnections:
+                    trainer: Trainer = await socialconnections[0].trainer()
+                    await trainer.fetch_updates()
+            except CircuitOpen:
+                cached = cache.get_by_discord(mention.id, stale=True) if cache else None
+                if cached:
+                    return cached
+                raise
             if socialconnections:
-                trainer: Trainer = await socialconnections[0].trainer()
-                await trainer.fetch_updates()
+                if cache:
+                    cache.add(trainer, discord_id=mention.id)
                 return trainer
 
         raise commands.BadArgument(_("Trainer `{}` not found").format(argument))
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from discord.role import Role
 from typing import List, Optional, TypedDict
 
@@ -17,6 +17,23 @@ class TransformedRoles(TypedDict):
 class GlobalConfig:
     embed_footer: str
     notice: Optional[str] = None
+    leaderboard_concurrency: int = 4
+    leaderboard_timeout: float = 10.0
+    leaderboard_cache_ttl: float = 300.0
+    leaderboard_cache_size: int = 50_000
+    trainer_cache_ttl: float = 300.0
+    trainer_cache_size: int = 1000
+    ocr_workers: int = 4
+    ocr_timeout: float = 30.0
+    ocr_queue_depth: int = 25
+    ocr_queue_max_wait: float = 300.0
+    ocr_cache_size: int = 10_000
+    ocr_cache_max_age: float = 2_592_000.0
+    ocr_cache_perceptual: bool = False
+    ocr_prefilter: bool = True
+    ocr_max_attachments: int = 4
+    api_rate: float = 5.0
+    api_burst: int = 10
 
 
 @dataclass
@@ -30,6 +47,8 @@ class GuildConfig:
     instinct_role: Optional[int] = None
     tl40_role: Optional[int] = None
     introduction_note: Optional[str] = None
+    # Guilds whose leaderboards are combined with this one's by `leaderboard alliance`
+    alliance: List[int] = field(default_factory=list)
 
 
 @dataclass
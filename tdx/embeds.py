@@ -1,4 +1,5 @@
 from __future__ import annotations
+import asyncio
 import datetime
 import humanize
 import logging
@@ -12,25 +13,20 @@ from discord.embeds import Embed, EmptyEmbed
 from discord.emoji import Emoji
 from discord.guild import Guild
 from discord.message import Message
-from redbot.core import Config, commands
+from redbot.core import commands
 from redbot.core.i18n import Translator
 from redbot.core.utils import chat_formatting as cf
 from trainerdex.client import Client
-from trainerdex.leaderboard import Leaderboard, GuildLeaderboard, LeaderboardEntry
+from trainerdex.leaderboard import LeaderboardEntry
 from trainerdex.trainer import Trainer
 from trainerdex.update import Update
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+from .cache import LeaderboardCache, LeaderboardSnapshot, SettingsCache
 from .utils import append_icon
 
 logger: logging.Logger = logging.getLogger(__name__)
 _: Translator = Translator("TrainerDex", __file__)
-config: Config = Config.get_conf(
-    None,
-    cog_name="trainerdex",
-    identifier=8124637339,
-    force_registration=True,
-)
 
 
 class BaseCard(Embed):
@@ -39,8 +35,11 @@ class BaseCard(Embed):
         await instance.__init__(*args, **kwargs)
         return instance
 
-    async def __init__(self, ctx: Union[commands.Context, Message], **kwargs) -> None:
+    async def __init__(
+        self, ctx: Union[commands.Context, Message], settings: SettingsCache, **kwargs
+    ) -> None:
         super().__init__(**kwargs)
+        self.settings: SettingsCache = settings
 
         self.colour: Union[Colour, int] = kwargs.get(
             "colour",
@@ -52,7 +51,7 @@ class BaseCard(Embed):
         self.description: Union[str, EmptyEmbed] = kwargs.get("description", EmptyEmbed)
         self.timestamp: Union[datetime.datetime, EmptyEmbed] = kwargs.get("timestamp", EmptyEmbed)
 
-        notice: str = await config.notice()
+        notice: str = settings.global_config.notice
         if notice:
             notice: str = cf.info(notice)
 
@@ -63,7 +62,7 @@ class BaseCard(Embed):
 
         # Default _author
         self._footer: Dict[str, str] = {
-            "text": await config.embed_footer(),
+            "text": settings.global_config.embed_footer,
             "icon_url": "https://trainerdex.app/static/img/android-chrome-512x512.png",
         }
 
@@ -88,17 +87,21 @@ class ProfileCard(BaseCard):
     async def __init__(
         self,
         ctx: commands.Context,
+        settings: SettingsCache,
         client: Client,
         trainer: Trainer,
         emoji: Dict[str, Union[Emoji, str]],
         update: Update = None,
+        leaderboard_cache: Optional[LeaderboardCache] = None,
         **kwargs,
     ):
-        await super().__init__(ctx, **kwargs)
+        await super().__init__(ctx, settings, **kwargs)
         self.emoji: Dict[str, Union[Emoji, str]] = emoji
         self.client: Client = client
+        self.leaderboard_cache: Optional[LeaderboardCache] = leaderboard_cache
         self.trainer: Trainer = trainer
-        await self.trainer.fetch_updates()
+        if not self.trainer.updates:
+            await self.trainer.fetch_updates()
         self.update: Update = update or self.trainer.get_latest_update_for_stat("total_xp")
 
         self.colour: int = self.trainer.team.colour
@@ -158,8 +161,55 @@ class ProfileCard(BaseCard):
                 inline=False,
             )
 
+    async def _find_in_leaderboards(
+        self, stats: List[str], guild: Optional[Guild] = None
+    ) -> Dict[str, Tuple[LeaderboardEntry, int]]:
+        """Download the leaderboards for ``stats`` concurrently and find this trainer in each.
+
+        A stat which fails or takes longer than ``leaderboard_timeout`` is left out of the result,
+        so the card can still be rendered with the stats that did arrive.
+        """
+        semaphore: asyncio.Semaphore = asyncio.Semaphore(
+            self.settings.global_config.leaderboard_concurrency
+        )
+        timeout: float = self.settings.global_config.leaderboard_timeout
+
+        async def download(stat: str) -> LeaderboardSnapshot:
+            if self.leaderboard_cache:
+                return await self.leaderboard_cache.get(self.client, stat=stat, guild=guild)
+            return LeaderboardSnapshot(await self.client.get_leaderboard(stat=stat, guild=guild))
+
+        async def fetch(stat: str) -> Tuple[Optional[LeaderboardEntry], int]:
+            async with semaphore:
+                snapshot: LeaderboardSnapshot = await asyncio.wait_for(
+                    download(stat), timeout=timeout
+                )
+            return snapshot.find_trainer(self.trainer.old_id), len(snapshot)
+
+        results: List[Union[Tuple[Optional[LeaderboardEntry], int], BaseException]] = (
+            await asyncio.gather(*(fetch(stat) for stat in stats), return_exceptions=True)
+        )
+
+        found: Dict[str, Tuple[LeaderboardEntry, int]] = {}
+        for stat, result in zip(stats, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning(
+                    "Timed out fetching %(stat)s leaderboard (guild: %(guild)s)",
+                    {"stat": stat, "guild": getattr(guild, "id", None)},
+                )
+            elif isinstance(result, Exception):
+                logger.error(
+                    "Failed to fetch %(stat)s leaderboard (guild: %(guild)s)",
+                    {"stat": stat, "guild": getattr(guild, "id", None)},
+                    exc_info=result,
+                )
+            elif isinstance(result, BaseException):
+                raise result
+            elif result[0]:
+                found[stat] = result
+        return found
+
     async def add_guild_leaderboard(self, guild: Guild) -> None:
-        entries: List[str] = []
         stats: List[str] = [
             "badge_travel_km",
             "badge_capture_total",
@@ -167,22 +217,17 @@ class ProfileCard(BaseCard):
             "total_xp",
             "gymbadges_gold",
         ]
-        for stat in stats:
-            leaderboard: GuildLeaderboard = await self.client.get_leaderboard(
-                stat=stat, guild=guild
-            )
-            entry: LeaderboardEntry = await leaderboard.find(
-                lambda x: x._trainer_id == self.trainer.old_id
+        found: Dict[str, Tuple[LeaderboardEntry, int]] = await self._find_in_leaderboards(
+            stats, guild=guild
+        )
+        entries: List[str] = [
+            append_icon(
+                self.emoji.get(stat),
+                "{:,} / {:,}".format(found[stat][0].position, found[stat][1]),
             )
-            if entry:
-                entries.append(
-                    append_icon(
-                        self.emoji.get(stat),
-                        "{:,} / {:,}".format(entry.position, len(leaderboard)),
-                    )
-                )
-            del leaderboard
-            del entry
+            for stat in stats
+            if stat in found
+        ]
 
         if entries:
             self.insert_field_at(
@@ -192,22 +237,18 @@ class ProfileCard(BaseCard):
             )
 
     async def add_leaderboard(self) -> None:
-        entries: List[str] = []
         stats: List[str] = [
             "badge_travel_km",
             "badge_capture_total",
             "badge_pokestops_visited",
             "total_xp",
         ]
-        for stat in stats:
-            leaderboard: Leaderboard = await self.client.get_leaderboard(stat=stat)
-            entry: LeaderboardEntry = await leaderboard.find(
-                lambda x: x._trainer_id == self.trainer.old_id
-            )
-            if entry:
-                entries.append(append_icon(self.emoji.get(stat), f"{entry.position:,}"))
-            del leaderboard
-            del entry
+        found: Dict[str, Tuple[LeaderboardEntry, int]] = await self._find_in_leaderboards(stats)
+        entries: List[str] = [
+            append_icon(self.emoji.get(stat), f"{found[stat][0].position:,}")
+            for stat in stats
+            if stat in found
+        ]
 
         if entries:
             self.insert_field_at(
@@ -1,33 +1,106 @@
+import asyncio
+import contextlib
 import logging
 import math
 import os
-from typing import Dict, Final, Iterable, Set, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from discord.embeds import Embed
 from discord.emoji import Emoji
+from discord.errors import HTTPException
+from discord.guild import Guild
 from discord.message import Message
 import humanize
+import numpy as np
 from redbot.core import commands
+from redbot.core.bot import Red
 from redbot.core.commands.converter import Literal
 from redbot.core.i18n import Translator
 from redbot.core.utils import chat_formatting as cf
 from redbot.vendored.discord.ext import menus
 from trainerdex.faction import Faction
-from trainerdex.leaderboard import GuildLeaderboard, Leaderboard as LeaderboardObject
-from trainerdex.update import Level, get_level
+from trainerdex.leaderboard import Aggregations, GuildLeaderboard, Leaderboard as LeaderboardObject
+from trainerdex.trainer import Trainer
+from trainerdex.update import Level
 
 from . import converters
 from .abc import MixinMeta
+from .cache import LeaderboardSnapshot, SettingsCache
+from .client import CircuitOpen
+from .columns import LeaderboardColumns, LeaderboardSummary, merge_rows, summarise
 from .embeds import BaseCard
+from .streaming import LeaderboardDownload
 from .utils import append_icon, loading
 
 logger: logging.Logger = logging.getLogger(__name__)
 _: Translator = Translator("TrainerDex", __file__)
 
 POGOOCR_TOKEN_PATH: Final[str] = os.path.join(os.path.dirname(__file__), "data/key.json")
+# Trainers shown either side of the author by `leaderboard me`
+NEIGHBOURS: Final[int] = 5
+# Other guilds an alliance leaderboard can combine
+MAX_ALLIANCE: Final[int] = 10
 
+# Stat names taken by the commands, and the names the API uses for them
+API_STATS: Final[Dict[str, str]] = {
+    "travel_km": "badge_travel_km",
+    "capture_total": "badge_capture_total",
+    "pokestops_visited": "badge_pokestops_visited",
+    "total_xp": "total_xp",
+}
+
+
+def stat_names() -> Dict[str, str]:
+    return {
+        "badge_travel_km": _("Distance Walked"),
+        "badge_capture_total": _("Pokémon Caught"),
+        "badge_pokestops_visited": _("PokéStops Visited"),
+        "total_xp": _("Total XP"),
+    }
+
+
+def parse_filters(
+    filters: Iterable[Union[Faction, Level]],
+) -> Tuple[Optional[Set[int]], Tuple[int, int]]:
+    """The faction IDs and inclusive level range to mask a leaderboard's columns with.
+
+    The factions are None if no team was given, so the leaderboard isn't filtered by team.
+    """
+    factions: Optional[Set[int]] = {x.id for x in filters if isinstance(x, Faction)} or None
+    levels: Set[int] = {x.level for x in filters if isinstance(x, Level)}
+    if len(levels) > 1:
+        return factions, (min(levels), max(levels))
+    elif len(levels) == 1:
+        return factions, (0, levels.pop())
+    else:
+        return factions, (1, 50)
+
+
+def alliance_of(bot: Red, settings: SettingsCache, guild: Guild) -> List[Guild]:
+    """``guild`` and the guilds in its alliance which have added it back"""
+    guilds: List[Guild] = [guild]
+    for guild_id in settings.guild(guild).alliance:
+        other: Optional[Guild] = bot.get_guild(guild_id)
+        if other is not None and guild.id in settings.guild(other).alliance:
+            guilds.append(other)
+    return guilds
+
+
+class EntryFields:
+    """Adds leaderboard rows to an embed as fields. Mixed into the page sources below."""
 
-class LeaderboardPages(menus.AsyncIteratorPageSource):
     def __init__(self, *args, **kwargs) -> None:
         self.base: Embed = kwargs.pop("base")
         self.emoji: Dict[str, Union[str, Emoji]] = kwargs.pop("emoji")
@@ -37,28 +110,120 @@ class LeaderboardPages(menus.AsyncIteratorPageSource):
             "pokestops_visited",
             "total_xp",
         ] = kwargs.pop("stat")
+        # Trainer ID to show in bold
+        self.highlight: Optional[int] = kwargs.pop("highlight", None)
         super().__init__(*args, **kwargs)
 
-    async def format_page(self, menu, page) -> Dict[str, Embed]:
-        emb: Embed = self.base.copy()
-        for entry in page:
+    def add_entries(self, emb: Embed, rows: Iterable[Dict[str, Any]]) -> None:
+        for entry in rows:
             emb.add_field(
                 name="{pos} {handle} {faction}".format(
-                    pos=append_icon(self.emoji.get("number", "#"), entry.position),
-                    handle=entry.username,
-                    faction=self.emoji.get(entry.faction.verbose_name.lower()),
+                    pos=append_icon(self.emoji.get("number", "#"), entry["position"]),
+                    handle=(
+                        cf.bold(entry["username"])
+                        if entry["id"] == self.highlight
+                        else entry["username"]
+                    ),
+                    faction=self.emoji.get(Faction(entry["faction"]).verbose_name.lower()),
                 ),
                 value="{value} • TL{level} • {dt}".format(
-                    value=append_icon(self.emoji.get(self.stat), cf.humanize_number(entry.value)),
-                    level=entry.level,
-                    dt=humanize.naturaldate(entry.last_updated),
+                    value=append_icon(
+                        self.emoji.get(self.stat), cf.humanize_number(entry["value"])
+                    ),
+                    level=entry["level"],
+                    dt=humanize.naturaldate(entry["last_updated"]),
                 ),
                 inline=False,
             )
+
+
+class LeaderboardPages(EntryFields, menus.ListPageSource):
+    """Pages of a leaderboard's :class:`~.columns.LeaderboardColumns`, each a slice of them"""
+
+    async def format_page(self, menu, page: LeaderboardColumns) -> Dict[str, Embed]:
+        emb: Embed = self.base.copy()
+        self.add_entries(emb, page.rows())
+        emb.set_footer(
+            text=_("Page {page} of {pages} | {footer}").format(
+                page=menu.current_page + 1,
+                pages=self.get_max_pages(),
+                footer=emb.footer.text,
+            ),
+            icon_url=emb.footer.icon_url,
+        )
+        return {"embed": emb}
+
+
+class StreamingLeaderboardPages(EntryFields, menus.PageSource):
+    """Pages of a leaderboard that's still downloading.
+
+    Entries are put into columns and filtered as they arrive, and each page is shown as soon as
+    its rows have. Until the download finishes, the page count is provisional.
+    """
+
+    def __init__(
+        self,
+        download: LeaderboardDownload,
+        factions: Optional[Set[int]],
+        levels: Tuple[int, int],
+        per_page: int,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.download: LeaderboardDownload = download
+        self.factions: Optional[Set[int]] = factions
+        self.levels: Tuple[int, int] = levels
+        self.per_page: int = per_page
+        self.columns: LeaderboardColumns = LeaderboardColumns.from_entries([])
+        # Entries of the download put into columns so far
+        self.read: int = 0
+
+    def _read(self) -> None:
+        entries: List[Dict[str, Any]] = self.download.entries
+        if len(entries) > self.read:
+            new: LeaderboardColumns = LeaderboardColumns.from_entries(entries[self.read :])
+            self.read = len(entries)
+            self.columns = LeaderboardColumns.concatenate(
+                [self.columns, new[new.mask(factions=self.factions, levels=self.levels)]]
+            )
+
+    async def fill(self, rows: int) -> None:
+        """Wait until there are ``rows`` rows after filtering, or the download has finished"""
+        self._read()
+        while len(self.columns) < rows and not self.download.done:
+            await self.download.wait_for_more()
+            self._read()
+        if len(self.columns) < rows and self.download.error is not None:
+            raise self.download.error
+
+    def is_paginating(self) -> bool:
+        return True
+
+    def get_max_pages(self) -> Optional[int]:
+        if not self.download.done:
+            return None
+        return max(math.ceil(len(self.columns) / self.per_page), 1)
+
+    async def get_page(self, page_number: int) -> LeaderboardColumns:
+        start: int = page_number * self.per_page
+        await self.fill(start + self.per_page)
+        if page_number and start >= len(self.columns):
+            raise IndexError("page out of range")
+        return self.columns[start : start + self.per_page]
+
+    async def format_page(self, menu, page: LeaderboardColumns) -> Dict[str, Embed]:
+        emb: Embed = self.base.copy()
+        self.add_entries(emb, page.rows())
+        pages: Union[int, str, None] = self.get_max_pages()
+        if pages is None:
+            # Provisional until the download finishes
+            pages = _("{pages}+").format(
+                pages=max(math.ceil(len(self.columns) / self.per_page), 1)
+            )
         emb.set_footer(
             text=_("Page {page} of {pages} | {footer}").format(
                 page=menu.current_page + 1,
-                pages=math.ceil(len(menu.source.iterator) / menu.source.per_page),
+                pages=pages,
                 footer=emb.footer.text,
             ),
             icon_url=emb.footer.icon_url,
@@ -66,6 +231,32 @@ class LeaderboardPages(menus.AsyncIteratorPageSource):
         return {"embed": emb}
 
 
+class MergedLeaderboardPages(EntryFields, menus.AsyncIteratorPageSource):
+    """Pages of rows from :func:`~.columns.merge_rows`, merged as each page is first shown.
+
+    The number of pages isn't known until the last one has been reached.
+    """
+
+    def __init__(self, rows: Iterator[Dict[str, Any]], **kwargs) -> None:
+        super().__init__(self._stream(rows), **kwargs)
+
+    @staticmethod
+    async def _stream(rows: Iterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        for row in rows:
+            yield row
+
+    async def format_page(self, menu, page: List[Dict[str, Any]]) -> Dict[str, Embed]:
+        emb: Embed = self.base.copy()
+        self.add_entries(emb, page)
+        emb.set_footer(
+            text=_("Page {page} | {footer}").format(
+                page=menu.current_page + 1, footer=emb.footer.text
+            ),
+            icon_url=emb.footer.icon_url,
+        )
+        return {"embed": emb}
+
+
 class Leaderboard(MixinMeta):
     leaderboard_aliases = []
     leaderboard_aliases.extend(["bestenliste", "bl"])  # de-DE German
@@ -79,11 +270,13 @@ class Leaderboard(MixinMeta):
     leaderboard_aliases.extend(["ลีดเดอร์บอร์ด"])  # th-TH Thai
     leaderboard_aliases.extend(["排行榜"])  # zh-HK Chinese (Traditional)
 
-    @commands.command(name="leaderboard", aliases=list(set(leaderboard_aliases)))
+    @commands.group(
+        name="leaderboard", aliases=list(set(leaderboard_aliases)), invoke_without_command=True
+    )
     async def leaderboard(
         self,
         ctx: commands.Context,
-        leaderboard: Literal["global", "guild", "server"] = "guild",
+        leaderboard: Literal["global", "guild", "server", "alliance"] = "guild",
         stat: Literal["travel_km", "capture_total", "pokestops_visited", "total_xp"] = "total_xp",
         *filters: Union[converters.TeamConverter, converters.LevelConverter],
     ) -> None:
@@ -91,7 +284,8 @@ class Leaderboard(MixinMeta):
 
         Parameters:
             `leaderboard`: text
-                options are `guild` (or `server`) and `global`
+                options are `guild` (or `server`), `alliance` and `global`
+                `alliance` combines this server's leaderboard with those of its partnered servers, see `[p]tdxset guild alliance`
             `stat`: text
                 options are `travel_km`, `capture_total`, `pokestops_visited`, `total_xp`
             `filters`: Union[Team, Level]
@@ -106,6 +300,9 @@ class Leaderboard(MixinMeta):
             `[p]leaderboard global`
             Shows the global leaderboard, limited to the top 1000
 
+            `[p]leaderboard alliance`
+            Shows one leaderboard for this server and its partnered servers
+
             `[p]leaderboard valor mystic 24`
             Shows the server leaderboard, post-filtered to only show valor and mystic players under or equal to level 24
 
@@ -113,49 +310,24 @@ class Leaderboard(MixinMeta):
             Shows the server leaderboard, post-filtered to only show players between level 15 and 24 (inclusive)
         """
 
-        leaderboard: Literal["global", "guild", "server"] = leaderboard if ctx.guild else "global"
+        leaderboard: Literal["global", "guild", "server", "alliance"] = (
+            leaderboard if ctx.guild else "global"
+        )
         is_guild: bool = True if leaderboard == "guild" else False
 
         # Convert stat_name for API
-        stat: str = {
-            "travel_km": "badge_travel_km",
-            "capture_total": "badge_capture_total",
-            "pokestops_visited": "badge_pokestops_visited",
-            "total_xp": "total_xp",
-        }[stat]
-
-        stat_name: Dict[str, str] = {
-            "badge_travel_km": _("Distance Walked"),
-            "badge_capture_total": _("Pokémon Caught"),
-            "badge_pokestops_visited": _("PokéStops Visited"),
-            "total_xp": _("Total XP"),
-        }
-
-        factions: Set[Faction] = (
-            {x for x in filters if isinstance(x, Faction)}
-            if [x for x in filters if isinstance(x, Faction)]
-            else {Faction(i) for i in range(0, 4)}
-        )
-        levels: Set[Level] = {x.level for x in filters if isinstance(x, Level)}
-        if len(levels) > 1:
-            levels: Iterable[Level] = range(
-                min(levels),
-                max(levels) + 1,
-            )
-        elif len(levels) == 1:
-            levels: Iterable[Level] = range(levels.pop() + 1)
-        else:
-            levels: Iterable[Level] = range(1, 51)
+        stat: str = API_STATS[stat]
+        stat_name: Dict[str, str] = stat_names()
 
-        levels: Set[Level] = {get_level(level=i) for i in levels}
+        factions, level_range = parse_filters(filters)
 
         leaderboard_title: str = append_icon(
             icon=self.emoji.get(stat, ""),
             text=_("{stat} Leaderboard").format(stat=stat_name.get(stat, stat)),
         )
 
-        emb: BaseCard = await BaseCard(ctx, title=leaderboard_title)
-        if leaderboard in ("guild", "server"):
+        emb: BaseCard = await BaseCard(ctx, settings=self.settings, title=leaderboard_title)
+        if leaderboard in ("guild", "server", "alliance"):
             emb.set_author(name=ctx.guild.name, icon_url=ctx.guild.icon_url)
 
         await ctx.tick()
@@ -165,43 +337,306 @@ class Leaderboard(MixinMeta):
                 tag=ctx.author.mention, leaderboard=leaderboard_title
             )
         )
-        leaderboard: Union[
-            LeaderboardObject,
-            GuildLeaderboard,
-        ] = await self.client.get_leaderboard(
-            stat=stat,
-            guild=ctx.guild if leaderboard in ("guild", "server") else None,
-        )
-        if is_guild:
-            emb.description = _(
+        if leaderboard == "alliance":
+            guilds: List[Guild] = alliance_of(self.bot, self.settings, ctx.guild)
+            snapshots: List[LeaderboardSnapshot] = await asyncio.gather(
+                *(
+                    self.leaderboard_cache.get(self.client, stat=stat, guild=guild)
+                    for guild in guilds
+                )
+            )
+            emb.description = _("Servers: {guilds}").format(
+                guilds=cf.humanize_list([guild.name for guild in guilds])
+            )
+            # Filtering each guild's columns first leaves less to merge
+            leaderboards: List[LeaderboardColumns] = [
+                snapshot.columns[snapshot.columns.mask(factions=factions, levels=level_range)]
+                for snapshot in snapshots
+            ]
+            if not any(len(columns) for columns in leaderboards):
+                await message.edit(content=_("No results to display!"))
+                return
+            menu = menus.MenuPages(
+                source=MergedLeaderboardPages(
+                    merge_rows(leaderboards), per_page=10, base=emb, emoji=self.emoji, stat=stat
+                ),
+                timeout=300.0,
+                message=message,
+                clear_reactions_after=True,
+            )
+            await message.edit(content=ctx.author.mention)
+            await menu.show_page(0)
+            await menu.start(ctx)
+            return
+
+        def describe(
+            aggregations: Union[Aggregations, LeaderboardObject, GuildLeaderboard],
+        ) -> str:
+            return _(
                 """Average {stat_name}: {stat_avg}
                 Trainers: {stat_count}
                 Sum of all Trainers: {stat_sum}"""
             ).format(
                 stat_name=stat_name.get(stat, stat),
-                stat_avg=cf.humanize_number(leaderboard.avg),
-                stat_count=cf.humanize_number(leaderboard.count),
-                stat_sum=cf.humanize_number(leaderboard.sum),
+                stat_avg=cf.humanize_number(aggregations.avg),
+                stat_count=cf.humanize_number(aggregations.count),
+                stat_sum=cf.humanize_number(aggregations.sum),
             )
 
+        source: Union[LeaderboardSnapshot, LeaderboardDownload] = self.leaderboard_cache.stream(
+            self.client,
+            stat=stat,
+            guild=ctx.guild if leaderboard in ("guild", "server") else None,
+        )
+        if isinstance(source, LeaderboardDownload):
+            embeds = StreamingLeaderboardPages(
+                source,
+                factions=factions,
+                levels=level_range,
+                per_page=10,
+                base=emb,
+                emoji=self.emoji,
+                stat=stat,
+            )
+            try:
+                await embeds.fill(embeds.per_page)
+            except CircuitOpen:
+                # Serve the cached leaderboard even if it has expired
+                source = await self.leaderboard_cache.get(
+                    self.client,
+                    stat=stat,
+                    guild=ctx.guild if leaderboard in ("guild", "server") else None,
+                )
+
+        if isinstance(source, LeaderboardDownload):
+            if is_guild and "aggregations" in source.fields:
+                emb.description = describe(Aggregations(source.fields["aggregations"]))
+            if len(embeds.columns) < 1:
+                await message.edit(content=_("No results to display!"))
+                return
+            menu = menus.MenuPages(
+                source=embeds, timeout=300.0, message=message, clear_reactions_after=True
+            )
+            await message.edit(content=ctx.author.mention)
+            await menu.show_page(0)
+            await menu.start(ctx)
+
+            # Show the final page count, and the aggregations if they came after the entries
+            await asyncio.shield(source.task)
+            if source.error is None:
+                if is_guild and "aggregations" in source.fields:
+                    emb.description = describe(Aggregations(source.fields["aggregations"]))
+                with contextlib.suppress(HTTPException):
+                    await menu.show_page(menu.current_page)
+            return
+
+        snapshot: LeaderboardSnapshot = source
+        if is_guild:
+            emb.description = describe(snapshot.leaderboard)
+
         await message.edit(
             content=loading(_("{tag} Filtering {leaderboard}…")).format(
                 tag=ctx.author.mention, leaderboard=leaderboard_title
             )
         )
-        leaderboard.filter(lambda x: x.faction in factions).filter(
-            lambda x: get_level(level=int(str(x.level).split("-")[0])) in levels
-        )
+        columns: LeaderboardColumns = snapshot.columns[
+            snapshot.columns.mask(factions=factions, levels=level_range)
+        ]
 
-        if len(leaderboard) < 1:
+        if len(columns) < 1:
             await message.edit(content=_("No results to display!"))
         else:
-            embeds = LeaderboardPages(
-                leaderboard, per_page=10, base=emb, emoji=self.emoji, stat=stat
-            )
+            embeds = LeaderboardPages(columns, per_page=10, base=emb, emoji=self.emoji, stat=stat)
             menu = menus.MenuPages(
                 source=embeds, timeout=300.0, message=message, clear_reactions_after=True
             )
             await message.edit(content=ctx.author.mention)
             await menu.show_page(0)
             await menu.start(ctx)
+
+    @leaderboard.command(name="stats")
+    async def leaderboard_stats(
+        self,
+        ctx: commands.Context,
+        leaderboard: Literal["global", "guild", "server"] = "guild",
+        stat: Literal["travel_km", "capture_total", "pokestops_visited", "total_xp"] = "total_xp",
+        *filters: Union[converters.TeamConverter, converters.LevelConverter],
+    ) -> None:
+        """Statistics for a leaderboard
+
+        Shows the team split, a histogram of levels, percentiles of the stat and the trainer on each team whose stat went up the most since the leaderboard was last downloaded.
+        It takes the same parameters as `[p]leaderboard`, and works from the same downloaded leaderboard, so it can be run as often as you like.
+
+        Example:
+            `[p]leaderboard stats`
+            Statistics for the server's Total XP leaderboard
+
+            `[p]leaderboard stats guild travel_km valor 30 40`
+            Statistics for valor players between level 30 and 40 on the server's Distance Walked leaderboard
+        """
+        leaderboard: Literal["global", "guild", "server"] = leaderboard if ctx.guild else "global"
+        stat: str = API_STATS[stat]
+        stat_name: str = stat_names().get(stat, stat)
+        factions, level_range = parse_filters(filters)
+
+        async with ctx.typing():
+            snapshot: LeaderboardSnapshot = await self.leaderboard_cache.get(
+                self.client,
+                stat=stat,
+                guild=ctx.guild if leaderboard in ("guild", "server") else None,
+            )
+            summary: LeaderboardSummary = summarise(
+                snapshot.columns[snapshot.columns.mask(factions=factions, levels=level_range)],
+                previous=snapshot.previous,
+            )
+
+        if summary.count < 1:
+            await ctx.send(_("No results to display!"))
+            return
+
+        emb: BaseCard = await BaseCard(
+            ctx,
+            settings=self.settings,
+            title=append_icon(
+                icon=self.emoji.get(stat, ""),
+                text=_("{stat} Leaderboard Statistics").format(stat=stat_name),
+            ),
+        )
+        if leaderboard in ("guild", "server"):
+            emb.set_author(name=ctx.guild.name, icon_url=ctx.guild.icon_url)
+        emb.description = _("Trainers: {count}\nAverage: {mean}\nSum: {total}").format(
+            count=cf.humanize_number(summary.count),
+            mean=cf.humanize_number(round(summary.mean, 2)),
+            total=cf.humanize_number(summary.total),
+        )
+
+        teams: List[Faction] = [
+            Faction(i) for i in range(len(summary.team_counts)) if summary.team_counts[i]
+        ]
+        emb.add_field(
+            name=_("Teams"),
+            value="\n".join(
+                "{team} {count} ({share:.0%}) • {total}".format(
+                    team=self.emoji.get(team.verbose_name.lower()) or team.verbose_name,
+                    count=cf.humanize_number(summary.team_counts[team.id]),
+                    share=summary.team_counts[team.id] / summary.count,
+                    total=cf.humanize_number(summary.team_totals[team.id]),
+                )
+                for team in teams
+            ),
+            inline=False,
+        )
+        if summary.level_bands:
+            widest: int = max(trainers for lowest, highest, trainers in summary.level_bands)
+            emb.add_field(
+                name=_("Levels"),
+                value=cf.box(
+                    "\n".join(
+                        "TL{lowest:>2}-{highest:<2} {bar:<20} {trainers}".format(
+                            lowest=lowest,
+                            highest=highest,
+                            bar="#" * round(20 * trainers / widest),
+                            trainers=trainers,
+                        )
+                        for lowest, highest, trainers in summary.level_bands
+                    )
+                ),
+                inline=False,
+            )
+        emb.add_field(
+            name=_("Percentiles"),
+            value="\n".join(
+                (_("Median") if percentile == 50 else _("{n}th").format(n=percentile))
+                + ": "
+                + cf.humanize_number(value)
+                for percentile, value in summary.percentiles.items()
+            ),
+            inline=False,
+        )
+        if summary.top_movers:
+            emb.add_field(
+                name=_("Top Movers"),
+                value="\n".join(
+                    "{team} {handle} +{gain}".format(
+                        team=self.emoji.get(Faction(faction).verbose_name.lower())
+                        or Faction(faction).verbose_name,
+                        handle=username,
+                        gain=append_icon(self.emoji.get(stat), cf.humanize_number(gain)),
+                    )
+                    for faction, (trainer_id, username, gain) in summary.top_movers.items()
+                ),
+                inline=False,
+            )
+        elif not summary.compared:
+            emb.add_field(
+                name=_("Top Movers"),
+                value=_("Not enough history yet. Try again once the leaderboard has refreshed."),
+                inline=False,
+            )
+        await ctx.send(embed=emb)
+
+    @leaderboard.command(name="me")
+    async def leaderboard_me(
+        self,
+        ctx: commands.Context,
+        leaderboard: Literal["global", "guild", "server"] = "guild",
+        stat: Literal["travel_km", "capture_total", "pokestops_visited", "total_xp"] = "total_xp",
+        *filters: Union[converters.TeamConverter, converters.LevelConverter],
+    ) -> None:
+        """Your place on a leaderboard
+
+        Shows where you are on a leaderboard, with the 5 trainers either side of you.
+        It takes the same parameters as `[p]leaderboard`. With filters, your rank is among the trainers left after filtering.
+
+        Example:
+            `[p]leaderboard me`
+            Your place on the server's Total XP leaderboard
+
+            `[p]leaderboard me global capture_total mystic`
+            Your place among mystic players on the global Pokémon Caught leaderboard
+        """
+        leaderboard: Literal["global", "guild", "server"] = leaderboard if ctx.guild else "global"
+        stat: str = API_STATS[stat]
+        factions, level_range = parse_filters(filters)
+
+        async with ctx.typing():
+            try:
+                trainer: Trainer = await converters.TrainerConverter().convert(
+                    ctx, ctx.author, cli=self.client, cache=self.trainer_cache
+                )
+            except commands.BadArgument:
+                await ctx.send(cf.warning(_("Profile not found.")))
+                return
+
+            snapshot: LeaderboardSnapshot = await self.leaderboard_cache.get(
+                self.client,
+                stat=stat,
+                guild=ctx.guild if leaderboard in ("guild", "server") else None,
+            )
+
+        i: Optional[int] = snapshot.row_of(trainer.old_id)
+        mask: np.ndarray = snapshot.columns.mask(factions=factions, levels=level_range)
+        if i is None or not mask[i]:
+            await ctx.send(_("You're not on this leaderboard."))
+            return
+
+        columns: LeaderboardColumns = snapshot.columns[mask]
+        row: int = columns.find(trainer.old_id, snapshot.columns.values[i])
+
+        emb: BaseCard = await BaseCard(
+            ctx,
+            settings=self.settings,
+            title=append_icon(
+                icon=self.emoji.get(stat, ""),
+                text=_("{stat} Leaderboard").format(stat=stat_names().get(stat, stat)),
+            ),
+        )
+        if leaderboard in ("guild", "server"):
+            emb.set_author(name=ctx.guild.name, icon_url=ctx.guild.icon_url)
+        emb.description = _("You're #{rank} of {count}").format(
+            rank=cf.humanize_number(row + 1), count=cf.humanize_number(len(columns))
+        )
+        LeaderboardPages(
+            columns, per_page=10, base=emb, emoji=self.emoji, stat=stat, highlight=trainer.old_id
+        ).add_entries(emb, columns[max(row - NEIGHBOURS, 0) : row + NEIGHBOURS + 1].rows())
+        await ctx.send(embed=emb)
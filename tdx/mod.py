@@ -1,15 +1,20 @@
+import aiohttp
+import asyncio
 import json
 import logging
 import os
-import PogoOCR
+from collections import Counter
 from contextlib import suppress
+from dataclasses import dataclass
 from discord.errors import DiscordException, Forbidden, HTTPException
 from discord.ext.alternatives import silent_delete
 from discord.ext.commands.errors import BadArgument
+from discord.guild import Guild
 from discord.member import Member
-from discord.message import Message
+from discord.message import Attachment, Message
 from discord.role import Role
 from redbot.core import checks, commands
+from redbot.core.data_manager import cog_data_path
 from redbot.core.i18n import Translator
 from redbot.core.utils import chat_formatting as cf
 from redbot.core.utils import predicates
@@ -17,15 +22,37 @@ from trainerdex.faction import Faction
 from trainerdex.trainer import Trainer
 from trainerdex.user import User
 from trainerdex.update import Update
-from typing import Any, Callable, Dict, Final, List, Literal, Optional, TypedDict, Union
+from typing import Any, Callable, Dict, List, Literal, Optional, TypedDict, Union
 
 from . import converters
 from .abc import MixinMeta
-from .datatypes import StoredRoles, TransformedRoles
+from .autorole import (
+    AutoRoleJob,
+    Checkpoint,
+    members_to_check,
+    plan_member,
+    plan_to_csv,
+    PlannedChange,
+    resolve_trainers,
+)
+from .bulk import (
+    BulkFileError,
+    BulkRow,
+    CONCURRENCY as BULK_CONCURRENCY,
+    MAX_FILE_SIZE,
+    read_rows,
+    rows_to_csv,
+    validate_rows,
+)
+from .cache import LeaderboardSnapshot
+from .datatypes import GuildConfig, StoredRoles, TransformedRoles
 from .embeds import ProfileCard
+from .ocr import download, ImageTooLarge, OCRFailed, OCRResult, screenshot_attachments
+from .prefilter import Evaluation, Verdict, screen
 from .utils import (
     AbandonQuestionException,
     NoAnswerProvidedException,
+    ProgressMessage,
     Question,
     introduction_notes,
     loading,
@@ -35,7 +62,12 @@ from .utils import (
 logger: logging.Logger = logging.getLogger(__name__)
 _: Translator = Translator("TrainerDex", __file__)
 
-POGOOCR_TOKEN_PATH: Final[str] = os.path.join(os.path.dirname(__file__), "data/key.json")
+
+@dataclass
+class MemberEditErrors:
+    add: Optional[DiscordException] = None
+    remove: Optional[DiscordException] = None
+    nick: Optional[DiscordException] = None
 
 
 class ModCmds(MixinMeta):
@@ -75,6 +107,71 @@ class ModCmds(MixinMeta):
         else:
             raise NoAnswerProvidedException
 
+    def approval_roles(self, guild: Guild, team: Faction) -> TransformedRoles:
+        """The roles to add to and remove from a newly approved member of ``team``"""
+        guild_config: GuildConfig = self.settings.guild(guild)
+        stored_roles: StoredRoles = guild_config.roles_to_assign_on_approval
+
+        # Transform stored roles to a list of roles
+        roles: TransformedRoles = {
+            key: [role for role in map(guild.get_role, stored_roles[key]) if role]
+            for key in stored_roles
+        }
+
+        if team.id > 0:
+            team_role: Optional[Role] = guild.get_role(
+                getattr(guild_config, ["", "mystic_role", "valor_role", "instinct_role"][team.id])
+            )
+            if team_role:
+                roles["add"].append(team_role)
+        return roles
+
+    async def edit_member(
+        self,
+        member: Member,
+        add: List[Role],
+        remove: List[Role],
+        nick: Optional[str],
+        reason: str,
+    ) -> MemberEditErrors:
+        """Add and remove roles and set the nickname of ``member`` in a single request.
+
+        If Discord rejects it, each change is retried on its own so the ones that failed can be
+        reported.
+        """
+        errors: MemberEditErrors = MemberEditErrors()
+        changes: Dict[str, Any] = {}
+        if add or remove:
+            changes["roles"] = sorted((set(member.roles[1:]) | set(add)) - set(remove))
+        if nick is not None:
+            changes["nick"] = nick
+        if not changes:
+            return errors
+
+        try:
+            await member.edit(reason=reason, **changes)
+        except (Forbidden, HTTPException) as e:
+            logger.debug("Couldn't update %s in one request, trying each change: %r", member, e)
+        else:
+            return errors
+
+        if add:
+            try:
+                await member.add_roles(*add, reason=reason)
+            except (Forbidden, HTTPException) as e:
+                errors.add = e
+        if remove:
+            try:
+                await member.remove_roles(*remove, reason=reason)
+            except (Forbidden, HTTPException) as e:
+                errors.remove = e
+        if nick is not None:
+            try:
+                await member.edit(nick=nick, reason=reason)
+            except (Forbidden, HTTPException) as e:
+                errors.nick = e
+        return errors
+
     @commands.command(name="approve", aliases=["ap", "register", "verify"])
     @checks.mod_or_permissions(manage_roles=True)
     async def approve_trainer(
@@ -94,8 +191,9 @@ class ModCmds(MixinMeta):
         The command may ask you a few questions. To exit out, say `[p]cancel`.
 
         """
-        assign_roles: bool = await self.config.guild(ctx.guild).assign_roles_on_join()
-        set_nickname: bool = await self.config.guild(ctx.guild).set_nickname_on_join()
+        guild_config: GuildConfig = self.settings.guild(ctx.guild)
+        assign_roles: bool = guild_config.assign_roles_on_join
+        set_nickname: bool = guild_config.set_nickname_on_join
 
         class QuestionType(TypedDict):
             question: str
@@ -140,108 +238,32 @@ class ModCmds(MixinMeta):
                     await ctx.send(_("Cancelled!"))
                     return
 
-        message: Message = await ctx.send(loading(_("Let's go…")))
+        progress: ProgressMessage = ProgressMessage(await ctx.send(loading(_("Let's go…"))))
 
+        roles: TransformedRoles = {"add": [], "remove": []}
         if assign_roles:
-            async with ctx.typing():
-
-                stored_roles: StoredRoles = await self.config.guild(
-                    ctx.guild
-                ).roles_to_assign_on_approval()
-
-                # Transform stored roles to a list of roles
-                roles: TransformedRoles = {
-                    key: [ctx.guild.get_role(role_id) for role_id in stored_roles[key]]
-                    for key in stored_roles
-                }
+            roles = self.approval_roles(ctx.guild, answers["team"])
 
-                if answers["team"].id > 0:
-                    team_role: int = await getattr(
-                        self.config.guild(ctx.guild),
-                        ["", "mystic_role", "valor_role", "instinct_role"][answers["team"].id],
-                    )()
-                    if team_role:
-                        roles["add"].append(ctx.guild.get_role(team_role))
-
-                if roles["add"]:
-                    await message.edit(
-                        content=loading(_("Adding roles ({roles}) to {user}")).format(
-                            roles=cf.humanize_list([str(x) for x in roles["add"]]),
-                            user=member.mention,
-                        )
-                    )
-
-                    try:
-                        await member.add_roles(
-                            *roles["add"],
-                            reason=_("{mod} ran the command `{command}`").format(
-                                mod=ctx.author, command=ctx.invoked_with
-                            ),
-                        )
-                    except (Forbidden, HTTPException) as e:
-                        roles_added: bool = False
-                        roles_added_error: DiscordException = e
-                    else:
-                        await message.edit(
-                            content=success(_("Added roles ({roles}) to {user}")).format(
-                                roles=cf.humanize_list([str(x) for x in roles["add"]]),
-                                user=member.mention,
-                            )
-                        )
-                        roles_added: int = len(roles["add"])
-
-                if roles["remove"]:
-                    await message.edit(
-                        content=loading(_("Removing roles ({roles}) from {user}")).format(
-                            roles=cf.humanize_list([str(x) for x in roles["remove"]]),
-                            user=member.mention,
-                        )
-                    )
-
-                    try:
-                        await member.remove_roles(
-                            *roles["remove"],
-                            reason=_("{mod} ran the command `{command}`").format(
-                                mod=ctx.author, command=ctx.invoked_with
-                            ),
-                        )
-                    except (Forbidden, HTTPException) as e:
-                        roles_removed: bool = False
-                        roles_removed_error: DiscordException = e
-                    else:
-                        await message.edit(
-                            content=success(_("Removed roles ({roles}) from {user}")).format(
-                                roles=cf.humanize_list([str(x) for x in roles["remove"]]),
-                                user=member.mention,
-                            )
-                        )
-                        roles_removed: int = len(roles["remove"])
-
-        if set_nickname:
+        if assign_roles or set_nickname:
             async with ctx.typing():
-                await message.edit(
-                    content=loading(_("Changing {user}‘s nick to {nickname}")).format(
-                        user=member.mention, nickname=answers.get("nickname")
-                    )
+                await progress.update(
+                    content=loading(_("Updating {user}")).format(user=member.mention)
                 )
-
-                try:
-                    await member.edit(
-                        nick=answers.get("nickname"),
-                        reason=_("{mod} ran the command `{command}`").format(
-                            mod=ctx.author, command=ctx.invoked_with
-                        ),
-                    )
-                except (Forbidden, HTTPException) as e:
-                    nick_set: bool = False
-                    nick_set_error: DiscordException = e
-                else:
-                    await message.edit(
-                        content=success(_("Changed {user}‘s nick to {nickname}")).format(
-                            user=member.mention, nickname=answers.get("nickname")
-                        )
-                    )
-                    nick_set: bool = True
+                errors: MemberEditErrors = await self.edit_member(
+                    member,
+                    add=roles["add"],
+                    remove=roles["remove"],
+                    nick=answers.get("nickname") if set_nickname else None,
+                    reason=_("{mod} ran the command `{command}`").format(
+                        mod=ctx.author, command=ctx.invoked_with
+                    ),
+                )
+                roles_added: Union[int, bool] = not errors.add and len(roles["add"])
+                roles_added_error: Optional[DiscordException] = errors.add
+                roles_removed: Union[int, bool] = not errors.remove and len(roles["remove"])
+                roles_removed_error: Optional[DiscordException] = errors.remove
+                nick_set: bool = errors.nick is None
+                nick_set_error: Optional[DiscordException] = errors.nick
 
         async with ctx.typing():
             if assign_roles or set_nickname:
@@ -258,7 +280,7 @@ class ModCmds(MixinMeta):
                     else:
                         approval_message += cf.error(
                             _("Some roles could not be added. ({roles})\n")
-                        ).format(roles=cf.humanize_list(roles["add"]))
+                        ).format(roles=cf.humanize_list([str(x) for x in roles["add"]]))
                         approval_message += f"`{roles_added_error}`\n"
 
                 if roles["remove"]:
@@ -269,7 +291,7 @@ class ModCmds(MixinMeta):
                     else:
                         approval_message += cf.error(
                             _("Some roles could not be removed. ({roles})\n")
-                        ).format(roles=cf.humanize_list(roles["remove"]))
+                        ).format(roles=cf.humanize_list([str(x) for x in roles["remove"]]))
                         approval_message += f"`{roles_removed_error}`\n"
 
             if set_nickname:
@@ -282,31 +304,31 @@ class ModCmds(MixinMeta):
                     approval_message += f"`{nick_set_error}`\n"
 
             if assign_roles or set_nickname:
-                await message.edit(content=approval_message)
-                message: Message = await ctx.send(loading(""))
+                await progress.finish(content=approval_message)
+                progress: ProgressMessage = ProgressMessage(await ctx.send(loading("")))
 
         logger.info(
             "Attempting to add %(user)s to database, checking if they already exist",
             {"user": answers.get("nickname")},
         )
 
-        await message.edit(content=loading(_("Checking for user in database")))
+        await progress.update(content=loading(_("Checking for user in database")))
 
         try:
             trainer: Trainer = await converters.TrainerConverter().convert(
-                ctx, answers.get("nickname"), cli=self.client
+                ctx, answers.get("nickname"), cli=self.client, cache=self.trainer_cache
             )
         except commands.BadArgument:
             try:
                 trainer: Trainer = await converters.TrainerConverter().convert(
-                    ctx, member, cli=self.client
+                    ctx, member, cli=self.client, cache=self.trainer_cache
                 )
             except commands.BadArgument:
                 trainer = None
 
         if trainer is not None:
             logger.info("We found a trainer: %(trainer)s", {"trainer": trainer.username})
-            await message.edit(
+            await progress.update(
                 content=loading(
                     _("An existing record was found for {user}. Updating details…").format(
                         user=trainer.username
@@ -317,6 +339,7 @@ class ModCmds(MixinMeta):
             # Edit the trainer instance with the new team and set is_verified
             # Chances are, is_verified might have been False and this will fix that.
             await trainer.edit(faction=answers.get("team").id, is_verified=True)
+            self.trainer_cache.invalidate(trainer)
 
             # Check if it's a good idea to update the stats
             await trainer.fetch_updates()
@@ -328,17 +351,17 @@ class ModCmds(MixinMeta):
             )
         else:
             logger.info("%s: No user found, creating profile", nickname)
-            await message.edit(content=loading(_("Creating {user}")).format(user=nickname))
+            await progress.update(content=loading(_("Creating {user}")).format(user=nickname))
             trainer: Trainer = await self.client.create_trainer(
                 username=nickname, faction=answers.get("team").id, is_verified=True
             )
             user: User = await trainer.user()
             await user.add_discord(member)
-            await message.edit(content=loading(_("Created {user}")).format(user=nickname))
+            await progress.update(content=loading(_("Created {user}")).format(user=nickname))
             set_xp: bool = True
 
         if set_xp:
-            await message.edit(
+            await progress.update(
                 content=loading(_("Setting Total XP for {user} to {total_xp}.")).format(
                     user=trainer.username,
                     total_xp=answers.get("total_xp"),
@@ -349,19 +372,23 @@ class ModCmds(MixinMeta):
                 data_source="ss_ocr",
                 update_time=ctx.message.created_at,
             )
+            self.leaderboard_cache.invalidate(
+                trainer.old_id, {"total_xp": answers.get("total_xp")}, guild=ctx.guild
+            )
+            self.trainer_cache.invalidate(trainer)
         else:
-            await message.edit(
+            await progress.update(
                 content=loading(_("Won't set Total XP for {user}.")).format(user=trainer.username)
             )
 
-        custom_message: str = await self.config.guild(ctx.guild).introduction_note()
+        custom_message: str = guild_config.introduction_note
         notes: str = introduction_notes(ctx, member, trainer, additional_message=custom_message)
 
         with suppress(Forbidden):
             await member.send(notes[0])
             if len(notes) == 2:
                 await member.send(notes[1])
-        await message.edit(
+        await progress.update(
             content=(
                 success(_("Successfully added {user} as {trainer}."))
                 + "\n"
@@ -372,11 +399,17 @@ class ModCmds(MixinMeta):
             )
         )
         embed: ProfileCard = await ProfileCard(
-            ctx=ctx, bot=self.bot, client=self.client, trainer=trainer, emoji=self.emoji
+            ctx=ctx,
+            settings=self.settings,
+            bot=self.bot,
+            client=self.client,
+            trainer=trainer,
+            emoji=self.emoji,
+            leaderboard_cache=self.leaderboard_cache,
         )
         with suppress(Forbidden):
             await member.send(embed=embed)
-        await message.edit(
+        await progress.finish(
             content=success(_("Successfully added {user} as {trainer}.")).format(
                 user=member.mention,
                 trainer=trainer.username,
@@ -391,8 +424,13 @@ class ModCmds(MixinMeta):
 
     @tdxmod.command(name="debug")
     @checks.mod()
-    async def tdxmod__debug(self, ctx: commands.Context, message: Message) -> None:
-        """Returns a reason why OCR would have failed"""
+    async def tdxmod__debug(
+        self, ctx: commands.Context, message: Message, attachment: int = 1
+    ) -> None:
+        """Returns a reason why OCR would have failed
+
+        If the message has several images, `attachment` picks which one to read.
+        """
         original_context: commands.Context = await self.bot.get_context(message)
         async with ctx.channel.typing():
             if await self.bot.cog_disabled_in_guild(self, original_context.guild):
@@ -411,21 +449,17 @@ class ModCmds(MixinMeta):
                 )
                 return
 
-            if len(original_context.message.attachments) > 1:
+            images: List[Attachment] = screenshot_attachments(original_context.message)
+            max_attachments: int = self.settings.global_config.ocr_max_attachments
+            if len(images) > max_attachments:
                 await ctx.send(
-                    _("Message {message.id} failed because there more than file attached.").format(
-                        message=message
-                    )
+                    _(
+                        "Message {message.id} failed because there are more than {max} images attached."
+                    ).format(message=message, max=max_attachments)
                 )
                 return
 
-            if os.path.splitext(original_context.message.attachments[0].proxy_url)[
-                1
-            ].lower() not in [
-                ".jpeg",
-                ".jpg",
-                ".png",
-            ]:
+            if not images:
                 await ctx.send(
                     _("Message {message.id} failed because the file is not jpg or png.").format(
                         message=message
@@ -433,7 +467,15 @@ class ModCmds(MixinMeta):
                 )
                 return
 
-            profile_ocr: bool = await self.config.channel(original_context.channel).profile_ocr()
+            if not 1 <= attachment <= len(images):
+                await ctx.send(
+                    _("Message {message.id} only has {count} images.").format(
+                        message=message, count=len(images)
+                    )
+                )
+                return
+
+            profile_ocr: bool = self.settings.channel(original_context.channel).profile_ocr
             if not profile_ocr:
                 await ctx.send(
                     _(
@@ -444,7 +486,10 @@ class ModCmds(MixinMeta):
 
             try:
                 await converters.TrainerConverter().convert(
-                    original_context, original_context.author, cli=self.client
+                    original_context,
+                    original_context.author,
+                    cli=self.client,
+                    cache=self.trainer_cache,
                 )
             except BadArgument:
                 await ctx.send(
@@ -455,18 +500,47 @@ class ModCmds(MixinMeta):
                 return
 
             try:
-                ocr: PogoOCR.ProfileSelf = PogoOCR.ProfileSelf(
-                    POGOOCR_TOKEN_PATH, image_uri=original_context.message.attachments[0].proxy_url
+                image: bytes = await download(self.session, images[attachment - 1])
+            except ImageTooLarge:
+                await ctx.send(
+                    _("Message {message.id} failed because the file is too large.").format(
+                        message=message
+                    )
                 )
-                ocr.get_text()
-            except Exception as e:
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                await ctx.send(
+                    _(
+                        "Message {message.id} failed because the file couldn't be downloaded."
+                    ).format(message=message)
+                )
+                await ctx.send(cf.box(repr(e)))
+                return
+
+            verdict: Verdict = await asyncio.get_running_loop().run_in_executor(
+                None, screen, image
+            )
+            if not verdict.is_profile:
+                await ctx.send(
+                    _(
+                        "Message {message.id} would be skipped because it doesn't look like a profile: {reason}"
+                    ).format(message=message, reason=verdict.reason)
+                )
+
+            try:
+                ocr: OCRResult = await self.recognise(image)
+            except (OCRFailed, asyncio.TimeoutError) as e:
                 message: Message = await ctx.send(
                     _("Message {message.id} failed because for an unknown reason").format(
                         message=message
                     )
                 )
-                await ctx.send(cf.box(e))
-                message_content: str = str(ocr.text_found[0].description)
+                await ctx.send(
+                    cf.box(repr(e) if isinstance(e, asyncio.TimeoutError) else e.__cause__)
+                )
+                if not getattr(e, "text", None):
+                    return
+                message_content: str = e.text
                 if len(message_content) <= 1994:
                     await ctx.send(cf.box(message_content))
                 else:
@@ -477,7 +551,7 @@ class ModCmds(MixinMeta):
                     )
                 return
             else:
-                message_content: str = str(ocr.text_found[0].description)
+                message_content: str = ocr.text
                 data_found: Dict[str, Any] = {
                     "locale": ocr.locale,
                     "numeric_locale": ocr.numeric_locale,
@@ -521,109 +595,398 @@ class ModCmds(MixinMeta):
                     )
                 return
 
-    @tdxmod.command(name="auto-role")
+    @tdxmod.command(name="prefilter")
+    @checks.is_owner()
+    async def tdxmod__prefilter(self, ctx: commands.Context, folder: Optional[str] = None) -> None:
+        """Show how many OCR calls the image prefilter has saved
+
+        If `folder` is given, the prefilter is also run over the labelled samples in its `profile`
+        and `other` subfolders, to measure how many profiles it would wrongly reject.
+        """
+        async with ctx.channel.typing():
+            data: Dict[str, Any] = {
+                "enabled": self.prefilter.enabled,
+                "checked": self.prefilter.checked,
+                "ocr_calls_saved": self.prefilter.rejected,
+                "reasons": dict(self.prefilter.reasons),
+            }
+            if folder is not None:
+                if not os.path.isdir(folder):
+                    await ctx.send(cf.error(_("`{folder}` isn't a folder.").format(folder=folder)))
+                    return
+                evaluation: Evaluation = await self.prefilter.evaluate(folder)
+                data["sample"] = {
+                    "profiles": evaluation.profiles,
+                    "others": evaluation.others,
+                    "false_negatives": len(evaluation.false_negatives),
+                    "false_negative_rate": round(evaluation.false_negative_rate, 3),
+                    "false_positives": len(evaluation.false_positives),
+                    "rejection_rate": round(evaluation.rejection_rate, 3),
+                    "missed_profiles": dict(evaluation.false_negatives),
+                }
+
+            output: str = json.dumps(data, indent=2, ensure_ascii=False)
+            formatted_output: str = cf.box(output, "json")
+            if len(formatted_output) <= 2000:
+                await ctx.send(formatted_output)
+            else:
+                await ctx.send(file=cf.text_to_file(output, filename="prefilter.json"))
+
+    def autorole_progress(self, job: AutoRoleJob) -> str:
+        checkpoint: Checkpoint = job.checkpoint
+        text: str = _(
+            "{done}/{total} checked: {approved} approved, {edited} updated, "
+            "{not_found} not found, {unverified} unverified, {failed} failed"
+        ).format(
+            done=cf.humanize_number(job.done),
+            total=cf.humanize_number(job.total),
+            approved=cf.humanize_number(checkpoint.approved),
+            edited=cf.humanize_number(checkpoint.edited),
+            not_found=cf.humanize_number(checkpoint.not_found),
+            unverified=cf.humanize_number(checkpoint.unverified),
+            failed=cf.humanize_number(checkpoint.failed),
+        )
+        if job.finished:
+            return success(text)
+        if job.task is not None and job.task.done():
+            return _("{progress}\nStopped. Run the command again to carry on.").format(
+                progress=text
+            )
+        eta: Optional[float] = job.eta
+        return loading(
+            _("{progress}\n{rate:.1f} members a second, {eta} left").format(
+                progress=text,
+                rate=job.rate,
+                eta=(
+                    cf.humanize_timedelta(seconds=int(eta)) or _("a moment")
+                    if eta is not None
+                    else _("unknown time")
+                ),
+            )
+        )
+
+    async def autorole_dry_run(
+        self,
+        ctx: commands.Context,
+        members: List[Member],
+        add_roles: List[Role],
+        del_roles: List[Role],
+        team_roles: List[Union[None, Role]],
+        set_nickname: bool,
+    ) -> None:
+        async with ctx.typing():
+            trainers: Dict[int, Trainer] = await resolve_trainers(
+                self.client,
+                members,
+                cache=self.trainer_cache,
+                leaderboard=await self.leaderboard_cache.get(
+                    self.client, stat="total_xp", guild=ctx.guild
+                ),
+            )
+            plan: List[PlannedChange] = [
+                plan_member(
+                    member,
+                    trainers.get(member.id),
+                    add_roles,
+                    del_roles,
+                    team_roles,
+                    set_nickname,
+                )
+                for member in members
+            ]
+        statuses: Counter = Counter(change.status for change in plan)
+        await ctx.send(
+            _(
+                "Dry run, nothing was changed. Of {total} members to check:\n"
+                "{edit} would be updated: {gain} would gain roles, {lose} would lose roles "
+                "and {renamed} would be renamed\n"
+                "{unchanged} already have the right roles\n"
+                "{not_found} have no TrainerDex profile and {unverified} aren't verified"
+            ).format(
+                total=cf.humanize_number(len(plan)),
+                edit=cf.humanize_number(statuses["edit"]),
+                gain=cf.humanize_number(sum(bool(change.add) for change in plan)),
+                lose=cf.humanize_number(sum(bool(change.remove) for change in plan)),
+                renamed=cf.humanize_number(sum(change.nick is not None for change in plan)),
+                unchanged=cf.humanize_number(statuses["unchanged"]),
+                not_found=cf.humanize_number(statuses["not_found"]),
+                unverified=cf.humanize_number(statuses["unverified"]),
+            ),
+            file=cf.text_to_file(plan_to_csv(plan), filename="auto-role.csv"),
+        )
+
+    @tdxmod.group(name="auto-role", invoke_without_command=True)
     @checks.mod_or_permissions(manage_roles=True)
-    async def autorole(self, ctx: commands.Context) -> None:
+    async def autorole(self, ctx: commands.Context, flag: Optional[str] = None) -> None:
         """EXPERIMENTAL: Checks for existing users that don't have the right roles, and applies them
 
-        Warning: This command is slow and experimental. I wouldn't recommend running it without checking by your roles_to_assign_on_approval setting first.
+        Warning: This command is experimental. I wouldn't recommend running it without checking by your roles_to_assign_on_approval setting first.
         It can really mess with roles on a mass scale.
+
+        It runs in the background and saves its progress, so running it again after a restart carries on where it stopped.
+        Pass `--dry-run` to get a summary and a CSV of what it would change, without changing anything.
         """
-        assign_roles: bool = await self.config.guild(ctx.guild).assign_roles_on_join()
+        if flag not in (None, "--dry-run"):
+            await ctx.send_help()
+            return
+        dry_run: bool = flag == "--dry-run"
+
+        if not dry_run and ctx.guild.id in self.autorole_jobs:
+            await ctx.send(
+                _(
+                    "Auto-role is already running. Use `{prefix}tdxmod auto-role status` to check on it."
+                ).format(prefix=ctx.clean_prefix)
+            )
+            return
+
+        guild_config: GuildConfig = self.settings.guild(ctx.guild)
+        assign_roles: bool = guild_config.assign_roles_on_join
         if assign_roles is False:
             return
-        set_nickname: bool = await self.config.guild(ctx.guild).set_nickname_on_join()
-        roles: StoredRoles = await self.config.guild(ctx.guild).roles_to_assign_on_approval()
-        add_roles: List[Role] = [ctx.guild.get_role(x) for x in roles["add"]]
-        del_roles: List[Role] = [ctx.guild.get_role(x) for x in roles["remove"]]
+        set_nickname: bool = guild_config.set_nickname_on_join
+        roles: StoredRoles = guild_config.roles_to_assign_on_approval
+        add_roles: List[Role] = [
+            role for role in map(ctx.guild.get_role, roles["add"]) if role is not None
+        ]
+        del_roles: List[Role] = [
+            role for role in map(ctx.guild.get_role, roles["remove"]) if role is not None
+        ]
         team_roles: List[Union[None, Role]] = [
             None,
-            ctx.guild.get_role(await self.config.guild(ctx.guild).mystic_role()),
-            ctx.guild.get_role(await self.config.guild(ctx.guild).valor_role()),
-            ctx.guild.get_role(await self.config.guild(ctx.guild).instinct_role()),
+            ctx.guild.get_role(guild_config.mystic_role),
+            ctx.guild.get_role(guild_config.valor_role),
+            ctx.guild.get_role(guild_config.instinct_role),
         ]
-        members: List[Member] = [x for x in ctx.guild.members if not x.bot]
+        members: List[Member] = members_to_check(ctx.guild, add_roles, del_roles)
+        if dry_run:
+            await self.autorole_dry_run(
+                ctx, members, add_roles, del_roles, team_roles, set_nickname
+            )
+            return
+
+        leaderboard: LeaderboardSnapshot = await self.leaderboard_cache.get(
+            self.client, stat="total_xp", guild=ctx.guild
+        )
 
-        members_to_edit: List[Member] = []
-        await ctx.send("Starting ({}/{})".format(len(set(members_to_edit)), len(members)))
-        for role in add_roles:
-            message: Message = await ctx.send(
-                "Checking {} ({}/{})".format(role, len(set(members_to_edit)), len(members))
+        async def resolve(batch: List[Member]) -> Dict[int, Trainer]:
+            # Looked up the same way as the dry run, without the updates auto-role doesn't need
+            return await resolve_trainers(
+                self.client, batch, cache=self.trainer_cache, leaderboard=leaderboard
             )
-            members_to_edit += [m for m in members if role not in m.roles]
-            await message.edit(
-                content="Checked `{}` ({}/{})".format(
-                    role, len(set(members_to_edit)), len(members)
+
+        message: Message = await ctx.send(loading(_("Starting…")))
+        progress: ProgressMessage = ProgressMessage(message, delay=5.0)
+
+        async def report(job: AutoRoleJob) -> None:
+            if job.finished:
+                await progress.finish(content=self.autorole_progress(job))
+            else:
+                await progress.update(content=self.autorole_progress(job))
+
+        job: AutoRoleJob = AutoRoleJob(
+            guild=ctx.guild,
+            members=members,
+            resolve=resolve,
+            add_roles=add_roles,
+            del_roles=del_roles,
+            team_roles=team_roles,
+            set_nickname=set_nickname,
+            reason=_("{mod} ran the command `{command}`").format(
+                mod=ctx.author, command=ctx.invoked_with
+            ),
+            path=cog_data_path(self) / "autorole" / f"{ctx.guild.id}.json",
+            on_progress=report,
+        )
+        await job.load()
+        if job.resumed:
+            await ctx.send(
+                _("Resuming, {count} members were already checked.").format(
+                    count=cf.humanize_number(job.resumed)
                 )
             )
-        for role in del_roles:
-            message: Message = await ctx.send(
-                "Checking {} ({}/{})".format(role, len(set(members_to_edit)), len(members))
+        self.autorole_jobs[ctx.guild.id] = job
+
+        def forget(task: asyncio.Task) -> None:
+            self.autorole_jobs.pop(ctx.guild.id, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Auto-role failed in %s", ctx.guild.id, exc_info=task.exception())
+
+        job.start().add_done_callback(forget)
+        await report(job)
+
+    @autorole.command(name="status")
+    async def autorole__status(self, ctx: commands.Context) -> None:
+        """Show how far the running auto-role job has got"""
+        job: Optional[AutoRoleJob] = self.autorole_jobs.get(ctx.guild.id)
+        if job is None:
+            await ctx.send(_("Auto-role isn't running."))
+            return
+        await ctx.send(self.autorole_progress(job))
+
+    @autorole.command(name="cancel")
+    async def autorole__cancel(self, ctx: commands.Context) -> None:
+        """Stop the running auto-role job, saving its progress"""
+        job: Optional[AutoRoleJob] = self.autorole_jobs.get(ctx.guild.id)
+        if job is None:
+            await ctx.send(_("Auto-role isn't running."))
+            return
+        job.task.cancel()
+        await ctx.tick()
+
+    async def approve_row(
+        self,
+        ctx: commands.Context,
+        row: BulkRow,
+        assign_roles: bool,
+        set_nickname: bool,
+        reason: str,
+    ) -> None:
+        """Do what `approve` does for one row of `tdxmod bulk-approve`, without asking or DMing"""
+        try:
+            trainer: Trainer = await converters.TrainerConverter().convert(
+                ctx, row.nickname, cli=self.client, cache=self.trainer_cache
             )
-            members_to_edit += [m for m in members if role in m.roles]
-            await message.edit(
-                content="Checked `{}` ({}/{})".format(
-                    role, len(set(members_to_edit)), len(members)
+        except commands.BadArgument:
+            try:
+                trainer: Trainer = await converters.TrainerConverter().convert(
+                    ctx, row.member, cli=self.client, cache=self.trainer_cache
+                )
+            except commands.BadArgument:
+                trainer = None
+
+        if trainer is not None:
+            await trainer.edit(faction=row.team.id, is_verified=True)
+            self.trainer_cache.invalidate(trainer)
+            await trainer.fetch_updates()
+            # get_latest_update_for_stat raises ValueError if no update has a Total XP
+            set_xp: bool = True
+            if any(getattr(update, "total_xp", None) is not None for update in trainer.updates):
+                latest_update_with_total_xp: Update = trainer.get_latest_update_for_stat(
+                    "total_xp"
                 )
+                set_xp = row.total_xp > latest_update_with_total_xp.total_xp
+            row.trainer = "updated"
+        else:
+            trainer: Trainer = await self.client.create_trainer(
+                username=row.nickname, faction=row.team.id, is_verified=True
             )
-        members_to_edit = list(set(members_to_edit))
+            user: User = await trainer.user()
+            await user.add_discord(row.member)
+            set_xp: bool = True
+            row.trainer = "created"
 
-        members_approved: int = 0
-        message: Message = await ctx.send(
-            "{} approved, {} checked, {} total".format(members_approved, 0, len(members_to_edit))
+        if set_xp:
+            await trainer.post(
+                stats={"total_xp": row.total_xp},
+                data_source="ss_ocr",
+                update_time=ctx.message.created_at,
+            )
+            self.leaderboard_cache.invalidate(
+                trainer.old_id, {"total_xp": row.total_xp}, guild=ctx.guild
+            )
+            self.trainer_cache.invalidate(trainer)
+            row.total_xp_posted = True
+
+        roles: TransformedRoles = {"add": [], "remove": []}
+        if assign_roles:
+            roles = self.approval_roles(ctx.guild, row.team)
+        errors: MemberEditErrors = await self.edit_member(
+            row.member,
+            add=roles["add"],
+            remove=roles["remove"],
+            nick=row.nickname if set_nickname else None,
+            reason=reason,
         )
+        for name, error in (
+            ("roles added", errors.add),
+            ("roles removed", errors.remove),
+            ("nickname", errors.nick),
+        ):
+            if error is not None:
+                row.errors.append(f"{name}: {error}")
+
+    @tdxmod.command(name="bulk-approve")
+    @checks.mod_or_permissions(manage_roles=True)
+    async def tdxmod__bulk_approve(self, ctx: commands.Context) -> None:
+        """Approve every trainer listed in an attached CSV
+
+        The CSV needs a header with `member`, `nickname`, `team` and `total_xp` columns. `member` can be an ID, mention or name.
+        Every row is checked before anything is changed. Then trainers are created or updated, their Total XP posted, and roles and nicknames set as `[p]approve` would, several at a time.
+        A CSV with the result of each row is sent when it's done.
+        """
+        if not ctx.message.attachments:
+            await ctx.send_help()
+            return
+        attachment: Attachment = ctx.message.attachments[0]
+        if attachment.size > MAX_FILE_SIZE:
+            await ctx.send(_("That file is too large."))
+            return
+
+        try:
+            rows: List[BulkRow] = read_rows((await attachment.read()).decode("utf-8-sig"))
+        except UnicodeDecodeError:
+            await ctx.send(_("That file isn't a UTF-8 CSV."))
+            return
+        except BulkFileError as e:
+            await ctx.send(_("That file can't be used: {error}").format(error=e))
+            return
+
         async with ctx.typing():
-            for index, member in enumerate(members_to_edit):
-                try:
-                    trainer: Trainer = await converters.TrainerConverter().convert(
-                        ctx, member, cli=self.client
-                    )
-                except commands.BadArgument:
-                    await message.edit(
-                        content="{} approved, {} checked, {} total".format(
-                            members_approved, index + 1, len(members_to_edit)
-                        )
+            await validate_rows(ctx, rows)
+        invalid: List[BulkRow] = [row for row in rows if not row.valid]
+        if invalid:
+            await ctx.send(
+                cf.error(
+                    _(
+                        "{count} of {total} rows have problems, so nobody was approved. "
+                        "Fix them and try again."
                     )
-                    continue
-                if trainer.is_verified:
-                    roles_to_add: List[Role] = list(set(add_roles))
-                    if trainer.faction > 0:
-                        roles_to_add.append(team_roles[trainer.faction])
-                    if roles_to_add:
-                        try:
-                            await member.add_roles(
-                                *roles_to_add,
-                                reason=_("{mod} ran the command `{command}`").format(
-                                    mod=ctx.author, command=ctx.invoked_with
-                                ),
-                            )
-                        except (Forbidden, HTTPException):
-                            pass
-
-                    if del_roles:
-                        try:
-                            await member.remove_roles(
-                                *del_roles,
-                                reason=_("{mod} ran the command `{command}`").format(
-                                    mod=ctx.author, command=ctx.invoked_with
-                                ),
-                            )
-                        except (Forbidden, HTTPException):
-                            pass
-
-                    if set_nickname:
-                        try:
-                            await member.edit(
-                                nick=trainer.nickname,
-                                reason=_("{mod} ran the command `{command}`").format(
-                                    mod=ctx.author, command=ctx.invoked_with
-                                ),
-                            )
-                        except (Forbidden, HTTPException):
-                            pass
-                    members_approved += 1
-                await message.edit(
-                    content="{} approved, {} checked, {} total".format(
-                        members_approved, index + 1, len(members_to_edit)
+                ).format(count=len(invalid), total=len(rows)),
+                file=cf.text_to_file(rows_to_csv(rows), filename="bulk-approve.csv"),
+            )
+            return
+
+        guild_config: GuildConfig = self.settings.guild(ctx.guild)
+        reason: str = _("{mod} ran the command `{command}`").format(
+            mod=ctx.author, command=ctx.invoked_with
+        )
+        progress: ProgressMessage = ProgressMessage(
+            await ctx.send(loading(_("Approving {total} trainers…")).format(total=len(rows))),
+            delay=5.0,
+        )
+        semaphore: asyncio.Semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+        done: int = 0
+
+        async def approve(row: BulkRow) -> None:
+            nonlocal done
+            async with semaphore:
+                try:
+                    await self.approve_row(
+                        ctx,
+                        row,
+                        assign_roles=guild_config.assign_roles_on_join,
+                        set_nickname=guild_config.set_nickname_on_join,
+                        reason=reason,
                     )
+                except Exception as e:
+                    logger.exception("Bulk approval failed for line %s", row.line)
+                    row.status = "failed"
+                    row.errors.append(str(e) or type(e).__name__)
+                else:
+                    row.status = "approved"
+            done += 1
+            await progress.update(
+                content=loading(_("Approved {done} of {total} trainers…")).format(
+                    done=done, total=len(rows)
                 )
+            )
+
+        await asyncio.gather(*(approve(row) for row in rows))
+
+        statuses: Counter = Counter(row.status for row in rows)
+        await progress.finish(
+            content=success(_("{approved} of {total} trainers approved, {failed} failed.")).format(
+                approved=statuses["approved"], total=len(rows), failed=statuses["failed"]
+            )
+        )
+        await ctx.send(file=cf.text_to_file(rows_to_csv(rows), filename="bulk-approve.csv"))
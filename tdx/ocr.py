@@ -0,0 +1,605 @@
+import asyncio
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+import aiohttp
+import PogoOCR
+from babel import Locale
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from decimal import Decimal
+from discord.message import Attachment, Message
+from google.cloud import vision
+from google.cloud.vision import types
+from google.oauth2 import service_account
+from io import BytesIO
+from pathlib import Path
+from PIL import Image
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Final,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from .prefilter import IMAGE_EXTENSIONS
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+POGOOCR_TOKEN_PATH: Final[str] = os.path.join(os.path.dirname(__file__), "data/key.json")
+# Phone screenshots are a few MB at most
+MAX_IMAGE_SIZE: Final[int] = 10 * 1024 * 1024
+# Text on a profile screen is still large enough to read at this width
+MAX_WIDTH: Final[int] = 1080
+
+# The stats read from a profile screenshot that are posted to TrainerDex
+STATS: Final[Tuple[str, ...]] = ("travel_km", "capture_total", "pokestops_visited", "total_xp")
+
+T = TypeVar("T")
+
+
+@dataclass
+class OCRResult:
+    """The fields read from a profile screenshot, detached from the PogoOCR object"""
+
+    text: str
+    locale: str
+    numeric_locale: Dict[str, str]
+    username: Optional[str] = None
+    buddy_name: Optional[str] = None
+    travel_km: Optional[Decimal] = None
+    capture_total: Optional[int] = None
+    pokestops_visited: Optional[int] = None
+    total_xp: Optional[int] = None
+    start_date: Optional[datetime.date] = None
+
+    @classmethod
+    def from_ocr(cls, ocr: PogoOCR.ProfileSelf) -> "OCRResult":
+        return cls(
+            text=str(ocr.text_found[0].description),
+            locale=str(ocr.locale),
+            numeric_locale=dict(ocr.numeric_locale),
+            username=ocr.username,
+            buddy_name=ocr.buddy_name,
+            travel_km=ocr.travel_km,
+            capture_total=ocr.capture_total,
+            pokestops_visited=ocr.pokestops_visited,
+            total_xp=ocr.total_xp,
+            start_date=ocr.start_date,
+        )
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "OCRResult":
+        data = dict(data)
+        if data.get("travel_km") is not None:
+            data["travel_km"] = Decimal(data["travel_km"])
+        if data.get("start_date") is not None:
+            data["start_date"] = datetime.date.fromisoformat(data["start_date"])
+        return cls(**data)
+
+    def to_json(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = asdict(self)
+        if self.travel_km is not None:
+            data["travel_km"] = str(self.travel_km)
+        if self.start_date is not None:
+            data["start_date"] = self.start_date.isoformat()
+        return data
+
+
+def merge_stats(results: List[OCRResult]) -> Dict[str, Union[Decimal, int, None]]:
+    """The highest value of each stat read across several screenshots"""
+    merged: Dict[str, Union[Decimal, int, None]] = {}
+    for stat in STATS:
+        values: List[Union[Decimal, int]] = [
+            getattr(result, stat) for result in results if getattr(result, stat) is not None
+        ]
+        merged[stat] = max(values) if values else None
+    return merged
+
+
+class OCRFailed(Exception):
+    """Raised when PogoOCR couldn't read a screenshot.
+
+    ``text`` holds whatever Google Vision returned before the failure, if anything.
+    """
+
+    def __init__(self, text: Optional[str] = None) -> None:
+        super().__init__(text)
+        self.text: Optional[str] = text
+
+
+def screenshot_attachments(message: Message) -> List[Attachment]:
+    """The attachments on ``message`` that could be screenshots, by their file extension"""
+    return [
+        attachment
+        for attachment in message.attachments
+        if os.path.splitext(attachment.proxy_url)[1].lower() in IMAGE_EXTENSIONS
+    ]
+
+
+class ImageTooLarge(Exception):
+    """Raised when an attachment is bigger than :data:`MAX_IMAGE_SIZE`"""
+
+    pass
+
+
+async def download(session: aiohttp.ClientSession, attachment: Attachment) -> bytes:
+    """Download ``attachment``, giving up once it's more than :data:`MAX_IMAGE_SIZE` bytes
+
+    Raises
+    ------
+    ImageTooLarge
+        The attachment is too big to be a screenshot.
+    aiohttp.ClientError
+        The download failed.
+    """
+    if attachment.size > MAX_IMAGE_SIZE:
+        raise ImageTooLarge
+    buffer: bytearray = bytearray()
+    async with session.get(attachment.url, raise_for_status=True) as response:
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            buffer.extend(chunk)
+            if len(buffer) > MAX_IMAGE_SIZE:
+                raise ImageTooLarge
+    return bytes(buffer)
+
+
+def prepare(image: bytes) -> bytes:
+    """Shrink ``image`` to :data:`MAX_WIDTH`, as a JPEG.
+
+    It isn't cropped, as the trainer's name and buddy are read from the top of the screen and the
+    stats from further down.
+    """
+    with Image.open(BytesIO(image)) as original:
+        pilimage: Image.Image = original.convert("RGB")
+    width, height = pilimage.size
+    if width > MAX_WIDTH:
+        pilimage = pilimage.resize(
+            (MAX_WIDTH, round(pilimage.height * MAX_WIDTH / width)), Image.LANCZOS
+        )
+    output: BytesIO = BytesIO()
+    pilimage.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+@functools.lru_cache(maxsize=None)
+def _vision_client(service_file: str) -> vision.ImageAnnotatorClient:
+    # The client holds a gRPC channel, which is thread safe, so one is shared by every job
+    return vision.ImageAnnotatorClient(
+        credentials=service_account.Credentials.from_service_account_file(service_file)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _pattern_lookups() -> Dict[str, Dict[str, str]]:
+    # Only ever read, so one copy is shared by every job
+    with open(os.path.join(os.path.dirname(PogoOCR.__file__), "pattern_lookups.json"), "r") as f:
+        return json.load(f)
+
+
+class ProfileImage(PogoOCR.ProfileSelf):
+    """A :class:`PogoOCR.ProfileSelf` read from bytes in memory, rather than fetched from a URL.
+
+    PogoOCR's constructors aren't called, as they'd create a Vision client for every image. The
+    attributes they set are set here instead, with the shared client.
+    """
+
+    def __init__(self, service_file: str, content: bytes) -> None:
+        self.google: vision.ImageAnnotatorClient = _vision_client(service_file)
+        self.image: types.Image = types.Image(content=content)
+        self.locale: Locale = Locale.parse("en")
+        self.numeric_locale: Dict[str, str] = {}
+        self.pattern_lookups: Dict[str, Dict[str, str]] = _pattern_lookups()
+
+
+class OCRPool:
+    """Runs PogoOCR's blocking calls in a dedicated thread pool.
+
+    :meth:`PogoOCR.ProfileSelf.get_text` waits on Google Vision with blocking IO, and preparing
+    the image is CPU bound, so neither may run on the event loop.
+    """
+
+    def __init__(self, workers: int, timeout: float) -> None:
+        self.workers: int = workers
+        self.timeout: float = timeout
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="tdx-ocr"
+        )
+
+    def resize(self, workers: int) -> None:
+        """Replace the pool with one of ``workers`` threads. Jobs already running will finish."""
+        old_executor: ThreadPoolExecutor = self.executor
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tdx-ocr")
+        old_executor.shutdown(wait=False)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run ``func`` in the pool, raising :class:`asyncio.TimeoutError` after ``timeout`` seconds.
+
+        A job that times out can't be interrupted, so its thread stays busy until it returns.
+        """
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs)),
+            timeout=self.timeout,
+        )
+
+    @staticmethod
+    def _recognise(image: bytes) -> OCRResult:
+        ocr: Optional[PogoOCR.ProfileSelf] = None
+        try:
+            ocr = ProfileImage(POGOOCR_TOKEN_PATH, content=prepare(image))
+            ocr.get_text()
+            return OCRResult.from_ocr(ocr)
+        except Exception as e:
+            text_found: list = getattr(ocr, "text_found", None) or []
+            raise OCRFailed(str(text_found[0].description) if text_found else None) from e
+
+    async def recognise(self, image: bytes) -> OCRResult:
+        """Prepare and read the profile screenshot ``image`` as a single job
+
+        Raises
+        ------
+        OCRFailed
+            PogoOCR raised an exception. The original is chained as ``__cause__``.
+        asyncio.TimeoutError
+            The job took longer than ``timeout`` seconds.
+        """
+        return await self.run(self._recognise, image)
+
+
+def dhash(image: bytes, hash_size: int = 16) -> int:
+    """A difference hash of ``image``, which survives re-encoding and resizing"""
+    with Image.open(BytesIO(image)) as pilimage:
+        pixels: List[int] = list(
+            pilimage.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata()
+        )
+    value: int = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left: int = pixels[row * (hash_size + 1) + col]
+            right: int = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+class OCRCacheKey(NamedTuple):
+    digest: str
+    dhash: Optional[int] = None
+
+
+class OCRCache:
+    """Remembers what OCR read from each screenshot, so the same image is never paid for twice.
+
+    Results are stored as JSON files in ``path``, named by the SHA-256 of the image bytes.
+    Entries older than ``max_age`` seconds are dropped when read, and the oldest are dropped once
+    there are more than ``max_entries``.
+
+    With ``perceptual`` set, a miss on the exact hash falls back to a difference hash of the
+    image, so a re-encoded copy of a screenshot still matches. Two screenshots of the same profile
+    taken days apart can differ by only a few digits, so keep ``max_distance`` small.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: int,
+        max_age: float,
+        perceptual: bool = False,
+        max_distance: int = 2,
+    ) -> None:
+        self.path: Path = path
+        self.max_entries: int = max_entries
+        self.max_age: float = max_age
+        self.perceptual: bool = perceptual
+        self.max_distance: int = max_distance
+        # digest -> (stored_at, dhash), oldest first
+        self._index: "OrderedDict[str, Tuple[float, Optional[int]]]" = OrderedDict()
+        self.hits: int = 0
+        self.near_hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups: int = self.hits + self.near_hits + self.misses
+        return (self.hits + self.near_hits) / lookups if lookups else 0.0
+
+    def _file(self, digest: str, dhash: Optional[int]) -> Path:
+        if dhash is None:
+            return self.path / f"{digest}.json"
+        return self.path / f"{digest}-{dhash:x}.json"
+
+    def _load(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        entries: List[Tuple[float, str, Optional[int]]] = []
+        for file in self.path.glob("*.json"):
+            digest, separator, dhash = file.stem.partition("-")
+            entries.append((file.stat().st_mtime, digest, int(dhash, 16) if dhash else None))
+        self._index.clear()
+        for stored_at, digest, dhash in sorted(entries):
+            self._index[digest] = (stored_at, dhash)
+
+    async def load(self) -> None:
+        """Build the index from the files already on disk"""
+        await asyncio.get_running_loop().run_in_executor(None, self._load)
+        await self.shrink()
+
+    async def key(self, image: bytes) -> OCRCacheKey:
+        digest: str = hashlib.sha256(image).hexdigest()
+        if not self.perceptual:
+            return OCRCacheKey(digest)
+        try:
+            value: int = await asyncio.get_running_loop().run_in_executor(None, dhash, image)
+        except (OSError, ValueError):
+            logger.warning("Couldn't compute a perceptual hash for %s", digest, exc_info=True)
+            return OCRCacheKey(digest)
+        return OCRCacheKey(digest, value)
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.time() - stored_at > self.max_age
+
+    def _nearest(self, value: int) -> Optional[str]:
+        best: Optional[str] = None
+        best_distance: int = self.max_distance + 1
+        for digest, (stored_at, other) in self._index.items():
+            if other is None or self._expired(stored_at):
+                continue
+            distance: int = bin(value ^ other).count("1")
+            if distance < best_distance:
+                best, best_distance = digest, distance
+        return best
+
+    def _read(self, file: Path) -> Optional[OCRResult]:
+        try:
+            with file.open(encoding="utf-8") as f:
+                return OCRResult.from_json(json.load(f))
+        except (OSError, ValueError, TypeError):
+            logger.warning("Couldn't read cached OCR result %s", file.name, exc_info=True)
+            return None
+
+    def _write(self, file: Path, result: OCRResult) -> None:
+        temp: Path = file.with_suffix(".tmp")
+        with temp.open("w", encoding="utf-8") as f:
+            json.dump(result.to_json(), f, ensure_ascii=False)
+        os.replace(temp, file)
+
+    def _remove(self, digest: str) -> Path:
+        stored_at, dhash = self._index.pop(digest)
+        return self._file(digest, dhash)
+
+    async def _unlink(self, *files: Path) -> None:
+        def unlink() -> None:
+            for file in files:
+                try:
+                    file.unlink()
+                except FileNotFoundError:
+                    pass
+
+        if files:
+            await asyncio.get_running_loop().run_in_executor(None, unlink)
+
+    async def get(self, key: OCRCacheKey) -> Optional[OCRResult]:
+        """The result stored for ``key``, or the nearest image's in perceptual mode"""
+        digest: Optional[str] = key.digest
+        near: bool = False
+        entry: Optional[Tuple[float, Optional[int]]] = self._index.get(digest)
+        if entry is not None and self._expired(entry[0]):
+            await self._unlink(self._remove(digest))
+            entry = None
+        if entry is None and key.dhash is not None:
+            digest = self._nearest(key.dhash)
+            entry = self._index.get(digest) if digest else None
+            near = True
+        if entry is None:
+            self.misses += 1
+            return None
+
+        result: Optional[OCRResult] = await asyncio.get_running_loop().run_in_executor(
+            None, self._read, self._file(digest, entry[1])
+        )
+        if result is None:
+            await self._unlink(self._remove(digest))
+            self.misses += 1
+            return None
+        if near:
+            self.near_hits += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def set(self, key: OCRCacheKey, result: OCRResult) -> None:
+        files: List[Path] = []
+        if key.digest in self._index:
+            files.append(self._remove(key.digest))
+        file: Path = self._file(key.digest, key.dhash)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, file, result)
+        except OSError:
+            logger.warning("Couldn't cache OCR result %s", file.name, exc_info=True)
+        else:
+            if file in files:
+                files.remove(file)
+            self._index[key.digest] = (time.time(), key.dhash)
+        await self._unlink(*files)
+        await self.shrink()
+
+    async def shrink(self) -> None:
+        """Drop expired entries, then the oldest until there are at most ``max_entries``"""
+        files: List[Path] = []
+        while self._index:
+            digest, (stored_at, dhash) = next(iter(self._index.items()))
+            if len(self._index) <= self.max_entries and not self._expired(stored_at):
+                break
+            files.append(self._remove(digest))
+            self.evictions += 1
+        await self._unlink(*files)
+
+
+class QueueFull(Exception):
+    """Raised when a guild already has as many OCR jobs waiting as it's allowed"""
+
+    pass
+
+
+@dataclass
+class OCRJob:
+    """A screenshot waiting to be read.
+
+    ``run`` is awaited when a worker picks the job up. If the job has waited past ``deadline``
+    (by :func:`time.monotonic`), ``shed`` is awaited instead.
+    """
+
+    guild_id: Optional[int]
+    run: Callable[[], Awaitable[None]]
+    shed: Callable[[], Awaitable[None]]
+    deadline: float = field(default=float("inf"))
+
+
+class OCRQueue:
+    """Queues OCR jobs per guild, serving guilds round-robin with ``workers`` concurrent jobs.
+
+    The queue only lives in memory. Jobs waiting when the cog unloads are dropped.
+    """
+
+    def __init__(self, workers: int, max_depth: int, max_wait: float) -> None:
+        self.workers: int = workers
+        self.max_depth: int = max_depth
+        self.max_wait: float = max_wait
+        self._queues: Dict[Optional[int], Deque[OCRJob]] = {}
+        self._order: Deque[Optional[int]] = deque()
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.active: int = 0
+        self.processed: int = 0
+        self.shed: int = 0
+        self.rejected: int = 0
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def saturated(self) -> bool:
+        return self.active + len(self) >= self.workers
+
+    def depth(self, guild_id: Optional[int]) -> int:
+        return len(self._queues.get(guild_id, ()))
+
+    def depths(self) -> Dict[Optional[int], int]:
+        return {guild_id: len(queue) for guild_id, queue in self._queues.items()}
+
+    def is_full(self, guild_id: Optional[int]) -> bool:
+        return self.depth(guild_id) >= self.max_depth
+
+    def position(self, guild_id: Optional[int]) -> int:
+        """The approximate position a new job for ``guild_id`` would take in the queue"""
+        depth: int = self.depth(guild_id)
+        # With round-robin, a job waits behind the jobs in its own queue,
+        # and at most one job per turn from each other guild
+        return (
+            depth
+            + sum(
+                min(len(other), depth + 1)
+                for other_guild_id, other in self._queues.items()
+                if other_guild_id != guild_id
+            )
+            + 1
+        )
+
+    def start(self) -> None:
+        self.resize(self.workers)
+
+    def resize(self, workers: int) -> None:
+        """Start more workers, or let the extra ones stop once they finish their current job"""
+        self.workers = workers
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for _ in range(workers - len(self._tasks)):
+            self._tasks.append(asyncio.create_task(self._worker()))
+        # Wake idle workers so any surplus ones notice
+        self._wakeup.set()
+
+    def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+    def submit(self, job: OCRJob) -> int:
+        """Add ``job`` to its guild's queue and return its approximate position in the queue.
+
+        Raises
+        ------
+        QueueFull
+            The guild already has ``max_depth`` jobs waiting.
+        """
+        if self.is_full(job.guild_id):
+            self.rejected += 1
+            raise QueueFull
+
+        if job.deadline == float("inf"):
+            job.deadline = time.monotonic() + self.max_wait
+
+        position: int = self.position(job.guild_id)
+        if job.guild_id not in self._queues:
+            self._queues[job.guild_id] = deque()
+            self._order.append(job.guild_id)
+        self._queues[job.guild_id].append(job)
+        self._wakeup.set()
+        return position
+
+    def _next(self) -> Optional[OCRJob]:
+        if not self._order:
+            return None
+        guild_id: Optional[int] = self._order.popleft()
+        queue: Deque[OCRJob] = self._queues[guild_id]
+        job: OCRJob = queue.popleft()
+        if queue:
+            self._order.append(guild_id)
+        else:
+            del self._queues[guild_id]
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            if len(self._tasks) > self.workers:
+                self._tasks.remove(asyncio.current_task())
+                return
+
+            job: Optional[OCRJob] = self._next()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self.active += 1
+            try:
+                if time.monotonic() > job.deadline:
+                    self.shed += 1
+                    await job.shed()
+                else:
+                    await job.run()
+                    self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("OCR job for guild %s failed", job.guild_id)
+            finally:
+                self.active -= 1
@@ -11,7 +11,7 @@ from trainerdex.update import Update
 from . import converters
 from .abc import MixinMeta
 from .embeds import ProfileCard
-from .utils import loading
+from .utils import ProgressMessage, loading
 
 logger: logging.Logger = logging.getLogger(__name__)
 _: Translator = Translator("TrainerDex", __file__)
@@ -33,7 +33,7 @@ class Post(MixinMeta):
         async with ctx.typing():
             try:
                 trainer: Trainer = await converters.TrainerConverter().convert(
-                    ctx, ctx.author, cli=self.client
+                    ctx, ctx.author, cli=self.client, cache=self.trainer_cache
                 )
             except commands.BadArgument:
                 await ctx.send(cf.error("No profile found."))
@@ -60,6 +60,10 @@ class Post(MixinMeta):
                     update_time=ctx.message.created_at,
                     submission_date=datetime.datetime.now(tz=datetime.timezone.utc),
                 )
+                self.leaderboard_cache.invalidate(
+                    trainer.old_id, {"gymbadges_gold": value}, guild=ctx.guild
+                )
+                self.trainer_cache.invalidate(trainer)
             else:
                 message: Message = await ctx.send(
                     loading(_("Updating a post from earlier today…"))
@@ -67,27 +71,30 @@ class Post(MixinMeta):
                 await update.edit(
                     **{"update_time": ctx.message.created_at, "gymbadges_gold": value}
                 )
+                self.leaderboard_cache.invalidate(
+                    trainer.old_id, {"gymbadges_gold": value}, guild=ctx.guild
+                )
+                self.trainer_cache.invalidate(trainer)
 
             if ctx.guild and not trainer.is_visible:
-                await message.edit(_("Sending in DMs"))
+                await message.edit(content=_("Sending in DMs"))
                 message: Message = await ctx.author.send(content=loading(_("Loading output…")))
 
-            await message.edit(content=loading(_("Loading output…")))
+            progress: ProgressMessage = ProgressMessage(message)
+            await progress.update(content=loading(_("Loading output…")))
             embed: Embed = await ProfileCard(
                 ctx=ctx,
+                settings=self.settings,
                 client=self.client,
                 trainer=trainer,
                 update=update,
                 emoji=self.emoji,
+                leaderboard_cache=self.leaderboard_cache,
             )
-            await message.edit(content=loading(_("Loading output…")))
             await embed.show_progress()
-            await message.edit(
-                content=loading(_("Loading output…")),
-                embed=embed,
-            )
+            await progress.update(embed=embed)
             await embed.add_leaderboard()
             if ctx.guild:
-                await message.edit(embed=embed)
+                await progress.update(embed=embed)
                 await embed.add_guild_leaderboard(ctx.guild)
-            await message.edit(content=None, embed=embed)
+            await progress.finish(content=None, embed=embed)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from io import BytesIO
+from PIL import Image, UnidentifiedImageError
+from typing import Dict, Final, List, Optional, Tuple
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Portrait phone and tablet screenshots, from 4:3 up to the tallest phones
+ASPECT_RATIO: Final[Tuple[float, float]] = (1.2, 2.4)
+MIN_WIDTH: Final[int] = 320
+THUMBNAIL_SIZE: Final[Tuple[int, int]] = (24, 48)
+# A pixel counts as part of the white stats panel if it's bright and nearly grey
+LIGHT_LUMINANCE: Final[int] = 200
+LIGHT_SATURATION: Final[int] = 40
+# Share of the lower half that must be light
+MIN_LIGHT_SHARE: Final[float] = 0.3
+# Share of the image covered by its 8 commonest colours, out of 64
+MIN_PALETTE_SHARE: Final[float] = 0.5
+# Share of the rows in the lower half that must be mostly light
+MIN_PANEL_ROWS: Final[float] = 1 / 3
+
+IMAGE_EXTENSIONS: Final[Tuple[str, ...]] = (".jpeg", ".jpg", ".png")
+
+
+@dataclass
+class Verdict:
+    is_profile: bool
+    reason: Optional[str] = None
+
+
+def _is_light(pixel: Tuple[int, int, int]) -> bool:
+    luminance: float = 0.299 * pixel[0] + 0.587 * pixel[1] + 0.114 * pixel[2]
+    return luminance >= LIGHT_LUMINANCE and max(pixel) - min(pixel) <= LIGHT_SATURATION
+
+
+def screen(image: bytes) -> Verdict:
+    """Decide whether ``image`` could be a Pokémon Go profile screenshot.
+
+    The profile screen is a portrait screenshot with a scene and avatar at the top and a white
+    panel of stats filling most of the bottom half. Only images that clearly aren't are rejected;
+    the thresholds are deliberately loose, as a missed profile costs more than a wasted OCR call.
+    """
+    try:
+        with Image.open(BytesIO(image)) as pilimage:
+            width, height = pilimage.size
+            if width < MIN_WIDTH:
+                return Verdict(False, f"too small ({width}x{height})")
+            aspect_ratio: float = height / width
+            if not ASPECT_RATIO[0] <= aspect_ratio <= ASPECT_RATIO[1]:
+                return Verdict(False, f"wrong shape ({width}x{height})")
+            pilimage.draft("RGB", THUMBNAIL_SIZE)
+            thumbnail: Image.Image = pilimage.convert("RGB").resize(THUMBNAIL_SIZE, Image.BOX)
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        return Verdict(False, f"unreadable ({type(e).__name__})")
+
+    columns, rows = THUMBNAIL_SIZE
+    pixels: List[Tuple[int, int, int]] = list(thumbnail.getdata())
+
+    palette: Counter = Counter((r >> 6, g >> 6, b >> 6) for r, g, b in pixels)
+    palette_share: float = sum(count for _, count in palette.most_common(8)) / len(pixels)
+    if palette_share < MIN_PALETTE_SHARE:
+        return Verdict(False, f"too many colours ({palette_share:.2f})")
+
+    lower_half: List[List[bool]] = [
+        [_is_light(pixel) for pixel in pixels[row * columns : (row + 1) * columns]]
+        for row in range(rows // 2, rows)
+    ]
+    light_share: float = sum(sum(row) for row in lower_half) / (len(lower_half) * columns)
+    if light_share < MIN_LIGHT_SHARE:
+        return Verdict(False, f"no stats panel ({light_share:.2f})")
+
+    panel_rows: float = sum(sum(row) >= columns / 2 for row in lower_half) / len(lower_half)
+    if panel_rows < MIN_PANEL_ROWS:
+        return Verdict(False, f"wrong layout ({panel_rows:.2f})")
+
+    return Verdict(True)
+
+
+@dataclass
+class Evaluation:
+    """How :func:`screen` judged a folder of labelled samples"""
+
+    profiles: int = 0
+    others: int = 0
+    false_negatives: List[Tuple[str, str]] = field(default_factory=list)
+    false_positives: List[str] = field(default_factory=list)
+
+    @property
+    def false_negative_rate(self) -> float:
+        return len(self.false_negatives) / self.profiles if self.profiles else 0.0
+
+    @property
+    def rejection_rate(self) -> float:
+        return (self.others - len(self.false_positives)) / self.others if self.others else 0.0
+
+
+class Prefilter:
+    """Screens images on a thread before they're queued for OCR, counting what it rejects"""
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled: bool = enabled
+        self.checked: int = 0
+        self.rejected: int = 0
+        self.reasons: Dict[str, int] = Counter()
+
+    async def check(self, image: bytes) -> Verdict:
+        if not self.enabled:
+            return Verdict(True)
+        verdict: Verdict = await asyncio.get_running_loop().run_in_executor(None, screen, image)
+        self.checked += 1
+        if not verdict.is_profile:
+            self.rejected += 1
+            self.reasons[verdict.reason.split(" (")[0]] += 1
+            logger.debug("Skipping OCR, image rejected: %s", verdict.reason)
+        return verdict
+
+    @staticmethod
+    def _evaluate(folder: str) -> Evaluation:
+        evaluation: Evaluation = Evaluation()
+        for label in ("profile", "other"):
+            directory: str = os.path.join(folder, label)
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                with open(os.path.join(directory, filename), "rb") as f:
+                    verdict: Verdict = screen(f.read())
+                if label == "profile":
+                    evaluation.profiles += 1
+                    if not verdict.is_profile:
+                        evaluation.false_negatives.append((filename, verdict.reason))
+                else:
+                    evaluation.others += 1
+                    if verdict.is_profile:
+                        evaluation.false_positives.append(filename)
+        return evaluation
+
+    async def evaluate(self, folder: str) -> Evaluation:
+        """Screen the samples in ``folder``'s ``profile`` and ``other`` subfolders"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._evaluate, folder)
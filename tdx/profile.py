@@ -2,22 +2,23 @@ import datetime
 import json
 import logging
 import re
-from discord.ext.commands.context import Context
 from discord.message import Message
 from redbot.core import commands
 from redbot.core.i18n import Translator
 from redbot.core.utils import chat_formatting as cf
 from trainerdex.trainer import Trainer
-from typing import Optional
+from typing import Final, Match, Optional, Pattern
 
 from . import converters
 from .abc import MixinMeta
 from .embeds import ProfileCard
-from .utils import loading
+from .utils import ProgressMessage, loading
 
 logger: logging.Logger = logging.getLogger(__name__)
 _: Translator = Translator("TrainerDex", __file__)
 
+SET_TRAINER_CODE_PATTERN: Final[Pattern[str]] = re.compile(r"^\$(?:stc|set-trainer-code)\s(.*)$")
+
 
 class Profile(MixinMeta):
     @commands.command(name="profile", aliases=["trainer", "progress", "trnr", "whois"])
@@ -29,32 +30,42 @@ class Profile(MixinMeta):
         """Find a profile given a username."""
 
         async with ctx.typing():
-            try:
-                logger.debug("searching for trainer by discord uid: %s", ctx.author.id)
-                author_profile: Trainer = await converters.TrainerConverter().convert(
-                    ctx, ctx.author, cli=self.client
-                )
-            except commands.BadArgument:
-                author_profile = None
-
             message: Message = await ctx.send(loading(_("Searching for profile…")))
 
             if nickname is None:
-                trainer = author_profile
+                try:
+                    logger.debug("searching for trainer by discord uid: %s", ctx.author.id)
+                    trainer: Trainer = await converters.TrainerConverter().convert(
+                        ctx, ctx.author, cli=self.client, cache=self.trainer_cache
+                    )
+                except commands.BadArgument:
+                    trainer = None
+                is_author: bool = True
             else:
                 try:
                     logger.debug("searching for trainer by username: %s", nickname)
                     trainer: Trainer = await converters.TrainerConverter().convert(
-                        ctx, nickname, cli=self.client
+                        ctx, nickname, cli=self.client, cache=self.trainer_cache
                     )
                 except commands.BadArgument:
                     await message.edit(content=cf.warning(_("Profile not found.")))
                     return
+                # The author only needs looking up if the profile found is hidden
+                is_author: bool = False
+
+            if trainer and not (trainer.is_visible or is_author):
+                try:
+                    logger.debug("searching for trainer by discord uid: %s", ctx.author.id)
+                    is_author: bool = trainer == await converters.TrainerConverter().convert(
+                        ctx, ctx.author, cli=self.client, cache=self.trainer_cache
+                    )
+                except commands.BadArgument:
+                    pass
 
             if trainer:
                 if trainer.is_visible:
                     await message.edit(content=loading(_("Found profile. Loading…")))
-                elif trainer == author_profile:
+                elif is_author:
                     if ctx.guild:
                         await message.edit(content=_("Sending in DMs"))
                         message: Message = await ctx.author.send(
@@ -69,17 +80,23 @@ class Profile(MixinMeta):
                 await message.edit(content=cf.warning(_("Profile not found.")))
                 return
 
+            progress: ProgressMessage = ProgressMessage(message)
             embed: ProfileCard = await ProfileCard(
-                ctx=ctx, client=self.client, trainer=trainer, emoji=self.emoji
+                ctx=ctx,
+                settings=self.settings,
+                client=self.client,
+                trainer=trainer,
+                emoji=self.emoji,
+                leaderboard_cache=self.leaderboard_cache,
             )
-            await message.edit(content=loading(_("Checking progress…")), embed=embed)
+            await progress.update(content=loading(_("Checking progress…")), embed=embed)
             await embed.show_progress()
-            await message.edit(content=loading(_("Loading leaderboards…")), embed=embed)
+            await progress.update(content=loading(_("Loading leaderboards…")), embed=embed)
             await embed.add_leaderboard()
             if ctx.guild:
-                await message.edit(embed=embed)
+                await progress.update(embed=embed)
                 await embed.add_guild_leaderboard(ctx.guild)
-            await message.edit(content=None, embed=embed)
+            await progress.finish(content=None, embed=embed)
 
     @commands.command(name="trainercode", aliases=["friendcode", "trainer-code", "friend-code"])
     async def get_trainer_code(
@@ -93,7 +110,7 @@ class Profile(MixinMeta):
             try:
                 logger.debug("searching for trainer by discord uid: %s", ctx.author.id)
                 author_profile = await converters.TrainerConverter().convert(
-                    ctx, ctx.author, cli=self.client
+                    ctx, ctx.author, cli=self.client, cache=self.trainer_cache
                 )
             except commands.BadArgument:
                 author_profile = None
@@ -106,7 +123,7 @@ class Profile(MixinMeta):
                 try:
                     logger.debug("searching for trainer by username: %s", nickname)
                     trainer: Trainer = await converters.TrainerConverter().convert(
-                        ctx, nickname, cli=self.client
+                        ctx, nickname, cli=self.client, cache=self.trainer_cache
                     )
                 except commands.BadArgument:
                     await message.edit(content=cf.warning(_("Profile not found.")))
@@ -131,7 +148,7 @@ class Profile(MixinMeta):
             async with ctx.typing():
                 try:
                     trainer = await converters.TrainerConverter().convert(
-                        ctx, ctx.author, cli=self.client
+                        ctx, ctx.author, cli=self.client, cache=self.trainer_cache
                     )
                 except commands.BadArgument:
                     await ctx.send(cf.error("No profile found."))
@@ -165,7 +182,7 @@ class Profile(MixinMeta):
         async with ctx.typing():
             try:
                 trainer = await converters.TrainerConverter().convert(
-                    ctx, ctx.author, cli=self.client
+                    ctx, ctx.author, cli=self.client, cache=self.trainer_cache
                 )
             except commands.BadArgument:
                 await ctx.send(cf.error("No profile found."))
@@ -191,6 +208,7 @@ class Profile(MixinMeta):
                     return
 
                 await trainer.edit(start_date=start_date)
+                self.trainer_cache.invalidate(trainer)
                 await ctx.tick()
                 await ctx.send(
                     _("`{key}` set to {value}").format(key="trainer.start_date", value=start_date),
@@ -210,7 +228,7 @@ class Profile(MixinMeta):
         async with ctx.typing():
             try:
                 trainer = await converters.TrainerConverter().convert(
-                    ctx, ctx.author, cli=self.client
+                    ctx, ctx.author, cli=self.client, cache=self.trainer_cache
                 )
             except commands.BadArgument:
                 await ctx.send(cf.error("No profile found."))
@@ -218,6 +236,7 @@ class Profile(MixinMeta):
         if value is not None:
             async with ctx.typing():
                 await trainer.edit(is_visible=value)
+                self.trainer_cache.invalidate(trainer)
                 await ctx.tick()
                 await ctx.send(
                     _("`{key}` set to {value}").format(key="trainer.is_visible", value=value),
@@ -245,7 +264,7 @@ class Profile(MixinMeta):
         async with ctx.typing():
             try:
                 trainer = await converters.TrainerConverter().convert(
-                    ctx, ctx.author, cli=self.client
+                    ctx, ctx.author, cli=self.client, cache=self.trainer_cache
                 )
             except commands.BadArgument:
                 if no_error:
@@ -255,6 +274,7 @@ class Profile(MixinMeta):
         if value:
             async with ctx.typing():
                 await trainer.edit(trainer_code=value)
+                self.trainer_cache.invalidate(trainer)
                 await ctx.tick()
                 await ctx.send(
                     _("{trainer.nickname}'s Trainer Code set to {trainer.trainer_code}").format(
@@ -262,16 +282,6 @@ class Profile(MixinMeta):
                     )
                 )
 
-    @commands.Cog.listener("on_message_without_command")
-    async def pokenav_set_trainer_code(self, message: Message) -> None:
-        ctx: Context = await self.bot.get_context(message)
-        del message
-        if not (await self.bot.message_eligible_as_command(ctx.message)):
-            return
-
-        if await self.bot.cog_disabled_in_guild(self, ctx.guild):
-            return
-
-        match = re.match(r"^\$(?:stc|set-trainer-code)\s(.*)$", ctx.message.content)
-        if match:
-            return await self._set_trainer_code(ctx, True, match[1])
+    async def pokenav_set_trainer_code(self, ctx: commands.Context, match: Match[str]) -> None:
+        """Handle PokeNav's `$stc` command, called by the cog's message dispatcher"""
+        return await self._set_trainer_code(ctx, True, match[1])
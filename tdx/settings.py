@@ -1,16 +1,19 @@
+import copy
 import json
 import logging
 from discord.ext.alternatives import silent_delete
+from discord.guild import Guild
 from discord.message import Message
 from discord.role import Role
 from redbot.core import checks, commands
 from redbot.core.commands.converter import Literal
 from redbot.core.i18n import Translator
 from redbot.core.utils import chat_formatting as cf
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from .abc import MixinMeta
 from .datatypes import ChannelConfig, GuildConfig, StoredRoles
+from .leaderboard import MAX_ALLIANCE
 
 logger: logging.Logger = logging.getLogger(__name__)
 _ = Translator("TrainerDex", __file__)
@@ -23,6 +26,7 @@ class Settings(MixinMeta):
     async def quickstart(self, ctx: commands.Context) -> None:
         await ctx.tick()
         message: Message = await ctx.send(_("Looking for team roles…"))
+        values: Dict[str, int] = {}
 
         try:
             mystic_role: Role = min(
@@ -31,7 +35,7 @@ class Settings(MixinMeta):
         except ValueError:
             mystic_role = None
         if mystic_role:
-            await self.config.guild(ctx.guild).mystic_role.set(mystic_role.id)
+            values["mystic_role"] = mystic_role.id
             await ctx.send(
                 _("`{key}` set to {value}").format(key="mystic_role", value=mystic_role),
                 delete_after=30,
@@ -44,7 +48,7 @@ class Settings(MixinMeta):
         except ValueError:
             valor_role = None
         if valor_role:
-            await self.config.guild(ctx.guild).valor_role.set(valor_role.id)
+            values["valor_role"] = valor_role.id
             await ctx.send(
                 _("`{key}` set to {value}").format(key="valor_role", value=valor_role),
                 delete_after=30,
@@ -57,7 +61,7 @@ class Settings(MixinMeta):
         except ValueError:
             instinct_role = None
         if instinct_role:
-            await self.config.guild(ctx.guild).instinct_role.set(instinct_role.id)
+            values["instinct_role"] = instinct_role.id
             await ctx.send(
                 _("`{key}` set to {value}").format(key="instinct_role", value=instinct_role),
                 delete_after=30,
@@ -77,15 +81,17 @@ class Settings(MixinMeta):
         except ValueError:
             tl40_role = None
         if tl40_role:
-            await self.config.guild(ctx.guild).tl40_role.set(tl40_role.id)
+            values["tl40_role"] = tl40_role.id
             await ctx.send(
                 _("`{key}` set to {value}").format(key="tl40_role", value=tl40_role),
                 delete_after=30,
             )
 
+        if values:
+            await self.settings.set_guild(ctx.guild, **values)
         await message.delete(silent=True)
 
-        guild_config: GuildConfig = GuildConfig(**(await self.config.guild(ctx.guild).all()))
+        guild_config: GuildConfig = self.settings.guild(ctx.guild)
         output: str = json.dumps(guild_config.__dict__, indent=2, ensure_ascii=False)
         await ctx.send(cf.box(output, "json"))
 
@@ -99,7 +105,7 @@ class Settings(MixinMeta):
     @checks.bot_in_a_guild()
     async def tdxset__guild(self, ctx: commands.Context) -> None:
         if ctx.invoked_subcommand is None:
-            guild_config: GuildConfig = GuildConfig(**(await self.config.guild(ctx.guild).all()))
+            guild_config: GuildConfig = self.settings.guild(ctx.guild)
             output: str = json.dumps(guild_config.__dict__, indent=2, ensure_ascii=False)
             await ctx.send(cf.box(output, "json"))
 
@@ -112,7 +118,7 @@ class Settings(MixinMeta):
         This is useful for granting users access to the rest of the server.
         """
         if value is not None:
-            await self.config.guild(ctx.guild).assign_roles_on_join.set(value)
+            await self.settings.set_guild(ctx.guild, assign_roles_on_join=value)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="guild.assign_roles_on_join", value=value),
@@ -120,7 +126,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: bool = await self.config.guild(ctx.guild).assign_roles_on_join()
+            value: bool = self.settings.guild(ctx.guild).assign_roles_on_join
             await ctx.send(
                 _("`{key}` is {value}").format(key="guild.assign_roles_on_join", value=value)
             )
@@ -134,7 +140,7 @@ class Settings(MixinMeta):
         This is useful for ensuring players can be easily identified.
         """
         if value is not None:
-            await self.config.guild(ctx.guild).set_nickname_on_join.set(value)
+            await self.settings.set_guild(ctx.guild, set_nickname_on_join=value)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="guild.set_nickname_on_join", value=value),
@@ -142,7 +148,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: bool = await self.config.guild(ctx.guild).set_nickname_on_join()
+            value: bool = self.settings.guild(ctx.guild).set_nickname_on_join
             await ctx.send(
                 _("`{key}` is {value}").format(key="guild.set_nickname_on_join", value=value)
             )
@@ -156,7 +162,7 @@ class Settings(MixinMeta):
         This is useful for setting levels in their name.
         """
         if value is not None:
-            await self.config.guild(ctx.guild).set_nickname_on_update.set(value)
+            await self.settings.set_guild(ctx.guild, set_nickname_on_update=value)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(
@@ -166,7 +172,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: bool = await self.config.guild(ctx.guild).set_nickname_on_update()
+            value: bool = self.settings.guild(ctx.guild).set_nickname_on_update
             await ctx.send(
                 _("`{key}` is {value}").format(key="guild.set_nickname_on_update", value=value)
             )
@@ -186,28 +192,28 @@ class Settings(MixinMeta):
             [p]tdxset guild roles_to_assign_on_approval remove @Guest
                 Remove these roles from users when they are approved
         """
-        stored_roles: StoredRoles = await self.config.guild(
-            ctx.guild
-        ).roles_to_assign_on_approval()
+        stored_roles: StoredRoles = copy.deepcopy(
+            self.settings.guild(ctx.guild).roles_to_assign_on_approval
+        )
 
         if action == "add":
             if roles:
                 stored_roles["add"] = [x.id for x in ctx.message.role_mentions]
-                await self.config.guild(ctx.guild).roles_to_assign_on_approval.set(stored_roles)
+                await self.settings.set_guild(ctx.guild, roles_to_assign_on_approval=stored_roles)
                 await ctx.tick()
-                stored_roles: StoredRoles = await self.config.guild(
+                stored_roles: StoredRoles = self.settings.guild(
                     ctx.guild
-                ).roles_to_assign_on_approval()
+                ).roles_to_assign_on_approval
                 stored_roles_json: str = json.dumps(stored_roles, indent=2, ensure_ascii=False)
                 await ctx.send(cf.box(stored_roles_json, "json"), delete_after=30)
         elif action == "remove":
             if roles:
                 stored_roles["remove"] = [x.id for x in ctx.message.role_mentions]
-                await self.config.guild(ctx.guild).roles_to_assign_on_approval.set(stored_roles)
+                await self.settings.set_guild(ctx.guild, roles_to_assign_on_approval=stored_roles)
                 await ctx.tick()
-                stored_roles: StoredRoles = await self.config.guild(
+                stored_roles: StoredRoles = self.settings.guild(
                     ctx.guild
-                ).roles_to_assign_on_approval()
+                ).roles_to_assign_on_approval
                 stored_roles_json: str = json.dumps(stored_roles, indent=2, ensure_ascii=False)
                 await ctx.send(cf.box(stored_roles_json, "json"), delete_after=30)
         else:
@@ -215,12 +221,79 @@ class Settings(MixinMeta):
             stored_roles_json: str = json.dumps(stored_roles, indent=2, ensure_ascii=False)
             await ctx.send(cf.box(stored_roles_json, "json"))
 
+    @tdxset__guild.command(name="alliance")
+    async def tdxset__guild__alliance(
+        self,
+        ctx: commands.Context,
+        action: Optional[Literal["add", "remove"]] = None,
+        *guild_ids: int,
+    ) -> None:
+        """Which servers to combine leaderboards with in `[p]leaderboard alliance`
+
+        A server is only included once it has added this server too.
+
+        Usage:
+            [p]tdxset guild alliance add 133364271271018496 ...
+                Combine leaderboards with these servers
+            [p]tdxset guild alliance remove 133364271271018496
+                Stop combining leaderboards with these servers
+        """
+        alliance: List[int] = list(self.settings.guild(ctx.guild).alliance)
+
+        if action == "add" and guild_ids:
+            unknown: List[int] = [
+                x for x in guild_ids if x == ctx.guild.id or self.bot.get_guild(x) is None
+            ]
+            if unknown:
+                await ctx.send(
+                    cf.warning(_("I'm not in these servers: {guilds}")).format(
+                        guilds=cf.humanize_list([str(x) for x in unknown])
+                    )
+                )
+                return
+            alliance.extend(x for x in guild_ids if x not in alliance)
+            if len(alliance) > MAX_ALLIANCE:
+                await ctx.send(
+                    cf.warning(
+                        _("An alliance can't have more than {count} other servers.")
+                    ).format(count=MAX_ALLIANCE)
+                )
+                return
+        elif action == "remove" and guild_ids:
+            alliance = [x for x in alliance if x not in guild_ids]
+        else:
+            await ctx.send_help()
+            await ctx.send(cf.box(self.describe_alliance(ctx.guild, alliance)))
+            return
+
+        await self.settings.set_guild(ctx.guild, alliance=alliance)
+        await ctx.tick()
+        await ctx.send(cf.box(self.describe_alliance(ctx.guild, alliance)), delete_after=30)
+
+    def describe_alliance(self, guild: Guild, alliance: List[int]) -> str:
+        if not alliance:
+            return _("No servers")
+        lines: List[str] = []
+        for guild_id in alliance:
+            other: Optional[Guild] = self.bot.get_guild(guild_id)
+            if other is None:
+                lines.append(_("{id} - bot is no longer in this server").format(id=guild_id))
+            elif guild.id in self.settings.guild(other).alliance:
+                lines.append(f"{other.name} ({guild_id})")
+            else:
+                lines.append(
+                    _("{name} ({id}) - waiting for them to add this server").format(
+                        name=other.name, id=guild_id
+                    )
+                )
+        return "\n".join(lines)
+
     @tdxset__guild.command(name="mystic_role", aliases=["mystic"])
     async def tdxset__guild__mystic_role(
         self, ctx: commands.Context, value: Optional[Role] = None
     ) -> None:
         if value is not None:
-            await self.config.guild(ctx.guild).mystic_role.set(value.id)
+            await self.settings.set_guild(ctx.guild, mystic_role=value.id)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="guild.mystic_role", value=value),
@@ -228,7 +301,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: int = await self.config.guild(ctx.guild).mystic_role()
+            value: int = self.settings.guild(ctx.guild).mystic_role
             await ctx.send(
                 _("`{key}` is {value}").format(
                     key="guild.mystic_role", value=ctx.guild.get_role(value)
@@ -240,7 +313,7 @@ class Settings(MixinMeta):
         self, ctx: commands.Context, value: Optional[Role] = None
     ) -> None:
         if value is not None:
-            await self.config.guild(ctx.guild).valor_role.set(value.id)
+            await self.settings.set_guild(ctx.guild, valor_role=value.id)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="guild.valor_role", value=value),
@@ -248,7 +321,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: int = await self.config.guild(ctx.guild).valor_role()
+            value: int = self.settings.guild(ctx.guild).valor_role
             await ctx.send(
                 _("`{key}` is {value}").format(
                     key="guild.valor_role", value=ctx.guild.get_role(value)
@@ -260,7 +333,7 @@ class Settings(MixinMeta):
         self, ctx: commands.Context, value: Optional[Role] = None
     ) -> None:
         if value is not None:
-            await self.config.guild(ctx.guild).instinct_role.set(value.id)
+            await self.settings.set_guild(ctx.guild, instinct_role=value.id)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="guild.instinct_role", value=value),
@@ -268,7 +341,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: int = await self.config.guild(ctx.guild).instinct_role()
+            value: int = self.settings.guild(ctx.guild).instinct_role
             await ctx.send(
                 _("`{key}` is {value}").format(
                     key="guild.instinct_role", value=ctx.guild.get_role(value)
@@ -280,7 +353,7 @@ class Settings(MixinMeta):
         self, ctx: commands.Context, value: Optional[Role] = None
     ) -> None:
         if value is not None:
-            await self.config.guild(ctx.guild).tl40_role.set(value.id)
+            await self.settings.set_guild(ctx.guild, tl40_role=value.id)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="guild.tl40_role", value=value),
@@ -288,7 +361,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: int = await self.config.guild(ctx.guild).tl40_role()
+            value: int = self.settings.guild(ctx.guild).tl40_role
             await ctx.send(
                 _("`{key}` is {value}").format(
                     key="guild.tl40_role", value=ctx.guild.get_role(value)
@@ -306,7 +379,7 @@ class Settings(MixinMeta):
         if value is not None:
             if value == "None":
                 value = None
-            await self.config.guild(ctx.guild).introduction_note.set(value)
+            await self.settings.set_guild(ctx.guild, introduction_note=value)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="guild.introduction_note", value=value),
@@ -314,7 +387,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: str = await self.config.guild(ctx.guild).introduction_note()
+            value: str = self.settings.guild(ctx.guild).introduction_note
             await ctx.send(
                 _("`{key}` is {value}").format(key="guild.introduction_note", value=value)
             )
@@ -324,9 +397,7 @@ class Settings(MixinMeta):
     @checks.bot_in_a_guild()
     async def tdxset__channel(self, ctx: commands.Context) -> None:
         if ctx.invoked_subcommand is None:
-            channel_config: ChannelConfig = ChannelConfig(
-                **(await self.config.channel(ctx.channel).all())
-            )
+            channel_config: ChannelConfig = self.settings.channel(ctx.channel)
             output: str = json.dumps(channel_config.__dict__, indent=2, ensure_ascii=False)
             await ctx.send(cf.box(output, "json"))
 
@@ -336,7 +407,7 @@ class Settings(MixinMeta):
     ) -> None:
         """Set if this channel should accept OCR commands."""
         if value is not None:
-            await self.config.channel(ctx.channel).profile_ocr.set(value)
+            await self.settings.set_channel(ctx.channel, profile_ocr=value)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(
@@ -346,7 +417,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: bool = await self.config.channel(ctx.channel).profile_ocr()
+            value: bool = self.settings.channel(ctx.channel).profile_ocr
             await ctx.send(
                 _("`{key}` is {value}").format(
                     key=f"channel[{ctx.channel.id}].profile_ocr", value=value
@@ -359,7 +430,7 @@ class Settings(MixinMeta):
         if value is not None:
             if value == "None":
                 value = None
-            await self.config.notice.set(value)
+            await self.settings.set_global(notice=value)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="notice", value=value),
@@ -367,7 +438,7 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: str = await self.config.notice()
+            value: str = self.settings.global_config.notice
             await ctx.send(_("`{key}` is {value}").format(key="notice", value=value))
 
     @tdxset.command(name="footer")
@@ -376,7 +447,7 @@ class Settings(MixinMeta):
         if value is not None:
             if value == "None":
                 value = None
-            await self.config.embed_footer.set(value)
+            await self.settings.set_global(embed_footer=value)
             await ctx.tick()
             await ctx.send(
                 _("`{key}` set to {value}").format(key="embed_footer", value=value),
@@ -384,5 +455,444 @@ class Settings(MixinMeta):
             )
         else:
             await ctx.send_help()
-            value: str = await self.config.embed_footer()
+            value: str = self.settings.global_config.embed_footer
             await ctx.send(_("`{key}` is {value}").format(key="embed_footer", value=value))
+
+    @tdxset.command(name="leaderboard_concurrency")
+    @checks.is_owner()
+    async def tdxset__leaderboard_concurrency(
+        self, ctx: commands.Context, value: Optional[int] = None
+    ) -> None:
+        """How many leaderboards a profile card may download at the same time"""
+        if value is not None:
+            if value < 1:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="leaderboard_concurrency", error=_("it must be at least 1")
+                    )
+                )
+                return
+            await self.settings.set_global(leaderboard_concurrency=value)
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="leaderboard_concurrency", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: int = self.settings.global_config.leaderboard_concurrency
+            await ctx.send(
+                _("`{key}` is {value}").format(key="leaderboard_concurrency", value=value)
+            )
+
+    @tdxset.command(name="leaderboard_timeout")
+    @checks.is_owner()
+    async def tdxset__leaderboard_timeout(
+        self, ctx: commands.Context, value: Optional[float] = None
+    ) -> None:
+        """How many seconds a profile card waits for each leaderboard before leaving it out"""
+        if value is not None:
+            if value <= 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="leaderboard_timeout", error=_("it must be more than 0")
+                    )
+                )
+                return
+            await self.settings.set_global(leaderboard_timeout=value)
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="leaderboard_timeout", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: float = self.settings.global_config.leaderboard_timeout
+            await ctx.send(_("`{key}` is {value}").format(key="leaderboard_timeout", value=value))
+
+    @tdxset.command(name="leaderboard_cache_ttl")
+    @checks.is_owner()
+    async def tdxset__leaderboard_cache_ttl(
+        self, ctx: commands.Context, value: Optional[float] = None
+    ) -> None:
+        """How many seconds a downloaded leaderboard is reused for"""
+        if value is not None:
+            if value < 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="leaderboard_cache_ttl", error=_("it can't be negative")
+                    )
+                )
+                return
+            await self.settings.set_global(leaderboard_cache_ttl=value)
+            self.leaderboard_cache.snapshots.ttl = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="leaderboard_cache_ttl", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: float = self.settings.global_config.leaderboard_cache_ttl
+            await ctx.send(
+                _("`{key}` is {value}").format(key="leaderboard_cache_ttl", value=value)
+            )
+
+    @tdxset.command(name="leaderboard_cache_size")
+    @checks.is_owner()
+    async def tdxset__leaderboard_cache_size(
+        self, ctx: commands.Context, value: Optional[int] = None
+    ) -> None:
+        """How many leaderboard rows may be cached before the least recently used are dropped"""
+        if value is not None:
+            if value < 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="leaderboard_cache_size", error=_("it can't be negative")
+                    )
+                )
+                return
+            await self.settings.set_global(leaderboard_cache_size=value)
+            self.leaderboard_cache.snapshots.max_size = value
+            self.leaderboard_cache.snapshots.shrink()
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="leaderboard_cache_size", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: int = self.settings.global_config.leaderboard_cache_size
+            await ctx.send(
+                _("`{key}` is {value}").format(key="leaderboard_cache_size", value=value)
+            )
+
+    @tdxset.command(name="trainer_cache_ttl")
+    @checks.is_owner()
+    async def tdxset__trainer_cache_ttl(
+        self, ctx: commands.Context, value: Optional[float] = None
+    ) -> None:
+        """How many seconds a looked up trainer is reused for"""
+        if value is not None:
+            if value < 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="trainer_cache_ttl", error=_("it can't be negative")
+                    )
+                )
+                return
+            await self.settings.set_global(trainer_cache_ttl=value)
+            self.trainer_cache.trainers.ttl = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="trainer_cache_ttl", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: float = self.settings.global_config.trainer_cache_ttl
+            await ctx.send(_("`{key}` is {value}").format(key="trainer_cache_ttl", value=value))
+
+    @tdxset.command(name="trainer_cache_size")
+    @checks.is_owner()
+    async def tdxset__trainer_cache_size(
+        self, ctx: commands.Context, value: Optional[int] = None
+    ) -> None:
+        """How many trainer lookups may be cached before the least recently used are dropped"""
+        if value is not None:
+            if value < 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="trainer_cache_size", error=_("it can't be negative")
+                    )
+                )
+                return
+            await self.settings.set_global(trainer_cache_size=value)
+            self.trainer_cache.trainers.max_size = value
+            self.trainer_cache.trainers.shrink()
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="trainer_cache_size", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: int = self.settings.global_config.trainer_cache_size
+            await ctx.send(_("`{key}` is {value}").format(key="trainer_cache_size", value=value))
+
+    @tdxset.command(name="ocr_workers")
+    @checks.is_owner()
+    async def tdxset__ocr_workers(
+        self, ctx: commands.Context, value: Optional[int] = None
+    ) -> None:
+        """How many screenshots may be read at the same time"""
+        if value is not None:
+            if value < 1:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="ocr_workers", error=_("it must be at least 1")
+                    )
+                )
+                return
+            await self.settings.set_global(ocr_workers=value)
+            self.ocr_pool.resize(value)
+            self.ocr_queue.resize(value)
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_workers", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: int = self.settings.global_config.ocr_workers
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_workers", value=value))
+
+    @tdxset.command(name="ocr_timeout")
+    @checks.is_owner()
+    async def tdxset__ocr_timeout(
+        self, ctx: commands.Context, value: Optional[float] = None
+    ) -> None:
+        """How many seconds to wait for a screenshot to be read before giving up"""
+        if value is not None:
+            if value <= 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="ocr_timeout", error=_("it must be more than 0")
+                    )
+                )
+                return
+            await self.settings.set_global(ocr_timeout=value)
+            self.ocr_pool.timeout = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_timeout", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: float = self.settings.global_config.ocr_timeout
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_timeout", value=value))
+
+    @tdxset.command(name="ocr_queue_depth")
+    @checks.is_owner()
+    async def tdxset__ocr_queue_depth(
+        self, ctx: commands.Context, value: Optional[int] = None
+    ) -> None:
+        """How many screenshots each server may have waiting to be read"""
+        if value is not None:
+            if value < 1:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="ocr_queue_depth", error=_("it must be at least 1")
+                    )
+                )
+                return
+            await self.settings.set_global(ocr_queue_depth=value)
+            self.ocr_queue.max_depth = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_queue_depth", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: int = self.settings.global_config.ocr_queue_depth
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_queue_depth", value=value))
+
+    @tdxset.command(name="ocr_queue_max_wait")
+    @checks.is_owner()
+    async def tdxset__ocr_queue_max_wait(
+        self, ctx: commands.Context, value: Optional[float] = None
+    ) -> None:
+        """How many seconds a screenshot may wait in the queue before it's dropped"""
+        if value is not None:
+            if value <= 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="ocr_queue_max_wait", error=_("it must be more than 0")
+                    )
+                )
+                return
+            await self.settings.set_global(ocr_queue_max_wait=value)
+            self.ocr_queue.max_wait = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_queue_max_wait", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: float = self.settings.global_config.ocr_queue_max_wait
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_queue_max_wait", value=value))
+
+    @tdxset.command(name="ocr_cache_size")
+    @checks.is_owner()
+    async def tdxset__ocr_cache_size(
+        self, ctx: commands.Context, value: Optional[int] = None
+    ) -> None:
+        """How many screenshots to remember OCR results for"""
+        if value is not None:
+            if value < 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="ocr_cache_size", error=_("it can't be negative")
+                    )
+                )
+                return
+            await self.settings.set_global(ocr_cache_size=value)
+            self.ocr_cache.max_entries = value
+            await self.ocr_cache.shrink()
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_cache_size", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: int = self.settings.global_config.ocr_cache_size
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_cache_size", value=value))
+
+    @tdxset.command(name="ocr_cache_max_age")
+    @checks.is_owner()
+    async def tdxset__ocr_cache_max_age(
+        self, ctx: commands.Context, value: Optional[float] = None
+    ) -> None:
+        """How many seconds to remember an OCR result for"""
+        if value is not None:
+            if value < 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="ocr_cache_max_age", error=_("it can't be negative")
+                    )
+                )
+                return
+            await self.settings.set_global(ocr_cache_max_age=value)
+            self.ocr_cache.max_age = value
+            await self.ocr_cache.shrink()
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_cache_max_age", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: float = self.settings.global_config.ocr_cache_max_age
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_cache_max_age", value=value))
+
+    @tdxset.command(name="ocr_cache_perceptual")
+    @checks.is_owner()
+    async def tdxset__ocr_cache_perceptual(
+        self, ctx: commands.Context, value: Optional[bool] = None
+    ) -> None:
+        """Also match re-encoded copies of a screenshot in the OCR cache
+
+        This compares a perceptual hash of each image. Screenshots of the same profile taken at
+        different times look very alike, so only turn this on if reposted copies are a problem.
+        """
+        if value is not None:
+            await self.settings.set_global(ocr_cache_perceptual=value)
+            self.ocr_cache.perceptual = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_cache_perceptual", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: bool = self.settings.global_config.ocr_cache_perceptual
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_cache_perceptual", value=value))
+
+    @tdxset.command(name="ocr_prefilter")
+    @checks.is_owner()
+    async def tdxset__ocr_prefilter(
+        self, ctx: commands.Context, value: Optional[bool] = None
+    ) -> None:
+        """Skip OCR for images that clearly aren't profile screenshots"""
+        if value is not None:
+            await self.settings.set_global(ocr_prefilter=value)
+            self.prefilter.enabled = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_prefilter", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: bool = self.settings.global_config.ocr_prefilter
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_prefilter", value=value))
+
+    @tdxset.command(name="ocr_max_attachments")
+    @checks.is_owner()
+    async def tdxset__ocr_max_attachments(
+        self, ctx: commands.Context, value: Optional[int] = None
+    ) -> None:
+        """How many screenshots a single message may have to be read"""
+        if value is not None:
+            if value < 1:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="ocr_max_attachments", error=_("it must be at least 1")
+                    )
+                )
+                return
+            await self.settings.set_global(ocr_max_attachments=value)
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="ocr_max_attachments", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: int = self.settings.global_config.ocr_max_attachments
+            await ctx.send(_("`{key}` is {value}").format(key="ocr_max_attachments", value=value))
+
+    @tdxset.command(name="api_rate")
+    @checks.is_owner()
+    async def tdxset__api_rate(self, ctx: commands.Context, value: Optional[float] = None) -> None:
+        """How many requests a second may be sent to the TrainerDex API, on average
+
+        Set to 0 to turn the limit off.
+        """
+        if value is not None:
+            if value < 0:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="api_rate", error=_("it can't be negative")
+                    )
+                )
+                return
+            await self.settings.set_global(api_rate=value)
+            self.api_limiter.rate = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="api_rate", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: float = self.settings.global_config.api_rate
+            await ctx.send(_("`{key}` is {value}").format(key="api_rate", value=value))
+
+    @tdxset.command(name="api_burst")
+    @checks.is_owner()
+    async def tdxset__api_burst(self, ctx: commands.Context, value: Optional[int] = None) -> None:
+        """How many requests may be sent to the TrainerDex API at once before `api_rate` applies"""
+        if value is not None:
+            if value < 1:
+                await ctx.send(
+                    _("Can't set `{key}` because {error}").format(
+                        key="api_burst", error=_("it must be at least 1")
+                    )
+                )
+                return
+            await self.settings.set_global(api_burst=value)
+            self.api_limiter.burst = value
+            await ctx.tick()
+            await ctx.send(
+                _("`{key}` set to {value}").format(key="api_burst", value=value),
+                delete_after=30,
+            )
+        else:
+            await ctx.send_help()
+            value: int = self.settings.global_config.api_burst
+            await ctx.send(_("`{key}` is {value}").format(key="api_burst", value=value))
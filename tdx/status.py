@@ -0,0 +1,112 @@
+import json
+import logging
+from redbot.core import checks, commands
+from redbot.core.i18n import Translator
+from redbot.core.utils import chat_formatting as cf
+from typing import Dict, Union
+
+from .abc import MixinMeta
+
+logger: logging.Logger = logging.getLogger(__name__)
+_: Translator = Translator("TrainerDex", __file__)
+
+
+class Status(MixinMeta):
+    @commands.group(name="tdxstatus", case_insensitive=True)
+    @checks.is_owner()
+    async def tdxstatus(self, ctx: commands.Context) -> None:
+        """⬎ Show the internal state of the TrainerDex cog"""
+        pass
+
+    @tdxstatus.command(name="cache")
+    async def tdxstatus__cache(self, ctx: commands.Context) -> None:
+        """Show hit and miss counters for the leaderboard and trainer caches"""
+        snapshots = self.leaderboard_cache.snapshots
+        trainers = self.trainer_cache.trainers
+        data: Dict[str, Dict[str, Union[int, float]]] = {
+            "leaderboards": {
+                "snapshots": len(snapshots),
+                "rows": snapshots.size,
+                "max_rows": snapshots.max_size,
+                "ttl": snapshots.ttl,
+                "hits": snapshots.hits,
+                "misses": snapshots.misses,
+                "hit_rate": round(snapshots.hit_rate, 3),
+                "evictions": snapshots.evictions,
+                "stale_hits": snapshots.stale_hits,
+                "downloading": len(self.leaderboard_cache.downloads),
+            },
+            "trainers": {
+                "keys": len(trainers),
+                "max_keys": trainers.max_size,
+                "ttl": trainers.ttl,
+                "hits": trainers.hits,
+                "misses": trainers.misses,
+                "hit_rate": round(trainers.hit_rate, 3),
+                "evictions": trainers.evictions,
+                "stale_hits": trainers.stale_hits,
+            },
+        }
+        output: str = json.dumps(data, indent=2, ensure_ascii=False)
+        await ctx.send(cf.box(output, "json"))
+
+    @tdxstatus.command(name="api")
+    async def tdxstatus__api(self, ctx: commands.Context) -> None:
+        """Show the TrainerDex API rate limiter and circuit breaker"""
+        http = self.client.http
+        data: Dict[str, Union[int, float, str, Dict[str, Union[int, float, str]]]] = {
+            "requests": http.requests,
+            "coalesced": http.coalesced,
+            "coalesce_rate": round(http.coalesce_rate, 3),
+            "retries": http.retries,
+            "in_flight": len(http.in_flight),
+            "limiter": {
+                "rate": self.api_limiter.rate,
+                "burst": self.api_limiter.burst,
+                "tokens": round(self.api_limiter.tokens, 2),
+                "waiting": self.api_limiter.waiting,
+                "delayed": self.api_limiter.delayed,
+            },
+            "breaker": {
+                "state": self.api_breaker.state,
+                "failures": self.api_breaker.failures,
+                "retry_after": round(self.api_breaker.retry_after, 1),
+                "trips": self.api_breaker.trips,
+                "rejected": self.api_breaker.rejected,
+            },
+        }
+        output: str = json.dumps(data, indent=2, ensure_ascii=False)
+        await ctx.send(cf.box(output, "json"))
+
+    @tdxstatus.command(name="ocr")
+    async def tdxstatus__ocr(self, ctx: commands.Context) -> None:
+        """Show the OCR queue, result cache and prefilter"""
+        data: Dict[str, Union[int, float, Dict[str, Union[int, float, bool]]]] = {
+            "workers": self.ocr_queue.workers,
+            "active": self.ocr_queue.active,
+            "queued": len(self.ocr_queue),
+            "max_depth": self.ocr_queue.max_depth,
+            "max_wait": self.ocr_queue.max_wait,
+            "processed": self.ocr_queue.processed,
+            "shed": self.ocr_queue.shed,
+            "rejected": self.ocr_queue.rejected,
+            "guilds": {str(k): v for k, v in self.ocr_queue.depths().items()},
+            "cache": {
+                "results": len(self.ocr_cache),
+                "max_results": self.ocr_cache.max_entries,
+                "max_age": self.ocr_cache.max_age,
+                "perceptual": self.ocr_cache.perceptual,
+                "hits": self.ocr_cache.hits,
+                "near_hits": self.ocr_cache.near_hits,
+                "misses": self.ocr_cache.misses,
+                "hit_rate": round(self.ocr_cache.hit_rate, 3),
+                "evictions": self.ocr_cache.evictions,
+            },
+            "prefilter": {
+                "enabled": self.prefilter.enabled,
+                "checked": self.prefilter.checked,
+                "rejected": self.prefilter.rejected,
+            },
+        }
+        output: str = json.dumps(data, indent=2, ensure_ascii=False)
+        await ctx.send(cf.box(output, "json"))
@@ -0,0 +1,181 @@
+import asyncio
+import codecs
+import json
+import logging
+from trainerdex.leaderboard import BaseLeaderboard, GuildLeaderboard, Leaderboard
+from typing import Any, Dict, List, Optional
+
+from .client import Client
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Returned by LeaderboardParser._decode when the value hasn't fully arrived yet
+_INCOMPLETE: object = object()
+
+
+class LeaderboardParser:
+    """Parses a leaderboard response as it arrives, returning each entry once it's complete.
+
+    Entries in the ``leaderboard`` array are read one at a time with
+    :meth:`json.JSONDecoder.raw_decode`, as soon as their closing brace has arrived. The response's
+    other keys, such as ``aggregations``, are kept in :attr:`fields` as they're read.
+    """
+
+    def __init__(self, key: str = "leaderboard") -> None:
+        self.key: str = key
+        self.fields: Dict[str, Any] = {}
+        self._json: json.JSONDecoder = json.JSONDecoder()
+        self._utf8: codecs.IncrementalDecoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer: str = ""
+        self._pos: int = 0
+        # One of start, key, colon, value, array, entries and end
+        self._state: str = "start"
+        self._field: Optional[str] = None
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """Add the next chunk of the response, returning any entries completed by it"""
+        self._buffer = self._buffer[self._pos :] + self._utf8.decode(data)
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Finish the response, returning any entries left.
+
+        Raises
+        ------
+        ValueError
+            The response is incomplete or isn't a leaderboard.
+        """
+        self._buffer = self._buffer[self._pos :] + self._utf8.decode(b"", final=True)
+        self._pos = 0
+        entries: List[Dict[str, Any]] = self._parse(final=True)
+        if self._state != "end":
+            raise ValueError("leaderboard response ended early")
+        return entries
+
+    def _decode(self, final: bool) -> Any:
+        try:
+            value, end = self._json.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return _INCOMPLETE
+        if end == len(self._buffer) and not final:
+            # A number at the end of a chunk might carry on in the next one
+            return _INCOMPLETE
+        self._pos = end
+        return value
+
+    def _parse(self, final: bool) -> List[Dict[str, Any]]:
+        entries: List[Dict[str, Any]] = []
+        buffer: str = self._buffer
+        while True:
+            while self._pos < len(buffer) and buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos >= len(buffer):
+                return entries
+            char: str = buffer[self._pos]
+
+            if self._state == "start":
+                if char != "{":
+                    raise ValueError("leaderboard response isn't an object")
+                self._pos += 1
+                self._state = "key"
+            elif self._state == "key":
+                if char == "}":
+                    self._pos += 1
+                    self._state = "end"
+                elif char == ",":
+                    self._pos += 1
+                else:
+                    field: Any = self._decode(final)
+                    if field is _INCOMPLETE:
+                        return entries
+                    self._field = field
+                    self._state = "colon"
+            elif self._state == "colon":
+                if char != ":":
+                    raise ValueError("expected ':' in leaderboard response")
+                self._pos += 1
+                self._state = "array" if self._field == self.key else "value"
+            elif self._state == "array":
+                if char == "[":
+                    self._pos += 1
+                    self._state = "entries"
+                else:
+                    self._state = "value"
+            elif self._state == "entries":
+                if char == "]":
+                    self._pos += 1
+                    self._state = "key"
+                elif char == ",":
+                    self._pos += 1
+                else:
+                    entry: Any = self._decode(final)
+                    if entry is _INCOMPLETE:
+                        return entries
+                    entries.append(entry)
+            elif self._state == "value":
+                value: Any = self._decode(final)
+                if value is _INCOMPLETE:
+                    return entries
+                self.fields[self._field] = value
+                self._state = "key"
+            else:
+                raise ValueError("unexpected data after leaderboard response")
+
+
+class LeaderboardDownload:
+    """A leaderboard being downloaded, whose entries can be read while the rest arrives.
+
+    :attr:`entries` grows as the response is parsed. Anything waiting in :meth:`wait_for_more` is
+    woken each time it does, and when the download finishes, whether or not it succeeded. Errors
+    are kept in :attr:`error` rather than raised.
+    """
+
+    def __init__(self, client: Client, stat: str, guild_id: Optional[int] = None) -> None:
+        self.client: Client = client
+        self.stat: str = stat
+        self.guild_id: Optional[int] = guild_id
+        self.parser: LeaderboardParser = LeaderboardParser()
+        self.entries: List[Dict[str, Any]] = []
+        self.done: bool = False
+        self.error: Optional[Exception] = None
+        # Set when an update makes the leaderboard out of date before it's finished
+        self.stale: bool = False
+        self._progress: asyncio.Event = asyncio.Event()
+        self.task: asyncio.Task = asyncio.ensure_future(self._run())
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        return self.parser.fields
+
+    def _notify(self) -> None:
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    async def _run(self) -> None:
+        try:
+            async for chunk in self.client.stream_leaderboard(self.stat, guild=self.guild_id):
+                entries: List[Dict[str, Any]] = self.parser.feed(chunk)
+                if entries:
+                    self.entries.extend(entries)
+                    self._notify()
+            self.entries.extend(self.parser.close())
+        except Exception as e:
+            logger.debug("Leaderboard download failed: %r", e)
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def wait_for_more(self) -> None:
+        """Wait for more entries, or for the download to finish"""
+        if not self.done:
+            await self._progress.wait()
+
+    def to_leaderboard(self) -> BaseLeaderboard:
+        leaderboard_class = GuildLeaderboard if self.guild_id else Leaderboard
+        return leaderboard_class(
+            conn=self.client.http, data={**self.fields, "leaderboard": self.entries}
+        )
@@ -1,35 +1,64 @@
+import aiohttp
+import asyncio
 import contextlib
+import functools
 from decimal import Context, Decimal
 import logging
 import os
-import PogoOCR
 from abc import ABC
 from discord.activity import Game
 from discord.emoji import Emoji
 from discord.errors import Forbidden, HTTPException, InvalidArgument, NotFound
 from discord.ext.commands.errors import BadArgument
-from discord.message import Message
+from discord.message import Attachment, Message
 from redbot.core import Config, commands
 from redbot.core.bot import Red
+from redbot.core.data_manager import cog_data_path
 from redbot.core.i18n import Translator
 from redbot.core.utils import chat_formatting as cf
-from trainerdex.client import Client
 from trainerdex.socialconnection import SocialConnection
 from trainerdex.trainer import Trainer
-from typing import Dict, Final, Literal, Union
+from typing import Awaitable, Callable, Dict, Final, List, Literal, Match, Optional, Union
 
 from trainerdex.update import Update
 
 from tdx.datatypes import ChannelConfig, GlobalConfig, GuildConfig, StoredRoles
 
 from . import VERSION, converters
+from .autorole import AutoRoleJob
+from .cache import LeaderboardCache, SettingsCache, TrainerCache
+from .client import (
+    BREAKER_RESET,
+    BREAKER_THRESHOLD,
+    CircuitBreaker,
+    CircuitOpen,
+    Client,
+    create_session,
+    TokenBucket,
+)
 from .embeds import ProfileCard
 from .leaderboard import Leaderboard
+from .ocr import (
+    download,
+    ImageTooLarge,
+    merge_stats,
+    OCRCache,
+    OCRCacheKey,
+    OCRFailed,
+    OCRJob,
+    OCRPool,
+    OCRQueue,
+    OCRResult,
+    QueueFull,
+    screenshot_attachments,
+)
 from .mod import ModCmds
 from .post import Post
-from .profile import Profile
+from .prefilter import Prefilter, Verdict
+from .profile import SET_TRAINER_CODE_PATTERN, Profile
 from .settings import Settings
-from .utils import append_twitter, loading
+from .status import Status
+from .utils import ProgressMessage, append_twitter, loading
 from .version import get_version
 
 logger: logging.Logger = logging.getLogger(__name__)
@@ -58,7 +87,14 @@ DEFAULT_CHANNEL_CONFIG: ChannelConfig = ChannelConfig(profile_ocr=False)
 
 
 class TrainerDex(
-    ModCmds, Post, Profile, Leaderboard, Settings, commands.Cog, metaclass=CompositeMetaClass
+    ModCmds,
+    Post,
+    Profile,
+    Leaderboard,
+    Settings,
+    Status,
+    commands.Cog,
+    metaclass=CompositeMetaClass,
 ):
     def __init__(self, bot: Red) -> None:
         self.bot: Red = bot
@@ -72,7 +108,44 @@ class TrainerDex(
         self.config.register_guild(**DEFAULT_GUILD_CONFIG.__dict__)
         self.config.register_channel(**DEFAULT_CHANNEL_CONFIG.__dict__)
         self.client: Client = None
+        self.settings: SettingsCache = SettingsCache(
+            self.config, DEFAULT_GLOBAL_CONFIG, DEFAULT_GUILD_CONFIG, DEFAULT_CHANNEL_CONFIG
+        )
+        self.session: aiohttp.ClientSession = create_session()
+        self.api_limiter: TokenBucket = TokenBucket(
+            rate=DEFAULT_GLOBAL_CONFIG.api_rate, burst=DEFAULT_GLOBAL_CONFIG.api_burst
+        )
+        self.api_breaker: CircuitBreaker = CircuitBreaker(
+            threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET
+        )
+        self.leaderboard_cache: LeaderboardCache = LeaderboardCache(
+            ttl=DEFAULT_GLOBAL_CONFIG.leaderboard_cache_ttl,
+            max_entries=DEFAULT_GLOBAL_CONFIG.leaderboard_cache_size,
+        )
+        self.trainer_cache: TrainerCache = TrainerCache(
+            ttl=DEFAULT_GLOBAL_CONFIG.trainer_cache_ttl,
+            max_size=DEFAULT_GLOBAL_CONFIG.trainer_cache_size,
+        )
+        self.ocr_pool: OCRPool = OCRPool(
+            workers=DEFAULT_GLOBAL_CONFIG.ocr_workers,
+            timeout=DEFAULT_GLOBAL_CONFIG.ocr_timeout,
+        )
+        self.ocr_queue: OCRQueue = OCRQueue(
+            workers=DEFAULT_GLOBAL_CONFIG.ocr_workers,
+            max_depth=DEFAULT_GLOBAL_CONFIG.ocr_queue_depth,
+            max_wait=DEFAULT_GLOBAL_CONFIG.ocr_queue_max_wait,
+        )
+        self.ocr_queue.start()
+        self.ocr_cache: OCRCache = OCRCache(
+            path=cog_data_path(self) / "ocr",
+            max_entries=DEFAULT_GLOBAL_CONFIG.ocr_cache_size,
+            max_age=DEFAULT_GLOBAL_CONFIG.ocr_cache_max_age,
+            perceptual=DEFAULT_GLOBAL_CONFIG.ocr_cache_perceptual,
+        )
+        self.prefilter: Prefilter = Prefilter(enabled=DEFAULT_GLOBAL_CONFIG.ocr_prefilter)
+        self.autorole_jobs: Dict[int, AutoRoleJob] = {}
         self.bot.loop.create_task(self.create_client())
+        self.bot.loop.create_task(self.load_settings())
         self.bot.loop.create_task(self.load_emojis())
         self.bot.loop.create_task(self.set_game_to_version())
 
@@ -115,10 +188,73 @@ class TrainerDex(
         token: str = api_tokens.get("token", "")
         if not token:
             logger.warning("No valid token found")
-        self.client: Client = Client(token=token)
+        self.client: Client = Client(
+            self.session, token=token, limiter=self.api_limiter, breaker=self.api_breaker
+        )
+
+    async def load_settings(self) -> None:
+        await self.settings.load()
+        global_config: GlobalConfig = self.settings.global_config
+        self.leaderboard_cache.snapshots.ttl = global_config.leaderboard_cache_ttl
+        self.leaderboard_cache.snapshots.max_size = global_config.leaderboard_cache_size
+        self.leaderboard_cache.snapshots.shrink()
+        self.trainer_cache.trainers.ttl = global_config.trainer_cache_ttl
+        self.trainer_cache.trainers.max_size = global_config.trainer_cache_size
+        self.trainer_cache.trainers.shrink()
+        self.ocr_pool.resize(global_config.ocr_workers)
+        self.ocr_pool.timeout = global_config.ocr_timeout
+        self.ocr_queue.resize(global_config.ocr_workers)
+        self.ocr_queue.max_depth = global_config.ocr_queue_depth
+        self.ocr_queue.max_wait = global_config.ocr_queue_max_wait
+        self.ocr_cache.max_entries = global_config.ocr_cache_size
+        self.ocr_cache.max_age = global_config.ocr_cache_max_age
+        self.ocr_cache.perceptual = global_config.ocr_cache_perceptual
+        await self.ocr_cache.load()
+        self.prefilter.enabled = global_config.ocr_prefilter
+        self.api_limiter.rate = global_config.api_rate
+        self.api_limiter.burst = global_config.api_burst
+
+    def cog_unload(self) -> None:
+        self.ocr_queue.close()
+        self.ocr_pool.close()
+        for job in self.autorole_jobs.values():
+            job.task.cancel()
+        for leaderboard_download in self.leaderboard_cache.downloads.values():
+            leaderboard_download.task.cancel()
+        self.bot.loop.create_task(self.session.close())
+
+    async def cog_command_error(self, ctx: commands.Context, error: Exception) -> None:
+        if isinstance(getattr(error, "original", None), CircuitOpen):
+            await ctx.send(
+                _(
+                    "TrainerDex isn't responding right now. "
+                    "Please try again in {seconds} seconds."
+                ).format(seconds=max(round(error.original.retry_after), 1))
+            )
+            return
+        await self.bot.on_command_error(ctx, error, unhandled_by_cog=True)
 
     @commands.Cog.listener("on_message_without_command")
-    async def check_screenshot(self, message: Message) -> None:
+    async def dispatch_message(self, message: Message) -> None:
+        # This runs for every message the bot can see, so anything that can be ruled out without
+        # an await is checked before building a context
+        if message.author.bot:
+            return
+
+        match: Optional[Match[str]] = SET_TRAINER_CODE_PATTERN.match(message.content)
+        if match:
+            handler: Callable[[commands.Context], Awaitable[None]] = functools.partial(
+                self.pokenav_set_trainer_code, match=match
+            )
+        elif (
+            message.attachments
+            and message.channel.id in self.settings.ocr_channels
+            and screenshot_attachments(message)
+        ):
+            handler: Callable[[commands.Context], Awaitable[None]] = self.check_screenshot
+        else:
+            return
+
         ctx: Context = await self.bot.get_context(message)
         del message
         if not (await self.bot.message_eligible_as_command(ctx.message)):
@@ -127,19 +263,73 @@ class TrainerDex(
         if await self.bot.cog_disabled_in_guild(self, ctx.guild):
             return
 
-        if len(ctx.message.attachments) != 1:
-            # TODO: Enable multiple images
+        await handler(ctx)
+
+    async def check_screenshot(self, ctx: commands.Context) -> None:
+        attachments: List[Attachment] = screenshot_attachments(ctx.message)
+
+        if len(attachments) > self.settings.global_config.ocr_max_attachments:
             return
 
-        if os.path.splitext(ctx.message.attachments[0].proxy_url)[1].lower() not in [
-            ".jpeg",
-            ".jpg",
-            ".png",
-        ]:
+        async def shed() -> None:
+            with contextlib.suppress(HTTPException, Forbidden, NotFound, InvalidArgument):
+                await ctx.message.add_reaction("\N{HOURGLASS}")
+            content: str = cf.error(
+                _(
+                    "{author.mention} Sorry, your screenshot waited too long to be read. "
+                    "Please try again later."
+                )
+            ).format(author=ctx.author)
+            if queued_message:
+                await queued_message.edit(content=content)
+            else:
+                await ctx.send(content)
+
+        # Nothing is downloaded or looked up until the job runs, so a guild whose queue is full
+        # costs no more than this
+        guild_id: Optional[int] = ctx.guild.id if ctx.guild else None
+        queued_message: Optional[Message] = None
+        if self.ocr_queue.saturated and not self.ocr_queue.is_full(guild_id):
+            queued_message = await ctx.send(
+                loading(
+                    _("{author.mention} Your screenshot is queued, position {position}.")
+                ).format(author=ctx.author, position=self.ocr_queue.position(guild_id))
+            )
+
+        try:
+            self.ocr_queue.submit(
+                OCRJob(
+                    guild_id=guild_id,
+                    run=lambda: self.read_screenshots(ctx, attachments, message=queued_message),
+                    shed=shed,
+                )
+            )
+        except QueueFull:
+            with contextlib.suppress(HTTPException, Forbidden, NotFound, InvalidArgument):
+                await ctx.message.add_reaction("\N{NO ENTRY SIGN}")
+            await ctx.send(
+                cf.warning(
+                    _(
+                        "{author.mention} There are too many screenshots waiting to be read in "
+                        "this server. Please try again in a few minutes."
+                    )
+                ).format(author=ctx.author)
+            )
+            if queued_message:
+                await queued_message.delete(silent=True)
             return
 
-        profile_ocr: bool = await self.config.channel(ctx.channel).profile_ocr()
-        if not profile_ocr:
+    async def read_screenshots(
+        self,
+        ctx: commands.Context,
+        attachments: List[Attachment],
+        message: Optional[Message] = None,
+    ) -> None:
+        """Download ``attachments`` and find the author's trainer, then process the screenshots"""
+        images: List[bytes] = await self.download_screenshots(attachments)
+        if not images:
+            if message:
+                await message.delete(silent=True)
             return
 
         with contextlib.suppress(HTTPException, Forbidden, NotFound, InvalidArgument):
@@ -147,31 +337,86 @@ class TrainerDex(
 
         try:
             trainer: Trainer = await converters.TrainerConverter().convert(
-                ctx, ctx.author, cli=self.client
+                ctx, ctx.author, cli=self.client, cache=self.trainer_cache
             )
         except BadArgument:
             with contextlib.suppress(HTTPException, Forbidden, NotFound, InvalidArgument):
                 await ctx.message.remove_reaction(self.emoji.get("loading"), self.bot.user)
                 await ctx.message.add_reaction("\N{THUMBS DOWN SIGN}")
-            await ctx.send(
-                _(
-                    "{author.mention} No TrainerDex profile found for this Discord account."
-                    " A moderator for this server can set you up."
-                    " If it still doesn't work after that, please contact {bot_owner}."
-                ).format(author=ctx.author, bot_owner=ctx.bot.get_user(319792326958514176))
-            )
+            content: str = _(
+                "{author.mention} No TrainerDex profile found for this Discord account."
+                " A moderator for this server can set you up."
+                " If it still doesn't work after that, please contact {bot_owner}."
+            ).format(author=ctx.author, bot_owner=ctx.bot.get_user(319792326958514176))
+            if message:
+                await message.edit(content=content)
+            else:
+                await ctx.send(content)
             return
 
+        await self.process_screenshot(ctx, trainer, images, message=message)
+
+    async def download_screenshots(self, attachments: List[Attachment]) -> List[bytes]:
+        """Download ``attachments`` concurrently, keeping those that look like profiles"""
+        downloads: List[Union[bytes, BaseException]] = await asyncio.gather(
+            *(download(self.session, attachment) for attachment in attachments),
+            return_exceptions=True,
+        )
+        images: List[bytes] = []
+        for attachment, image in zip(attachments, downloads):
+            if isinstance(image, ImageTooLarge):
+                logger.debug("Skipping attachment %s, too large", attachment.id)
+            elif isinstance(image, (aiohttp.ClientError, asyncio.TimeoutError)):
+                logger.warning("Couldn't download attachment %s: %r", attachment.id, image)
+            elif isinstance(image, BaseException):
+                raise image
+            else:
+                verdict: Verdict = await self.prefilter.check(image)
+                if verdict.is_profile:
+                    images.append(image)
+        return images
+
+    async def recognise(self, image: bytes) -> OCRResult:
+        """Read a profile screenshot, or reuse what was read from the same image before"""
+        key: OCRCacheKey = await self.ocr_cache.key(image)
+        cached: Optional[OCRResult] = await self.ocr_cache.get(key)
+        if cached is not None:
+            return cached
+
+        result: OCRResult = await self.ocr_pool.recognise(image)
+        await self.ocr_cache.set(key, result)
+        return result
+
+    async def process_screenshot(
+        self,
+        ctx: commands.Context,
+        trainer: Trainer,
+        images: List[bytes],
+        message: Optional[Message] = None,
+    ) -> None:
         async with ctx.channel.typing():
-            message: Message = await ctx.send(
-                loading(_("That's a nice image you have there, let's see…"))
-            )
-            ocr: PogoOCR.ProfileSelf = PogoOCR.ProfileSelf(
-                POGOOCR_TOKEN_PATH, image_uri=ctx.message.attachments[0].proxy_url
+            if message:
+                await message.edit(
+                    content=loading(_("That's a nice image you have there, let's see…"))
+                )
+            else:
+                message: Message = await ctx.send(
+                    loading(_("That's a nice image you have there, let's see…"))
+                )
+            progress: ProgressMessage = ProgressMessage(message)
+
+            results: List[Union[OCRResult, BaseException]] = await asyncio.gather(
+                *(self.recognise(image) for image in images), return_exceptions=True
             )
-            try:
-                ocr.get_text()
-            except PogoOCR.OutOfRetriesException:
+            for result in results:
+                if isinstance(result, BaseException) and not isinstance(
+                    result, (OCRFailed, asyncio.TimeoutError)
+                ):
+                    raise result
+            found: List[OCRResult] = [
+                result for result in results if isinstance(result, OCRResult)
+            ]
+            if not found:
                 await ctx.send(
                     cf.error(
                         _(
@@ -181,15 +426,10 @@ class TrainerDex(
                 )
                 return
 
-            data_found: Dict[str, Union[Decimal, int, None]] = {
-                "travel_km": ocr.travel_km,
-                "capture_total": ocr.capture_total,
-                "pokestops_visited": ocr.pokestops_visited,
-                "total_xp": ocr.total_xp,
-            }
+            data_found: Dict[str, Union[Decimal, int, None]] = merge_stats(found)
 
             if data_found.get("total_xp"):
-                await message.edit(
+                await progress.update(
                     content=append_twitter(
                         loading(
                             _(
@@ -205,7 +445,7 @@ class TrainerDex(
                     "total_xp"
                 )
                 if latest_update_with_total_xp.total_xp > data_found.get("total_xp"):
-                    await message.edit(
+                    await progress.finish(
                         content=append_twitter(
                             cf.warning(
                                 _(
@@ -245,6 +485,8 @@ class TrainerDex(
                         data_source="ss_ocr",
                         update_time=ctx.message.created_at,
                     )
+                    self.leaderboard_cache.invalidate(trainer.old_id, data_found, guild=ctx.guild)
+                    self.trainer_cache.invalidate(trainer)
                     with contextlib.suppress(
                         HTTPException,
                         Forbidden,
@@ -256,27 +498,26 @@ class TrainerDex(
                     text = None
 
                 if ctx.guild and not trainer.is_visible:
-                    await message.edit(_("Sending in DMs"))
-                    message: Message = await ctx.author.send(content=loading(_("Loading output…")))
+                    await progress.finish(content=_("Sending in DMs"))
+                    progress: ProgressMessage = ProgressMessage(
+                        await ctx.author.send(content=loading(_("Loading output…")))
+                    )
 
-                await message.edit(
+                await progress.update(
                     content="\n".join(
                         [x for x in [text, loading(_("Loading output…"))] if x is not None]
                     )
                 )
                 embed: ProfileCard = await ProfileCard(
                     ctx=ctx,
+                    settings=self.settings,
                     client=self.client,
                     trainer=trainer,
                     emoji=self.emoji,
-                )
-                await message.edit(
-                    content="\n".join(
-                        [x for x in [text, loading(_("Loading output…"))] if x is not None]
-                    )
+                    leaderboard_cache=self.leaderboard_cache,
                 )
                 await embed.show_progress()
-                await message.edit(
+                await progress.update(
                     content="\n".join(
                         [x for x in [text, loading(_("Loading leaderboards…"))] if x is not None]
                     ),
@@ -284,11 +525,11 @@ class TrainerDex(
                 )
                 await embed.add_leaderboard()
                 if ctx.guild:
-                    await message.edit(embed=embed)
+                    await progress.update(embed=embed)
                     await embed.add_guild_leaderboard(ctx.guild)
-                await message.edit(content=text, embed=embed)
+                await progress.finish(content=text, embed=embed)
             else:
-                await message.edit(
+                await progress.finish(
                     content=cf.error(_("I could not find Total XP in your image. "))
                     + "\n\n"
                     + cf.info(
@@ -328,3 +569,4 @@ class TrainerDex(
                 trainer: Trainer = await socialconnections[0].trainer()
             if trainer:
                 await trainer.edit(is_visible=False)
+                self.trainer_cache.invalidate(trainer)
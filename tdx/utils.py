@@ -1,5 +1,10 @@
+import asyncio
+import logging
+import time
 from discord.abc import User
+from discord.embeds import Embed
 from discord.emoji import Emoji
+from discord.errors import HTTPException
 from discord.ext.commands.context import Context
 from discord.message import Message
 from redbot.core import commands
@@ -7,8 +12,9 @@ from redbot.core.i18n import Translator
 from redbot.core.utils import chat_formatting as cf
 from redbot.core.utils import predicates
 from trainerdex.trainer import Trainer
-from typing import Callable, Optional, Union
+from typing import Any, Callable, Dict, Optional, Union
 
+logger: logging.Logger = logging.getLogger(__name__)
 _ = Translator("TrainerDex", __file__)
 
 
@@ -143,3 +149,88 @@ class Question:
         if self.response:
             return self.response.content
         return None
+
+
+MISSING: Any = object()
+
+
+class ProgressMessage:
+    """A message edited as a task progresses, without spending an API call on every step.
+
+    Updates made within ``delay`` seconds of the last edit are merged into one edit, and updates
+    that wouldn't change the message are dropped. :meth:`finish` always sends whatever is still
+    waiting, so the final state is never lost.
+
+    Embeds are compared by their contents when they're sent, so an embed can be changed in place
+    and passed again.
+    """
+
+    def __init__(self, message: Message, delay: float = 1.0) -> None:
+        self.message: Message = message
+        self.delay: float = delay
+        self._content: Optional[str] = message.content or None
+        self._embed: Optional[Dict[str, Any]] = (
+            message.embeds[0].to_dict() if message.embeds else None
+        )
+        self._pending: Dict[str, Any] = {}
+        self._last_edit: float = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+        self.edits: int = 0
+
+    def _merge(self, content: Optional[str], embed: Optional[Embed]) -> None:
+        if content is not MISSING:
+            self._pending["content"] = content
+        if embed is not MISSING:
+            self._pending["embed"] = embed
+        if self._pending.get("content", MISSING) == self._content:
+            del self._pending["content"]
+        if "embed" in self._pending:
+            pending_embed: Optional[Embed] = self._pending["embed"]
+            if (pending_embed.to_dict() if pending_embed else None) == self._embed:
+                del self._pending["embed"]
+
+    async def _flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            kwargs: Dict[str, Any] = self._pending
+            self._pending = {}
+            await self.message.edit(**kwargs)
+            self.edits += 1
+            self._last_edit = time.monotonic()
+            if "content" in kwargs:
+                self._content = kwargs["content"]
+            if "embed" in kwargs:
+                self._embed = kwargs["embed"].to_dict() if kwargs["embed"] else None
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._task = None
+        try:
+            await self._flush()
+        except HTTPException:
+            logger.warning("Couldn't update progress message %s", self.message.id, exc_info=True)
+
+    async def update(
+        self, content: Optional[str] = MISSING, embed: Optional[Embed] = MISSING
+    ) -> None:
+        """Show ``content`` and/or ``embed``, now or once ``delay`` has passed since the last edit"""
+        self._merge(content, embed)
+        if not self._pending or self._task is not None:
+            return
+        wait: float = self._last_edit + self.delay - time.monotonic()
+        if wait <= 0:
+            await self._flush()
+        else:
+            self._task = asyncio.create_task(self._flush_later(wait))
+
+    async def finish(
+        self, content: Optional[str] = MISSING, embed: Optional[Embed] = MISSING
+    ) -> None:
+        """Show the final state straight away"""
+        self._merge(content, embed)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._flush()